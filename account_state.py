@@ -0,0 +1,160 @@
+import time
+import logging
+import threading
+from collections import deque
+
+# Локальное состояние счёта: позиции, баланс USDT, ордера и исполнения.
+# Обновляется из приватного WebSocket Bybit (топики position, wallet, order,
+# execution) и сверяется с REST при старте и после переподключения, поэтому
+# чтение позиции или баланса не требует запроса к бирже.
+
+USDT_BALANCE_KEYS = ('availableBalance', 'availableToWithdraw', 'walletBalance', 'equity', 'free')
+FINAL_ORDER_STATUSES = ('Filled', 'Cancelled', 'Rejected', 'Deactivated', 'PartiallyFilledCanceled')
+
+def usdt_from_coins(coins):
+    """Баланс USDT из списка монет кошелька (те же ключи, что и в REST get_wallet_balance)."""
+    for coin in coins:
+        if coin.get('coin') == 'USDT':
+            for key in USDT_BALANCE_KEYS:
+                if key in coin and coin[key]:
+                    return float(coin[key])
+            return 0.0
+    return None
+
+class AccountState:
+    """Позиции, баланс и ордера счёта в памяти с метками времени обновления."""
+
+    def __init__(self, category="linear", account_type=None):
+        self.category = category
+        self.account_type = account_type  # Тип счёта для баланса из wallet (None — любой)
+        self._positions = {}  # symbol -> {"qty", "side", "entry_price", "updated_time"}
+        self.positions_updated = 0.0
+        self.balance = None
+        self.balance_updated = 0.0
+        self.orders = {}  # orderId -> последнее сообщение по активному ордеру
+        self.executions = deque(maxlen=500)
+        self.ready = False  # True после первой сверки с REST
+        self.reconciled_at = 0.0
+        self._listeners = {"order": [], "execution": []}
+        self._lock = threading.Lock()
+
+    def add_listener(self, topic, callback):
+        """Callback для каждого сообщения order или execution (вызывается в потоке WebSocket)."""
+        self._listeners[topic].append(callback)
+
+    def _notify(self, topic, item):
+        for callback in self._listeners[topic]:
+            try:
+                callback(item)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика {topic}: {e}")
+
+    def _apply_position(self, item):
+        if item.get('category', self.category) != self.category:
+            return
+        symbol = item['symbol']
+        updated_time = int(item.get('updatedTime') or 0)
+        current = self._positions.get(symbol)
+        # Сообщения могут приходить не по порядку (WebSocket и REST-сверка): старые игнорируем
+        if current is not None and updated_time and updated_time < current["updated_time"]:
+            return
+        qty = float(item.get('size') or 0)
+        if qty > 0 and item.get('side') in ("Buy", "Sell"):
+            self._positions[symbol] = {
+                "qty": qty,
+                "side": item['side'],
+                "entry_price": float(item.get('entryPrice') or item.get('avgPrice') or 0),
+                "updated_time": updated_time,
+            }
+        else:
+            self._positions[symbol] = {"qty": 0.0, "side": None, "entry_price": 0.0, "updated_time": updated_time}
+
+    def handle_position(self, message):
+        try:
+            with self._lock:
+                for item in message['data']:
+                    self._apply_position(item)
+                self.positions_updated = time.time()
+        except Exception as e:
+            logging.error(f"Ошибка обработки позиции из WebSocket: {e}")
+
+    def handle_wallet(self, message):
+        try:
+            for account in message['data']:
+                if self.account_type and account.get('accountType') != self.account_type:
+                    continue
+                balance = usdt_from_coins(account.get('coin', []))
+                if balance is not None:
+                    with self._lock:
+                        self.balance = balance
+                        self.balance_updated = time.time()
+        except Exception as e:
+            logging.error(f"Ошибка обработки баланса из WebSocket: {e}")
+
+    def handle_order(self, message):
+        try:
+            for order in message['data']:
+                with self._lock:
+                    if order.get('orderStatus') in FINAL_ORDER_STATUSES:
+                        self.orders.pop(order['orderId'], None)
+                    else:
+                        self.orders[order['orderId']] = order
+                self._notify("order", order)
+        except Exception as e:
+            logging.error(f"Ошибка обработки ордера из WebSocket: {e}")
+
+    def handle_execution(self, message):
+        try:
+            for execution in message['data']:
+                self.executions.append(execution)
+                self._notify("execution", execution)
+        except Exception as e:
+            logging.error(f"Ошибка обработки исполнения из WebSocket: {e}")
+
+    def subscribe(self, ws_private):
+        ws_private.position_stream(callback=self.handle_position)
+        ws_private.wallet_stream(callback=self.handle_wallet)
+        ws_private.order_stream(callback=self.handle_order)
+        ws_private.execution_stream(callback=self.handle_execution)
+
+    def reconcile(self, positions_response, balance=None):
+        """Сверка с REST: ответ get_positions (все открытые позиции) и баланс USDT."""
+        with self._lock:
+            seen = set()
+            for item in positions_response['result']['list']:
+                self._apply_position(item)
+                seen.add(item['symbol'])
+            # Позиции, закрытые пока WebSocket был отключён
+            for symbol, position in self._positions.items():
+                if symbol not in seen and position["qty"] > 0:
+                    self._positions[symbol] = {"qty": 0.0, "side": None, "entry_price": 0.0, "updated_time": position["updated_time"]}
+            now = time.time()
+            self.positions_updated = now
+            if balance is not None:
+                self.balance = balance
+                self.balance_updated = now
+            self.reconciled_at = now
+            self.ready = True
+        logging.info(f"Состояние счёта сверено с REST: позиций {len(self.open_positions())}, баланс {self.balance}")
+
+    def position(self, symbol):
+        """((qty, side, entry_price), возраст в секундах) — как check_position."""
+        with self._lock:
+            position = self._positions.get(symbol)
+            age = time.time() - self.positions_updated
+        if position is None or position["qty"] == 0:
+            return (0, None, 0), age
+        return (position["qty"], position["side"], position["entry_price"]), age
+
+    def open_positions(self):
+        """{symbol: (qty, side, entry_price)} для открытых позиций."""
+        with self._lock:
+            return {
+                symbol: (position["qty"], position["side"], position["entry_price"])
+                for symbol, position in self._positions.items() if position["qty"] > 0
+            }
+
+    def usdt_balance(self):
+        """(баланс USDT или None, возраст в секундах)."""
+        with self._lock:
+            return self.balance, time.time() - self.balance_updated
@@ -0,0 +1,69 @@
+import numpy as np
+
+# Индикаторы стратегии на массивах numpy без pandas и ta. Значения совпадают
+# с ta (RSIIndicator, EMAIndicator, AverageTrueRange, MACD) для всей истории:
+# рекурсии EMA/Уайлдера считаются одним проходом по списку float, остальное —
+# векторно. Используются в calculate_indicators и ai_assist вместо ta.
+# Совпадение с ta проверяет indicator_parity.py.
+
+def _ewm(values, alpha, min_periods):
+    """ewm(alpha, adjust=False, min_periods).mean() для массива; ведущие NaN пропускаются, как в pandas."""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if not len(valid):
+        return out
+    start = int(valid[0])
+    decay = 1.0 - alpha
+    ema = float(values[start])
+    result = [ema]
+    append = result.append
+    for value in values[start + 1:].tolist():
+        ema = decay * ema + alpha * value
+        append(ema)
+    out[start:] = result
+    out[start:start + min_periods - 1] = np.nan
+    return out
+
+def ema(close, window):
+    """EMA, совпадает с ta.trend.EMAIndicator."""
+    return _ewm(close, 2.0 / (window + 1), window)
+
+def rsi(close, window=14):
+    """RSI со сглаживанием Уайлдера, совпадает с ta.momentum.RSIIndicator."""
+    close = np.asarray(close, dtype=np.float64)
+    diff = np.empty_like(close)
+    if len(close):
+        diff[0] = 0.0  # ta заменяет первую (NaN) разницу на 0
+        np.subtract(close[1:], close[:-1], out=diff[1:])
+    ema_up = _ewm(np.where(diff > 0, diff, 0.0), 1.0 / window, window)
+    ema_down = _ewm(np.where(diff < 0, -diff, 0.0), 1.0 / window, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(ema_down == 0, 100.0, 100.0 - 100.0 / (1.0 + ema_up / ema_down))
+
+def average_true_range(high, low, close, window=14):
+    """ATR, совпадает с ta.volatility.AverageTrueRange (0 до заполнения окна)."""
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    atr = np.zeros(n)
+    if n < window:
+        return atr
+    true_range = high - low
+    if n > 1:
+        prev_close = close[:-1]
+        true_range[1:] = np.maximum(true_range[1:], np.maximum(np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)))
+    value = float(true_range[:window].mean())
+    result = [value]
+    append = result.append
+    for tr in true_range[window:].tolist():
+        value = (value * (window - 1) + tr) / float(window)
+        append(value)
+    atr[window - 1:] = result
+    return atr
+
+def macd(close, window_slow=26, window_fast=12, window_sign=9):
+    """(MACD, сигнальная линия), совпадает с ta.trend.MACD."""
+    line = ema(close, window_fast) - ema(close, window_slow)
+    return line, _ewm(line, 2.0 / (window_sign + 1), window_sign)
@@ -0,0 +1,221 @@
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from candle_store import CandleStore, CANDLE_STORE_DIR
+from strategy import (
+    POSITION_SIZE, STOP_LOSS_PCT, TAKE_PROFIT_PCT, MAX_LOSS_PCT,
+    calculate_indicator_series, generate_signal_series, ai_assist_series
+)
+
+# Бэктест стратегии trading_loop на исторических свечах.
+# Индикаторы, паттерны и сигналы считаются векторно по всей истории;
+# цикл на Python идёт только по сделкам, а выход ищется поиском по массивам.
+
+# Функция для загрузки свечей из CSV (timestamp в мс или дата, open, high, low, close, volume)
+def load_candles_csv(path):
+    df = pd.read_csv(path)
+    if np.issubdtype(df['timestamp'].dtype, np.number):
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    else:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df = df.dropna(subset=['open', 'high', 'low', 'close'])
+    return df.sort_values('timestamp').drop_duplicates(subset='timestamp', keep='last').reset_index(drop=True)
+
+# Функция для загрузки истории свечей с Bybit через локальное хранилище (повторно докачиваются только новые свечи)
+def fetch_history(symbol, interval=5, days=30, testnet=True):
+    from pybit.unified_trading import HTTP
+    store = CandleStore(HTTP(testnet=testnet), root=CANDLE_STORE_DIR if testnet else CANDLE_STORE_DIR + "_mainnet")
+    candles = days * 24 * 60 // int(interval)
+    store.sync(symbol, interval, min_candles=candles, include_current=False)
+    rows = store.tail(symbol, interval, candles)
+    df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    logging.info(f"Загружено {len(df)} свечей {symbol} из хранилища")
+    return df
+
+def _find_exit(open_, high, low, close, start, direction, entry_price, qty, stop_loss_pct,
+               take_profit_pct, realized_pnl, loss_limit):
+    """
+    Поиск первой свечи выхода после входа. Проверка идёт блоками растущего размера,
+    поэтому короткие сделки не сканируют всю оставшуюся историю.
+    Returns:
+        (индекс свечи, цена выхода, причина)
+    """
+    n = len(close)
+    if direction == 1:
+        stop_price = entry_price * (1 - stop_loss_pct)
+        take_price = entry_price * (1 + take_profit_pct)
+    else:
+        stop_price = entry_price * (1 + stop_loss_pct)
+        take_price = entry_price * (1 - take_profit_pct)
+    block = 64
+    j = start
+    while j < n:
+        end = min(n, j + block)
+        if direction == 1:
+            stop_hit = low[j:end] <= stop_price
+            take_hit = high[j:end] >= take_price
+        else:
+            stop_hit = high[j:end] >= stop_price
+            take_hit = low[j:end] <= take_price
+        # Максимальный убыток считается по закрытию свечи, как в trading_loop
+        unrealized = (close[j:end] - entry_price) * qty * direction
+        max_loss_hit = realized_pnl + unrealized < -loss_limit
+        hit = stop_hit | take_hit | max_loss_hit
+        if hit.any():
+            k = int(np.argmax(hit))
+            idx = j + k
+            # При одновременном касании уровней считаем, что первым сработал стоп
+            if stop_hit[k]:
+                # Гэп за стоп: исполнение по открытию свечи
+                price = min(stop_price, open_[idx]) if direction == 1 else max(stop_price, open_[idx])
+                return idx, price, "stop_loss"
+            if max_loss_hit[k]:
+                return idx, close[idx], "max_loss"
+            return idx, take_price, "take_profit"
+        j = end
+        block *= 2
+    return n - 1, close[n - 1], "end_of_data"
+
+def run_backtest(df, initial_balance=1000.0, qty=POSITION_SIZE, stop_loss_pct=STOP_LOSS_PCT,
+                 take_profit_pct=TAKE_PROFIT_PCT, max_loss_pct=MAX_LOSS_PCT, test_signals=False,
+                 use_ai_threshold=False, fee_rate=0.0):
+    """
+    Прогон стратегии по истории свечей.
+    Args:
+        df: DataFrame со свечами (timestamp, open, high, low, close) в хронологическом порядке
+        test_signals: использовать правила generate_signal_test вместо generate_signal
+        use_ai_threshold: подставлять порог RSI из ai_assist вместо фиксированного
+        fee_rate: комиссия за сторону сделки (доля от объёма)
+    Returns:
+        dict: equity (pd.Series), trades (pd.DataFrame), stats (dict)
+    """
+    df = df.reset_index(drop=True)
+    open_ = df['open'].to_numpy(dtype=np.float64)
+    high = df['high'].to_numpy(dtype=np.float64)
+    low = df['low'].to_numpy(dtype=np.float64)
+    close = df['close'].to_numpy(dtype=np.float64)
+    timestamps = df['timestamp']
+    n = len(df)
+
+    indicators = calculate_indicator_series(df)
+    rsi_threshold = None
+    if use_ai_threshold:
+        rsi_threshold = ai_assist_series(indicators['atr'], base_rsi_threshold=60 if test_signals else 55)
+    signals = generate_signal_series(indicators, test=test_signals, rsi_threshold=rsi_threshold)
+    signal_idx = np.flatnonzero(signals)
+
+    loss_limit = initial_balance * max_loss_pct
+    realized_pnl = 0.0
+    realized_steps = np.zeros(n)
+    unrealized = np.zeros(n)
+    trades = []
+    k = 0
+    while k < len(signal_idx):
+        entry_idx = int(signal_idx[k])
+        if entry_idx >= n - 1:
+            break
+        direction = int(signals[entry_idx])
+        entry_price = close[entry_idx]
+        exit_idx, exit_price, reason = _find_exit(
+            open_, high, low, close, entry_idx + 1, direction, entry_price, qty,
+            stop_loss_pct, take_profit_pct, realized_pnl, loss_limit
+        )
+        fees = fee_rate * (entry_price + exit_price) * qty
+        pnl = (exit_price - entry_price) * qty * direction - fees
+        realized_pnl += pnl
+        realized_steps[exit_idx] += pnl
+        unrealized[entry_idx:exit_idx] = (close[entry_idx:exit_idx] - entry_price) * qty * direction
+        trades.append({
+            "entry_time": timestamps.iloc[entry_idx],
+            "exit_time": timestamps.iloc[exit_idx],
+            "side": "Buy" if direction == 1 else "Sell",
+            "entry_price": entry_price,
+            "exit_price": exit_price,
+            "qty": qty,
+            "pnl": pnl,
+            "bars": exit_idx - entry_idx,
+            "reason": reason,
+        })
+        if reason == "max_loss":
+            logging.warning(f"Бэктест остановлен: достигнут максимальный убыток {max_loss_pct*100}%")
+            break
+        # Как и в trading_loop, новая позиция открывается не раньше следующей свечи после выхода
+        k = int(np.searchsorted(signal_idx, exit_idx, side='right'))
+
+    equity = pd.Series(initial_balance + np.cumsum(realized_steps) + unrealized, index=timestamps, name="equity")
+    trades_df = pd.DataFrame(trades, columns=["entry_time", "exit_time", "side", "entry_price", "exit_price",
+                                              "qty", "pnl", "bars", "reason"])
+    return {"equity": equity, "trades": trades_df, "stats": _summary_stats(equity, trades_df, initial_balance)}
+
+def _summary_stats(equity, trades, initial_balance):
+    pnl = trades['pnl'].to_numpy()
+    wins = pnl[pnl > 0]
+    losses = pnl[pnl <= 0]
+    running_max = np.maximum.accumulate(equity.to_numpy()) if len(equity) else np.array([initial_balance])
+    drawdown = running_max - equity.to_numpy() if len(equity) else np.array([0.0])
+    final_equity = float(equity.iloc[-1]) if len(equity) else initial_balance
+    return {
+        "trades": int(len(trades)),
+        "win_rate": float(len(wins) / len(pnl)) if len(pnl) else 0.0,
+        "total_pnl": float(pnl.sum()),
+        "avg_pnl": float(pnl.mean()) if len(pnl) else 0.0,
+        "profit_factor": float(wins.sum() / -losses.sum()) if losses.sum() < 0 else float('inf') if len(wins) else 0.0,
+        "max_drawdown": float(drawdown.max()),
+        "max_drawdown_pct": float((drawdown / running_max).max() * 100),
+        "final_equity": final_equity,
+        "return_pct": (final_equity / initial_balance - 1) * 100,
+        "avg_bars_held": float(trades['bars'].mean()) if len(trades) else 0.0,
+        "exit_reasons": trades['reason'].value_counts().to_dict(),
+    }
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Бэктест стратегии на исторических свечах")
+    parser.add_argument("--csv", help="CSV со свечами (timestamp, open, high, low, close, volume)")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", type=int, default=5)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--mainnet", action="store_true", help="Загружать историю с mainnet вместо testnet")
+    parser.add_argument("--balance", type=float, default=1000.0)
+    parser.add_argument("--qty", type=float, default=POSITION_SIZE)
+    parser.add_argument("--fee", type=float, default=0.0)
+    parser.add_argument("--test-signals", action="store_true", help="Использовать generate_signal_test")
+    parser.add_argument("--ai-threshold", action="store_true", help="Порог RSI из ai_assist")
+    parser.add_argument("--trades-out", help="Сохранить список сделок в CSV")
+    args = parser.parse_args(argv)
+
+    if args.csv:
+        df = load_candles_csv(args.csv)
+    else:
+        df = fetch_history(args.symbol, interval=args.interval, days=args.days, testnet=not args.mainnet)
+    if len(df) < 34:
+        print(f"Недостаточно свечей для бэктеста: {len(df)}")
+        return 1
+
+    start_time = time.time()
+    result = run_backtest(df, initial_balance=args.balance, qty=args.qty, fee_rate=args.fee,
+                          test_signals=args.test_signals, use_ai_threshold=args.ai_threshold)
+    elapsed = time.time() - start_time
+    stats = result["stats"]
+    print(
+        f"📊 Бэктест {args.symbol}: {len(df)} свечей за {elapsed:.2f} с\n"
+        f"  Сделок: {stats['trades']} (прибыльных {stats['win_rate']*100:.1f}%)\n"
+        f"  Общий PnL: {stats['total_pnl']:.2f} USDT, средний: {stats['avg_pnl']:.4f} USDT\n"
+        f"  Profit factor: {stats['profit_factor']:.2f}\n"
+        f"  Макс. просадка: {stats['max_drawdown']:.2f} USDT ({stats['max_drawdown_pct']:.2f}%)\n"
+        f"  Итоговый капитал: {stats['final_equity']:.2f} USDT ({stats['return_pct']:+.2f}%)\n"
+        f"  Причины выхода: {stats['exit_reasons']}"
+    )
+    if args.trades_out:
+        result["trades"].to_csv(args.trades_out, index=False)
+        print(f"Сделки сохранены в {args.trades_out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import tracemalloc
+import numpy as np
+import pandas as pd
+from kline_buffer import parse_klines, Candles
+from candle_patterns import detect_candle_patterns
+from streaming_indicators import IndicatorEngine
+from volatility_ranker import VolatilityRanker, ticker_volatility
+from strategy import calculate_indicators, generate_signal, ai_assist
+import indicator_parity
+
+# Микробенчмарки аналитики торгового цикла на синтетических свечах.
+# Биржа не нужна: session заменяется заглушкой, которая отдаёт свечи и тикеры
+# в формате ответов Bybit. Для каждого этапа считаются операции в секунду
+# (медиана по раундам) и выделения памяти за один вызов (tracemalloc, отдельным
+# прогоном, чтобы не искажать время). Результаты сохраняются в JSON и
+# сравниваются с сохранённым базовым прогоном. Перед замерами индикаторы
+# сверяются с ta (indicator_parity): быстрый, но неверный код — не результат.
+#
+# python benchmark.py --candles 500 --symbols 50 --save benchmark_baseline.json
+# python benchmark.py --compare benchmark_baseline.json
+
+DEFAULT_CANDLES = 500
+DEFAULT_SYMBOLS = 20
+DEFAULT_ROUNDS = 7
+MIN_ROUND_TIME = 0.2  # Секунд на раунд (число итераций подбирается под это время)
+REGRESSION_THRESHOLD = 10.0  # Процент замедления, после которого сравнение считается регрессией
+
+def synthetic_klines(n, seed=0, interval=5, start_price=100.0, end_time=None):
+    """
+    Свечи в формате ответа get_kline: список строк [start, open, high, low, close, volume, turnover],
+    новые первыми. Цена — геометрическое случайное блуждание.
+    """
+    rng = np.random.default_rng(seed)
+    interval_ms = int(interval) * 60 * 1000
+    if end_time is None:
+        end_time = int(time.time() * 1000)
+    end_time -= end_time % interval_ms
+    returns = rng.normal(0, 0.002, n)
+    close = start_price * np.exp(np.cumsum(returns))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.uniform(10, 1000, n)
+    timestamps = end_time - interval_ms * np.arange(n - 1, -1, -1)
+    rows = [
+        [str(int(timestamps[i])), f"{open_[i]:.4f}", f"{high[i]:.4f}", f"{low[i]:.4f}",
+         f"{close[i]:.4f}", f"{volume[i]:.3f}", f"{volume[i] * close[i]:.2f}"]
+        for i in range(n)
+    ]
+    return rows[::-1]
+
+def synthetic_ticker(symbol, klines):
+    """Тикер get_tickers по последним 288 пятиминутным свечам (24 часа)."""
+    day = klines[:288]
+    return {
+        "symbol": symbol,
+        "lastPrice": day[0][4],
+        "highPrice24h": str(max(float(row[2]) for row in day)),
+        "lowPrice24h": str(min(float(row[3]) for row in day)),
+        "turnover24h": str(sum(float(row[6]) for row in day)),
+    }
+
+class StubSession:
+    """Заглушка pybit HTTP: get_kline и get_tickers по синтетическим данным, без сети."""
+
+    def __init__(self, candles=DEFAULT_CANDLES, symbols=DEFAULT_SYMBOLS, seed=0):
+        self.symbols = [f"SYN{i:03d}USDT" for i in range(symbols)]
+        self.klines = {
+            symbol: synthetic_klines(candles, seed=seed + i, start_price=10.0 * (i + 1))
+            for i, symbol in enumerate(self.symbols)
+        }
+
+    def get_kline(self, category="linear", symbol=None, interval=5, limit=200, **kwargs):
+        return {"retCode": 0, "result": {"symbol": symbol, "list": self.klines[symbol][:limit]}}
+
+    def get_tickers(self, category="linear", symbol=None, **kwargs):
+        symbols = [symbol] if symbol else self.symbols
+        return {"retCode": 0, "result": {"list": [synthetic_ticker(s, self.klines[s]) for s in symbols]}}
+
+def klines_to_dataframe(klines):
+    """Преобразование ответа get_kline в DataFrame, как в get_klines."""
+    df = pd.DataFrame(parse_klines(klines), columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    return df
+
+def build_cases(session, candles):
+    """{имя: функция без аргументов}; каждый вызов обрабатывает следующий символ по кругу."""
+    symbols = session.symbols
+    frames = {symbol: klines_to_dataframe(session.get_kline(symbol=symbol, limit=candles)['result']['list'])
+              for symbol in symbols}
+    columns = {symbol: Candles.from_klines(session.get_kline(symbol=symbol, limit=candles)['result']['list'])
+               for symbol in symbols}
+    # Без паттерна generate_signal выходит сразу; для замера полного пути паттерн подставляется
+    indicators = {symbol: calculate_indicators(frames[symbol])[:6] + ("Hammer",) for symbol in symbols}
+    engines = {}
+    for symbol, df in frames.items():
+        engine = IndicatorEngine()
+        engine.seed(df['timestamp'].astype('int64').to_numpy() // 10**6, df['high'].to_numpy(),
+                    df['low'].to_numpy(), df['close'].to_numpy())
+        engines[symbol] = engine
+    atr_windows = {symbol: engine.atr_window() for symbol, engine in engines.items()}
+    tickers = session.get_tickers()['result']['list']
+    counter = iter(range(sys.maxsize))
+
+    def next_symbol():
+        return symbols[next(counter) % len(symbols)]
+
+    def get_klines_case():
+        klines_to_dataframe(session.get_kline(symbol=next_symbol(), limit=candles)['result']['list'])
+
+    def get_candles_case():
+        Candles.from_klines(session.get_kline(symbol=next_symbol(), limit=candles)['result']['list'])
+
+    def indicators_case():
+        calculate_indicators(frames[next_symbol()])
+
+    def indicators_candles_case():
+        calculate_indicators(columns[next_symbol()])
+
+    def patterns_case():
+        detect_candle_patterns(frames[next_symbol()])
+
+    def patterns_candles_case():
+        detect_candle_patterns(columns[next_symbol()])
+
+    def ai_assist_case():
+        ai_assist(frames[next_symbol()], base_rsi_threshold=55)
+
+    def ai_assist_window_case():
+        symbol = next_symbol()
+        ai_assist(frames[symbol], base_rsi_threshold=55, atr_window=atr_windows[symbol])
+
+    def generate_signal_case():
+        generate_signal(*indicators[next_symbol()])
+
+    def streaming_update_case():
+        symbol = next_symbol()
+        engine = engines[symbol]
+        last = frames[symbol].iloc[-1]
+        engine.update(engine.last_timestamp, float(last['high']), float(last['low']), float(last['close']))
+
+    def volatility_case():
+        # Весь универсум: волатильность по тикерам и пересборка рейтинга
+        [ticker_volatility(ticker) for ticker in tickers]
+        VolatilityRanker().load_tickers(tickers)
+
+    return {
+        "get_klines_dataframe": get_klines_case,
+        "get_klines_candles": get_candles_case,
+        "calculate_indicators": indicators_case,
+        "calculate_indicators_candles": indicators_candles_case,
+        "detect_candle_patterns": patterns_case,
+        "detect_candle_patterns_candles": patterns_candles_case,
+        "ai_assist": ai_assist_case,
+        "ai_assist_atr_window": ai_assist_window_case,
+        "generate_signal": generate_signal_case,
+        "streaming_indicators_update": streaming_update_case,
+        "volatility_ranking": volatility_case,
+    }
+
+def measure(func, rounds=DEFAULT_ROUNDS, min_round_time=MIN_ROUND_TIME):
+    """Время (медиана по раундам) и выделения памяти одного вызова."""
+    func()  # Прогрев
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_round_time / 4:
+            break
+        iterations *= 4
+    iterations = max(1, int(iterations * min_round_time / max(elapsed, 1e-9)))
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        per_call.append((time.perf_counter() - start) / iterations)
+    median = statistics.median(per_call)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ops_per_sec": 1.0 / median,
+        "median_us": median * 1e6,
+        "min_us": min(per_call) * 1e6,
+        "stdev_us": statistics.pstdev(per_call) * 1e6,
+        "iterations": iterations,
+        "peak_kb": (peak - before) / 1024,
+        "retained_kb": (current - before) / 1024,
+    }
+
+def run(candles=DEFAULT_CANDLES, symbols=DEFAULT_SYMBOLS, rounds=DEFAULT_ROUNDS, only=None, seed=0):
+    session = StubSession(candles=candles, symbols=symbols, seed=seed)
+    cases = build_cases(session, candles)
+    klines = session.get_kline(symbol=session.symbols[0], limit=candles)['result']['list']
+    memory = {
+        "dataframe_kb": klines_to_dataframe(klines).memory_usage(deep=True).sum() / 1024,
+        "candles_kb": Candles.from_klines(klines).nbytes / 1024,
+        "candles_float32_kb": Candles.from_klines(klines, dtype=np.float32).nbytes / 1024,
+    }
+    print(f"Память на символ ({candles} свечей): DataFrame {memory['dataframe_kb']:.1f} КБ, "
+          f"Candles {memory['candles_kb']:.1f} КБ, float32 {memory['candles_float32_kb']:.1f} КБ\n")
+    results = {}
+    for name, func in cases.items():
+        if only and name not in only:
+            continue
+        results[name] = measure(func, rounds=rounds)
+        r = results[name]
+        print(f"{name:30s} {r['ops_per_sec']:12.1f} оп/с  {r['median_us']:10.1f} мкс  "
+              f"пик {r['peak_kb']:9.1f} КБ  удержано {r['retained_kb']:8.1f} КБ")
+    return {
+        "meta": {
+            "candles": candles, "symbols": symbols, "rounds": rounds, "seed": seed,
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(), "timestamp": int(time.time()),
+            "memory_per_symbol": memory,
+        },
+        "results": results,
+    }
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """Сравнение с базовым прогоном; возвращает список регрессий (имя, изменение в %)."""
+    if (baseline["meta"]["candles"], baseline["meta"]["symbols"]) != (current["meta"]["candles"], current["meta"]["symbols"]):
+        logging.warning("Базовый прогон снят с другим числом свечей или символов — сравнение приблизительное")
+    regressions = []
+    print(f"\n{'этап':30s} {'база, мкс':>12s} {'сейчас, мкс':>12s} {'изменение':>10s}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:30s} {'-':>12s} {result['median_us']:12.1f} {'новый':>10s}")
+            continue
+        change = (result["median_us"] - base["median_us"]) / base["median_us"] * 100
+        mark = ""
+        if change > threshold:
+            regressions.append((name, change))
+            mark = "  РЕГРЕССИЯ"
+        print(f"{name:30s} {base['median_us']:12.1f} {result['median_us']:12.1f} {change:+9.1f}%{mark}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки аналитики торгового цикла")
+    parser.add_argument("--candles", type=int, default=DEFAULT_CANDLES, help="Свечей на символ")
+    parser.add_argument("--symbols", type=int, default=DEFAULT_SYMBOLS, help="Число синтетических символов")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="Запустить только указанные этапы")
+    parser.add_argument("--save", help="Сохранить результаты в JSON (базовый прогон)")
+    parser.add_argument("--compare", help="Сравнить с сохранённым JSON")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Замедление в процентах, считающееся регрессией")
+    parser.add_argument("--with-logging", action="store_true",
+                        help="Не отключать логи стратегии (как в работающем боте)")
+    args = parser.parse_args()
+
+    try:
+        indicator_parity.check()
+    except AssertionError as e:
+        print(f"Индикаторы не совпадают с ta: {e}")
+        return 1
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not args.with_logging:
+        logging.disable(logging.WARNING)
+    result = run(candles=args.candles, symbols=args.symbols, rounds=args.rounds, only=args.only, seed=args.seed)
+    logging.disable(logging.NOTSET)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nРезультаты сохранены в {args.save}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, threshold=args.threshold)
+        if regressions:
+            print(f"\nРегрессий: {len(regressions)} (порог {args.threshold:.0f}%)")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,36 +2,38 @@ import os
 import sys
 import time
 import logging
-import pandas as pd
-from pybit.unified_trading import HTTP, WebSocket
-from ta.momentum import RSIIndicator
-from ta.trend import EMAIndicator, MACD
-from ta.volatility import AverageTrueRange
 from dotenv import load_dotenv
 import json
 import requests
 import threading
-import importlib.util
-import numpy as np
-from datetime import datetime
-import webbrowser
-from pathlib import Path
-import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from market_data_cache import MarketDataCache
+from order_book import OrderBook, ORDERBOOK_DEPTH
+from candle_store import CandleStore
+from telegram_outbox import TelegramOutbox, PRIORITY_CRITICAL, PRIORITY_NORMAL, PRIORITY_STATUS
+from volatility_ranker import VolatilityRanker
+from swr_cache import StaleWhileRevalidateCache
+from instruments import InstrumentsCache, format_decimal
+from account_state import AccountState
+from order_gateway import OrderGateway
+from trade_journal import TradeJournal
+from metrics import metrics, start_metrics_server
+from rest_fanout import configure_session_pool, run_blocking, gather_dict, run_sync
+from rate_limiter import RateLimitScheduler, request_class
+from streaming_indicators import IndicatorEngine
+from candle_patterns import detect_candle_patterns
+from candle_scheduler import ServerClock, CandleCloseScheduler, CandleMemo
+from strategy import (
+    LEVERAGE, POSITION_SIZE, STOP_LOSS_PCT, TAKE_PROFIT_PCT, MAX_LOSS_PCT,
+    calculate_indicators, generate_signal, generate_signal_test, ai_assist
+)
 
 # Установка зависимостей: pip install pybit ta pandas requests python-dotenv
+# Импорт модуля не обращается к сети и не создаёт файлов: клиенты создаются в init_clients(),
+# подготовка к торговле выполняется параллельно в bootstrap(), точка входа — main()
 
-# Проверка версии Python
-if sys.version_info.major == 3 and sys.version_info.minor >= 13:
-    logging.warning("Python 3.13 не поддерживается. Используйте Python 3.12 или ниже и создайте новое виртуальное окружение: /opt/homebrew/bin/python3.12 -m venv venv")
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-# Файл для логирования сделок
+# Старый файл сделок (JSON на строку) — переносится в журнал при первом запуске
 TRADES_LOG_FILE = "trades_log.json"
 
 # Telegram настройки (для уведомлений)
@@ -43,31 +45,91 @@ load_dotenv()
 api_key = os.getenv('BYBIT_API_KEY')
 api_secret = os.getenv('BYBIT_API_SECRET')
 
-# Проверка наличия API-ключей
-if not api_key or not api_secret:
-    logging.error("API-ключи не найдены в файле .env")
-    exit(1)
-
-# Подключение к Bybit testnet (REST API)
-try:
-    session = HTTP(
-        testnet=True,
-        api_key=api_key,
-        api_secret=api_secret
-    )
-    logging.info("Успешное подключение к Bybit testnet (REST API)")
-except Exception as e:
-    logging.error(f"Ошибка подключения к Bybit REST API: {e}")
-    exit(1)
+# Локальная тестовая биржа вместо testnet (python mock_exchange.py), например http://127.0.0.1:8765
+BYBIT_BASE_URL = os.getenv('BYBIT_BASE_URL')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # Локальный эндпоинт /metrics (0 — отключить)
+
+# Клиенты и хранилища создаются в init_clients()
+session = None  # REST API Bybit (pybit HTTP)
+candle_store = None  # Локальное хранилище истории свечей (синхронизируется только недостающим диапазоном)
+instruments = None  # Параметры инструментов (шаг цены и объёма, минимальный объём, максимальное плечо)
+trade_journal = None  # Журнал сделок (буферизованная запись, сегменты по суткам, статистика по символам)
+order_gateway = None  # Шлюз ордеров (создаётся вместе с session)
+volatile_coins_cache = None  # Кэш топа волатильных монет
+
+def init_clients():
+    """Создание REST-сессии, хранилищ и шлюза ордеров. Returns: False, если подключение невозможно."""
+    global session, candle_store, instruments, trade_journal, order_gateway, volatile_coins_cache
+    # Проверка наличия API-ключей
+    if not api_key or not api_secret:
+        logging.error("API-ключи не найдены в файле .env")
+        return False
+    if BYBIT_BASE_URL:
+        from mock_exchange import use_local_exchange
+        use_local_exchange(BYBIT_BASE_URL)
+    # Подключение к Bybit testnet (REST API); pybit импортируется только здесь
+    try:
+        from pybit.unified_trading import HTTP
+        session = HTTP(
+            testnet=True,
+            api_key=api_key,
+            api_secret=api_secret
+        )
+        logging.info("Успешное подключение к Bybit testnet (REST API)")
+    except Exception as e:
+        logging.error(f"Ошибка подключения к Bybit REST API: {e}")
+        return False
+    # Общий пул keep-alive соединений для параллельных REST-запросов
+    configure_session_pool(session, scheduler=rest_scheduler)
+    # Учёт REST-запросов к Bybit по эндпоинтам (число, длительность, HTTP-ошибки)
+    metrics.instrument_session(session.client, "bybit")
+    # В пути запроса Telegram есть токен — в метриках только имя метода
+    metrics.instrument_session(telegram_outbox.session, "telegram", endpoint_name=lambda path: path.rsplit("/", 1)[-1])
+    server_clock.session = session
+    candle_store = CandleStore(session)
+    instruments = InstrumentsCache(session)
+    trade_journal = TradeJournal()
+    # Шлюз ордеров: отправка в отдельном пуле, исполнения — из топиков order/execution приватного WebSocket
+    order_gateway = OrderGateway(session, order_executor, stream_ready=account_state_ready, reconcile=reconcile_position)
+    account_state.add_listener("order", order_gateway.handle_order_update)
+    account_state.add_listener("execution", order_gateway.handle_execution)
+    # Кэш топа волатильных монет: мгновенный ответ последним удачным рейтингом, обновление в фоне
+    volatile_coins_cache = StaleWhileRevalidateCache("volatile_coins_cache.json", rank_volatile_coins,
+                                                     ttl=VOLATILE_COINS_CACHE_TTL)
+    return True
+
+def create_websocket(channel_type, **kwargs):
+    """WebSocket pybit (testnet); модуль pybit импортируется при первом подключении."""
+    from pybit.unified_trading import WebSocket
+    return raw_orderbook_messages(WebSocket(testnet=True, channel_type=channel_type, **kwargs))
+
+def raw_orderbook_messages(ws_instance):
+    """
+    Сообщения orderbook.* передаются в callback без обработки pybit. pybit 5.6.0 сам сливает дельты
+    в свою копию стакана и отдаёт её deepcopy с type="snapshot" и u исходного снимка — номер
+    обновления и дельты теряются. Стакан ведёт order_book.OrderBook по сырым snapshot/delta.
+    """
+    process_normal_message = ws_instance._process_normal_message
+
+    def process(message):
+        topic = message["topic"]
+        if topic.startswith("orderbook."):
+            ws_instance._get_callback(topic)(message)
+        else:
+            process_normal_message(message)
+
+    ws_instance._process_normal_message = process
+    return ws_instance
 
 # Параметры торговли
+# (LEVERAGE, POSITION_SIZE, STOP_LOSS_PCT, TAKE_PROFIT_PCT, MAX_LOSS_PCT задаются в strategy.py)
 SYMBOL = "BTCUSDT"
-LEVERAGE = 5
-POSITION_SIZE = 0.001  # Размер позиции в BTC
-STOP_LOSS_PCT = 0.005  # 0.5%
-TAKE_PROFIT_PCT = 0.01  # 1%
-MAX_LOSS_PCT = 0.05  # Максимальный убыток 5%
-UPDATE_INTERVAL = 60  # Обновление каждые 60 секунд
+UPDATE_INTERVAL = 60  # Запасная проверка открытой позиции раз в 60 секунд, если тики из WebSocket не приходят
+CANDLE_CLOSE_OFFSET = float(os.getenv('CANDLE_CLOSE_OFFSET', '2'))  # Секунд после закрытия свечи до оценки сигнала
+KLINE_INTERVAL = 5  # Таймфрейм свечей в минутах
+KLINE_BUFFER_SIZE = 500  # Ёмкость буфера свечей на символ
+MARKET_DATA_BUDGET_MB = float(os.getenv('MARKET_DATA_BUDGET_MB', '32'))  # Бюджет памяти буферов свечей всех символов
+MARKET_DATA_DTYPE = os.getenv('MARKET_DATA_DTYPE', 'float32')  # Точность цен в буферах: float32 или float64
 
 # Глобальные переменные для управления рисками и позициями
 initial_balance = 0
@@ -88,6 +150,17 @@ latest_indicators = {
 
 # Глобальные переменные для Telegram
 TELEGRAM_OFFSET = None
+telegram_thread = None
+
+# Очередь событий торгового цикла: команды из Telegram, тики и закрытия свечей из WebSocket.
+# Торговое состояние меняет только торговый цикл
+engine_events = queue.Queue()
+
+# Последние цены из ticker WebSocket; тик символа ставится в очередь, только если прошлый уже обработан
+latest_prices = {}
+pending_ticks = set()
+ticker_subscriptions = set()
+last_tick_time = 0.0
 
 # Глобальная переменная для хранения выбранной монеты
 SELECTED_SYMBOL = None
@@ -98,55 +171,133 @@ ws = None
 # Глобальная переменная для хранения топ-5 волатильных монет
 TOP_VOLATILE_COINS = []
 
+# Рейтинг волатильности по всем USDT-контрактам (отдельное WebSocket-соединение для тикеров)
+VOLATILITY_MIN_TURNOVER = 0  # Минимальный оборот за 24 часа (USDT); 0 — без фильтра
+volatility_ranker = VolatilityRanker(min_turnover=VOLATILITY_MIN_TURNOVER)
+volatility_ranker_lock = threading.Lock()
+
+# Потоковые индикаторы по символам, обновляются вместе с буферами свечей
+indicator_engines = {}
+
+# Символы, буферы которых не вытесняются: выбранный, торгуемые и с открытой позицией
+def is_active_symbol(symbol):
+    return symbol == SELECTED_SYMBOL or symbol in MULTI_SYMBOLS or symbol in positions
+
+def drop_symbol_state(symbol, interval):
+    """После вытеснения буфера свечей: потоковые индикаторы без буфера не нужны."""
+    indicator_engines.pop(symbol, None)
+    metrics.inc("market_data_cache", "evict")
+
+# Буферы свечей по символам, обновляемые из kline WebSocket (кэш с бюджетом памяти, см. market_data_cache.py)
+# Локальные стаканы по символам из WebSocket orderbook (проверка ликвидности без REST)
+order_books = {}
+order_book_subscriptions = set()
+ORDERBOOK_MAX_AGE = 60  # Секунд без обновлений, после которых стакан перезагружается через REST
+LIQUIDITY_MAX_SLIPPAGE_BPS = float(os.getenv('LIQUIDITY_MAX_SLIPPAGE_BPS', '10'))  # Допустимое проскальзывание рыночного ордера
+
+market_data = MarketDataCache(capacity=KLINE_BUFFER_SIZE, budget_bytes=int(MARKET_DATA_BUDGET_MB * 1024 * 1024),
+                              dtype=MARKET_DATA_DTYPE, keep=is_active_symbol, on_evict=drop_symbol_state)
+kline_subscriptions = set()
+
+# Общие лимиты REST-запросов к Bybit: ордера в приоритете, ожидание в очереди — по классам запросов
+rest_scheduler = RateLimitScheduler(
+    on_queued=lambda name, seconds: metrics.observe(f"rest_queue_{name}", seconds),
+    on_throttled=lambda path: metrics.inc("rest_throttled", path),
+)
+
+# Время биржи (смещение локальных часов) и результаты оценки по (символ, последняя закрытая свеча)
+server_clock = ServerClock()
+evaluation_memo = CandleMemo()
+
+# Мультисимвольный режим: TRADING_SYMBOLS=BTCUSDT,ETHUSDT или TRADING_SYMBOLS=TOP (топ волатильных монет)
+TRADING_SYMBOLS = [s.strip().upper() for s in os.getenv('TRADING_SYMBOLS', '').split(',') if s.strip()]
+SYMBOL_WORKERS = 16  # Потоков для параллельной обработки символов
+MULTI_SYMBOLS = []  # Символы, торгуемые сейчас независимыми стратегиями (пусто — только SELECTED_SYMBOL)
+symbol_workers = {}
+symbol_executor = ThreadPoolExecutor(max_workers=SYMBOL_WORKERS, thread_name_prefix="symbol")
+# positions и total_pnl меняются обработчиками ордеров в потоках order_executor и читаются торговым циклом
+positions_lock = threading.RLock()
+
 # Установка кредитного плеча
-try:
-    session.set_leverage(
-        category="linear",
-        symbol=SYMBOL,
-        buyLeverage=str(LEVERAGE),
-        sellLeverage=str(LEVERAGE)
-    )
-    logging.info(f"Установлено кредитное плечо {LEVERAGE}x для {SYMBOL}")
-except Exception as e:
-    if "110043" in str(e):
-        logging.info(f"Плечо уже установлено или не требует изменений: {e}")
-    else:
-        logging.error(f"Ошибка при настройке плеча: {e}")
-        exit(1)
+def set_symbol_leverage(symbol):
+    # Плечо не выше максимального для инструмента
+    leverage = min(LEVERAGE, instruments.max_leverage(symbol, LEVERAGE))
+    try:
+        session.set_leverage(
+            category="linear",
+            symbol=symbol,
+            buyLeverage=f"{leverage:g}",
+            sellLeverage=f"{leverage:g}"
+        )
+        logging.info(f"Установлено кредитное плечо {leverage:g}x для {symbol}")
+        return True
+    except Exception as e:
+        if "110043" in str(e):
+            logging.info(f"Плечо уже установлено или не требует изменений: {e}")
+            return True
+        logging.error(f"Ошибка при настройке плеча для {symbol}: {e}")
+        return False
 
-# Обновлённая функция для отправки сообщений в Telegram
-def send_telegram_message(message, reply_markup=None):
+# Очередь исходящих сообщений Telegram (отправка в фоновом потоке через keep-alive сессию)
+telegram_outbox = TelegramOutbox(
+    TELEGRAM_TOKEN, TELEGRAM_CHAT_ID,
+    on_delivered=lambda seconds: metrics.observe("telegram_delivery", seconds)
+)
+
+# Обновлённая функция для отправки сообщений в Telegram (не блокирует вызывающий код)
+def send_telegram_message(message, reply_markup=None, priority=PRIORITY_NORMAL, coalesce_key=None):
     try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        payload = {
-            "chat_id": TELEGRAM_CHAT_ID,
-            "text": message,
-            "parse_mode": "Markdown"
-        }
-        if reply_markup:
-            logging.info(f"Отправка сообщения с reply_markup: {reply_markup}")
-            payload["reply_markup"] = reply_markup
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            logging.info(f"Уведомление успешно отправлено в Telegram: {message}")
-        else:
-            logging.error(f"Ошибка отправки уведомления в Telegram: {response.text}")
+        telegram_outbox.send(message, reply_markup=reply_markup, priority=priority, coalesce_key=coalesce_key)
     except Exception as e:
         logging.error(f"Ошибка при отправке уведомления в Telegram: {e}")
 
-# Функция для проверки баланса
-def check_balance():
+# Тип счёта, на котором в последний раз найден USDT (UNIFIED или CONTRACT)
+balance_account_type = None
+
+# Состояние счёта из приватного WebSocket (позиции, баланс, ордера, исполнения)
+account_state = AccountState()
+account_ws = None
+
+def account_state_ready():
+    """Локальное состояние счёта актуально: приватный WebSocket подключён и сверен с REST."""
+    return account_ws is not None and account_ws.is_connected() and account_state.ready
+
+# Пул отправки ордеров (потоки создаются при первом ордере)
+order_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="order")
+ORDER_CLOSE_WAIT = 10  # Секунд ожидания исполнения закрывающих ордеров перед остановкой торговли
+
+# Функция для проверки баланса (асинхронная версия): из состояния счёта, без него — через REST
+async def check_balance_async():
+    if account_state_ready():
+        balance, age = account_state.usdt_balance()
+        if balance is not None:
+            return balance
+    with metrics.timer("balance_rest"):
+        return await fetch_balance_async()
+
+# Запрос баланса через REST
+async def fetch_balance_async():
+    """Пока счёт с USDT неизвестен, UNIFIED и CONTRACT запрашиваются параллельно; затем — только он."""
+    global balance_account_type
     try:
-        balance_unified = session.get_wallet_balance(accountType="UNIFIED")
-        logging.info(f"Ответ API для UNIFIED: {balance_unified}")
-        usdt_balance = _extract_usdt_balance(balance_unified)
+        account_types = [balance_account_type] if balance_account_type else ["UNIFIED", "CONTRACT"]
+        responses = await gather_dict({
+            account_type: run_blocking(session.get_wallet_balance, accountType=account_type)
+            for account_type in account_types
+        })
+        usdt_balance = 0
+        for account_type in account_types:
+            response = responses[account_type]
+            if isinstance(response, Exception):
+                continue
+            logging.info(f"Ответ API для {account_type}: {response}")
+            usdt_balance = _extract_usdt_balance(response)
+            if usdt_balance != 0:
+                balance_account_type = account_type
+                break
         print(f"Баланс USDT: {usdt_balance}")  # Отладочный вывод
         if usdt_balance == 0:
-            balance_contract = session.get_wallet_balance(accountType="CONTRACT")
-            logging.info(f"Ответ API для CONTRACT: {balance_contract}")
-            usdt_balance = _extract_usdt_balance(balance_contract)
-            print(f"Баланс USDT (Contract): {usdt_balance}")  # Отладочный вывод
-        if usdt_balance == 0:
+            balance_account_type = None
             logging.warning("USDT не найден на балансе. Проверьте перевод средств в Derivatives.")
         else:
             logging.info(f"Итоговый баланс USDT: {usdt_balance}")
@@ -155,6 +306,10 @@ def check_balance():
         logging.error(f"Ошибка при проверке баланса: {e}")
         return 0
 
+# Функция для проверки баланса
+def check_balance():
+    return run_sync(check_balance_async())
+
 def _extract_usdt_balance(balance_data):
     try:
         coins = balance_data.get('result', {}).get('list', [{}])[0].get('coin', [])
@@ -172,428 +327,287 @@ def _extract_usdt_balance(balance_data):
         return 0
 
 # Функция для проверки ликвидности
-def check_liquidity(price, qty, symbol=None):
+def check_liquidity(price, qty, symbol=None, side=None):
+    """
+    Рыночный ордер объёмом qty исполняется по локальному стакану с проскальзыванием VWAP не больше
+    LIQUIDITY_MAX_SLIPPAGE_BPS (side=None — проверяются обе стороны).
+    """
     if symbol is None:
         symbol = SELECTED_SYMBOL
     try:
-        orderbook = session.get_orderbook(category="linear", symbol=symbol, limit=5)
-        bids = orderbook['result']['b']
-        asks = orderbook['result']['a']
-        if not bids or not asks:
-            return False
-        total_bid_qty = sum(float(bid[1]) for bid in bids)
-        total_ask_qty = sum(float(ask[1]) for ask in asks)
-        required_qty = qty * price
-        return total_bid_qty >= required_qty and total_ask_qty >= required_qty
+        book = get_order_book(symbol)
+        with metrics.timer("check_liquidity"):
+            for order_side in ([side] if side else ["Buy", "Sell"]):
+                slippage = book.slippage_bps(order_side, qty)
+                if slippage is None or slippage > LIQUIDITY_MAX_SLIPPAGE_BPS:
+                    logging.info(f"Ликвидность {symbol} ({order_side} {qty}): проскальзывание "
+                                 f"{'больше глубины стакана' if slippage is None else f'{slippage:.1f} bps'}")
+                    return False
+        return True
     except Exception as e:
         logging.error(f"Ошибка при проверке ликвидности для {symbol}: {e}")
         return False
 
+# Стакан символа из WebSocket; REST-снимок только без подписки, после пропуска обновлений или долгой тишины
+def get_order_book(symbol):
+    book = order_books.get(symbol)
+    if book is None:
+        book = order_books.setdefault(symbol, OrderBook(symbol))
+    if symbol not in order_book_subscriptions or not book.synced or book.age() > ORDERBOOK_MAX_AGE:
+        with metrics.timer("orderbook_resync"):
+            response = session.get_orderbook(category="linear", symbol=symbol, limit=ORDERBOOK_DEPTH)
+        book.load_snapshot(response['result'], from_rest=True)
+        metrics.inc("orderbook_resync", symbol)
+    return book
+
+# Функция для получения последней цены через REST (асинхронная версия)
+async def get_last_price_async(symbol):
+    try:
+        response = await run_blocking(session.get_tickers, category="linear", symbol=symbol)
+        return float(response['result']['list'][0]['lastPrice'])
+    except Exception as e:
+        logging.error(f"Ошибка при получении цены {symbol}: {e}")
+        return None
+
+# Свечи, закрытые по времени биржи (без текущей формирующейся)
+def closed_candles(candles):
+    return candles.closed(KLINE_INTERVAL * 60 * 1000, server_clock.now() * 1000)
+
+# Оценка по закрытым свечам: индикаторы, паттерн и сигнал считаются один раз на свечу
+def evaluate_closed_candles(symbol, candles):
+    """
+    Returns:
+        ((rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern, signal), fresh) —
+        fresh=False, если результат взят из кэша по последней закрытой свече или свеча ещё не
+        подтверждена биржей (confirm); (None, True) без индикаторов
+    """
+    closed = closed_candles(candles)
+    if len(closed) == 0:
+        return None, True
+
+    def compute():
+        indicators = get_indicators(symbol, closed)
+        if None in indicators[:6]:
+            return None
+        with metrics.timer("generate_signal"):
+            signal = generate_signal(*indicators)
+        return indicators + (signal,)
+
+    # По времени свеча закрыта, но финальное обновление могло ещё не прийти: такая оценка
+    # предварительная — в кэш не попадает, а оценка после confirm считается заново
+    if not closed.final:
+        metrics.inc("evaluation_memo", "provisional")
+        return compute(), False
+
+    evaluation, fresh = evaluation_memo.get_or_compute(symbol, closed.last_timestamp, compute)
+    metrics.inc("evaluation_memo", "miss" if fresh else "hit")
+    return evaluation, fresh
+
+# Параллельный запрос всех данных торгового цикла
+async def fetch_cycle_snapshot_async(symbol):
+    return await gather_dict({
+        "klines": run_blocking(get_klines, symbol),
+        "position": check_position_async(symbol),
+        "price": get_last_price_async(symbol),
+        "balance": check_balance_async(),
+    })
+
+def fetch_cycle_snapshot(symbol):
+    with metrics.timer("snapshot"):
+        return run_sync(fetch_cycle_snapshot_async(symbol))
+
 # Функция для получения текущей цены через WebSocket
 def start_websocket(symbol=None):
     if symbol is None:
         logging.error("Ошибка: symbol не указан для WebSocket")
         return None
     try:
-        ws_instance = WebSocket(
-            testnet=True,
-            channel_type="linear"
-        )
+        ws_instance = create_websocket("linear")
         
-        def handle_ticker(data):
-            try:
-                price = float(data['data']['lastPrice'])
-                if not hasattr(handle_ticker, 'last_price') or handle_ticker.last_price != price:
-                    logging.info(f"WebSocket: Текущая цена {data['data']['symbol']}: {price} USDT")
-                    print(f"WebSocket: Текущая цена {data['data']['symbol']}: {price} USDT")
-                    handle_ticker.last_price = price
-            except Exception as e:
-                logging.error(f"Ошибка обработки WebSocket данных: {e}")
-
-        ws_instance.ticker_stream(symbol=symbol, callback=handle_ticker)
+        subscribe_ticker(symbol, ws_instance)
         logging.info(f"WebSocket запущен для получения цен {symbol}")
+        subscribe_klines(symbol, ws_instance)
+        subscribe_orderbook(symbol, ws_instance)
         return ws_instance
     except Exception as e:
         logging.error(f"Ошибка подключения к WebSocket: {e}")
         return None
 
-# Функция для получения 5-минутных свечей
-def get_klines(symbol=None):
-    if symbol is None:
-        symbol = SELECTED_SYMBOL
+# Обработчик цен из ticker WebSocket: только запоминает цену и ставит событие в очередь
+def handle_ticker(message):
+    global last_tick_time
     try:
-        response = session.get_kline(
-            category="linear",
-            symbol=symbol,
-            interval=5,
-            limit=500
-        )
-        klines = response['result']['list']
-        if not klines:
-            logging.error(f"Не удалось получить свечи для {symbol}")
-            return None
-        df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'].astype(float), unit='ms')
-        for col in ['open', 'high', 'low', 'close', 'volume', 'turnover']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        df = df.dropna()
-        df = df.sort_values('timestamp').drop_duplicates(subset='timestamp', keep='last')
-        logging.info(f"Получено {len(df)} свечей для {symbol}")
-        if df.empty or df['close'].isna().any():
-            logging.error(f"Данные свечей содержат пропуски или пусты: {df.tail()}")
-            return None
-        # Проверка на достаточное количество данных
-        if len(df) < 26:
-            logging.error(f"Недостаточно данных для расчета индикаторов: {len(df)} свечей")
-            return None
-        # Заполнение пропусков методом forward fill
-        df = df.set_index('timestamp').resample('5min').ffill().reset_index()
-        latest_time = df['timestamp'].iloc[-1]
-        if (pd.Timestamp.now() - latest_time).total_seconds() > 3600:
-            logging.warning(f"Данные устарели: последняя свеча {latest_time}, текущее время {pd.Timestamp.now()}")
-        return df
+        data = message['data']
+        symbol = data['symbol']
+        price = float(data['lastPrice'])
+        last_tick_time = time.time()
+        if latest_prices.get(symbol) == price:
+            return
+        latest_prices[symbol] = price
+        logging.debug(f"WebSocket: Текущая цена {symbol}: {price} USDT")
+        # SL/TP проверяются только для символов с открытой позицией
+        if symbol in positions and symbol not in pending_ticks:
+            pending_ticks.add(symbol)
+            engine_events.put(("tick", symbol))
     except Exception as e:
-        logging.error(f"Ошибка при получении свечей для {symbol}: {e}")
-        return None
+        logging.error(f"Ошибка обработки WebSocket данных: {e}")
 
-# Функция для поиска свечных паттернов
-def detect_candle_patterns(df):
-    """Поиск свечных паттернов с расширенным набором паттернов."""
-    if len(df) < 2:
-        return None
-    latest = df.iloc[-1]
-    previous = df.iloc[-2]
-    
-    # Вычисление тела и диапазона свечей
-    body_latest = abs(latest['close'] - latest['open'])
-    body_previous = abs(previous['close'] - previous['open'])
-    range_latest = latest['high'] - latest['low']
-    range_previous = previous['high'] - previous['low']
-    
-    # Doji (маленькое тело относительно диапазона)
-    if body_latest / range_latest < 0.1 and body_latest < 0.1 * range_previous:
-        return "Doji"
-    
-    # Bullish Engulfing
-    if (previous['close'] < previous['open'] and  # Медвежья свеча
-        latest['close'] > latest['open'] and      # Бычья свеча
-        latest['open'] < previous['close'] and    # Открытие ниже закрытия предыдущей
-        latest['close'] > previous['open'] and    # Закрытие выше открытия предыдущей
-        body_latest > body_previous):
-        return "Bullish Engulfing"
-    
-    # Bearish Engulfing
-    if (previous['close'] > previous['open'] and  # Бычья свеча
-        latest['close'] < latest['open'] and      # Медвежья свеча
-        latest['open'] > previous['close'] and    # Открытие выше закрытия предыдущей
-        latest['close'] < previous['open'] and    # Закрытие ниже открытия предыдущей
-        body_latest > body_previous):
-        return "Bearish Engulfing"
-    
-    # Hammer (бычий паттерн)
-    lower_shadow = latest['open'] - latest['low'] if latest['close'] > latest['open'] else latest['close'] - latest['low']
-    upper_shadow = latest['high'] - latest['close'] if latest['close'] > latest['open'] else latest['high'] - latest['open']
-    if (lower_shadow >= 2 * body_latest and body_latest / range_latest < 0.2 and latest['close'] > latest['open']):
-        return "Hammer"
-    
-    # Shooting Star (медвежий паттерн)
-    if (upper_shadow >= 2 * body_latest and body_latest / range_latest < 0.2 and latest['close'] < latest['open']):
-        return "Shooting Star"
-    
-    # Morning Star (бычий паттерн, 3 свечи)
-    if len(df) >= 3:
-        third = df.iloc[-1]  # Последняя свеча
-        second = df.iloc[-2]  # Средняя свеча
-        first = df.iloc[-3]   # Первая свеча
-        body_second = abs(second['close'] - second['open'])
-        range_second = second['high'] - second['low']
-        mid_first = (first['open'] + first['close']) / 2
-        if (first['close'] < first['open'] and  # Первая свеча медвежья
-            body_second / range_second < 0.1 and  # Вторая свеча с маленьким телом
-            third['close'] > third['open'] and    # Третья свеча бычья
-            third['close'] > mid_first):          # Закрытие третьей выше середины первой
-            return "Morning Star"
-    
-    # Bullish Harami
-    if (previous['close'] < previous['open'] and  # Первая свеча медвежья
-        latest['close'] > latest['open'] and      # Вторая свеча бычья
-        latest['open'] >= previous['close'] and   # Вторая свеча внутри тела первой
-        latest['close'] <= previous['open']):
-        return "Bullish Harami"
-    
-    # Bearish Harami
-    if (previous['close'] > previous['open'] and  # Первая свеча бычья
-        latest['close'] < latest['open'] and      # Вторая свеча медвежья
-        latest['open'] <= previous['close'] and   # Вторая свеча внутри тела первой
-        latest['close'] >= previous['open']):
-        return "Bearish Harami"
-    
-    # Piercing Line (бычий паттерн)
-    if (previous['close'] < previous['open'] and  # Первая свеча медвежья
-        latest['close'] > latest['open'] and      # Вторая свеча бычья
-        latest['open'] < previous['low'] and      # Открытие ниже минимума первой
-        latest['close'] > (previous['open'] + previous['close']) / 2):  # Закрытие выше середины первой
-        return "Piercing Line"
-    
-    # Dark Pool Cover (медвежий паттерн)
-    if (previous['close'] > previous['open'] and  # Первая свеча бычья
-        latest['close'] < latest['open'] and      # Вторая свеча медвежья
-        latest['open'] > previous['high'] and     # Открытие выше максимума первой
-        latest['close'] < (previous['open'] + previous['close']) / 2):  # Закрытие ниже середины первой
-        return "Dark Pool Cover"
-    
-    # Three White Soldiers (бычий паттерн, 3 свечи)
-    if len(df) >= 3:
-        third = df.iloc[-1]
-        second = df.iloc[-2]
-        first = df.iloc[-3]
-        shadow_third = (third['high'] - third['close']) if third['close'] > third['open'] else (third['high'] - third['open'])
-        shadow_second = (second['high'] - second['close']) if second['close'] > second['open'] else (second['high'] - second['open'])
-        shadow_first = (first['high'] - first['close']) if first['close'] > first['open'] else (first['high'] - first['open'])
-        body_third = abs(third['close'] - third['open'])
-        body_second = abs(second['close'] - second['open'])
-        body_first = abs(first['close'] - first['open'])
-        if (first['close'] > first['open'] and  # Все три свечи бычьи
-            second['close'] > second['open'] and
-            third['close'] > third['open'] and
-            second['close'] > first['close'] and  # Каждая закрывается выше предыдущей
-            third['close'] > second['close'] and
-            shadow_first / body_first < 0.1 and   # Маленькие верхние тени
-            shadow_second / body_second < 0.1 and
-            shadow_third / body_third < 0.1):
-            return "Three White Soldiers"
-    
-    # Three Black Crows (медвежий паттерн, 3 свечи)
-    if len(df) >= 3:
-        third = df.iloc[-1]
-        second = df.iloc[-2]
-        first = df.iloc[-3]
-        shadow_third = (third['open'] - third['low']) if third['close'] < third['open'] else (third['close'] - third['low'])
-        shadow_second = (second['open'] - second['low']) if second['close'] < second['open'] else (second['close'] - second['low'])
-        shadow_first = (first['open'] - first['low']) if first['close'] < first['open'] else (first['close'] - first['low'])
-        body_third = abs(third['close'] - third['open'])
-        body_second = abs(second['close'] - second['open'])
-        body_first = abs(first['close'] - first['open'])
-        if (first['close'] < first['open'] and  # Все три свечи медвежьи
-            second['close'] < second['open'] and
-            third['close'] < third['open'] and
-            second['close'] < first['close'] and  # Каждая закрывается ниже предыдущей
-            third['close'] < second['close'] and
-            shadow_first / body_first < 0.1 and   # Маленькие нижние тени
-            shadow_second / body_second < 0.1 and
-            shadow_third / body_third < 0.1):
-            return "Three Black Crows"
-    
-    # Bullish Kicker (бычий паттерн)
-    if (previous['close'] < previous['open'] and  # Первая свеча медвежья
-        latest['close'] > latest['open'] and      # Вторая свеча бычья
-        latest['open'] > previous['close']):      # Гэп вверх
-        return "Bullish Kicker"
-    
-    # Bearish Kicker (медвежий паттерн)
-    if (previous['close'] > previous['open'] and  # Первая свеча бычья
-        latest['close'] < latest['open'] and      # Вторая свеча медвежья
-        latest['open'] < previous['close']):      # Гэп вниз
-        return "Bearish Kicker"
-    
-    # Inverted Hammer (бычий паттерн)
-    if (upper_shadow >= 2 * body_latest and body_latest / range_latest < 0.2 and
-        (latest['low'] - min(latest['open'], latest['close'])) < 0.1 * body_latest):
-        return "Inverted Hammer"
-    
-    # Hanging Man (медвежий паттерн, после роста)
-    if len(df) >= 3:
-        prev_trend = df.iloc[-3:-1]['close'].mean() < df.iloc[-3:-1]['open'].mean()  # Проверяем предыдущий тренд
-        if (lower_shadow >= 2 * body_latest and body_latest / range_latest < 0.2 and
-            (max(latest['open'], latest['close']) - latest['high']) < 0.1 * body_latest and
-            not prev_trend):  # Подтверждаем, что до этого был восходящий тренд
-            return "Hanging Man"
-    
-    return None
+# Подписка на цены символа (каждый топик подписывается один раз)
+def subscribe_ticker(symbol, ws_instance=None):
+    ws_instance = ws_instance or ws
+    if ws_instance is None or symbol in ticker_subscriptions:
+        return
+    try:
+        ws_instance.ticker_stream(symbol=symbol, callback=handle_ticker)
+        ticker_subscriptions.add(symbol)
+    except Exception as e:
+        logging.error(f"Ошибка подписки на цены {symbol}: {e}")
 
-# Функция для расчета индикаторов RSI, EMA, ATR и MACD
-def calculate_indicators(df):
-    """Расчет индикаторов с улучшенной валидацией данных."""
+# Обработчик стакана из orderbook WebSocket (снимок и дельты)
+def handle_orderbook(message):
     try:
-        if len(df) < 26:
-            logging.error(f"Недостаточно данных для расчета индикаторов: {len(df)} свечей")
-            return None, None, None, None, None, None, None
-        
-        # Проверка на пропущенные значения
-        if df['close'].isna().any() or df['high'].isna().any() or df['low'].isna().any():
-            logging.error("Обнаружены пропущенные значения в данных")
-            return None, None, None, None, None, None, None
-        
-        # Фильтрация и подготовка данных
-        df = df[(df['close'] > 0) & (df['high'] > 0) & (df['low'] > 0)].copy()
-        if len(df) < 26:
-            logging.error("После фильтрации данных осталось недостаточно свечей")
-            return None, None, None, None, None, None, None
-        
-        df = df.reset_index(drop=True)
-        df['close'] = df['close'].astype(float)
-        df['high'] = df['high'].astype(float)
-        df['low'] = df['low'].astype(float)
-        
-        # Расчет индикаторов
-        rsi_series = RSIIndicator(close=df['close'], window=14).rsi()
-        ema_fast_series = EMAIndicator(close=df['close'], window=12).ema_indicator()
-        ema_slow_series = EMAIndicator(close=df['close'], window=26).ema_indicator()
-        atr_series = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14).average_true_range()
-        macd_obj = MACD(close=df['close'], window_slow=26, window_fast=12, window_sign=9)
-        macd_series = macd_obj.macd()
-        signal_series = macd_obj.macd_signal()
-        
-        # Проверка валидности результатов
-        indicators = {
-            'RSI': rsi_series,
-            'EMA12': ema_fast_series,
-            'EMA26': ema_slow_series,
-            'ATR': atr_series,
-            'MACD': macd_series,
-            'Signal': signal_series
-        }
-        
-        # Проверка каждого индикатора
-        for name, series in indicators.items():
-            if series.isna().all() or len(series.dropna()) == 0:
-                logging.error(f"Ошибка: индикатор {name} пуст или содержит только NaN")
-                return None, None, None, None, None, None, None
-            if pd.isna(series.iloc[-1]):
-                logging.error(f"Ошибка: последнее значение индикатора {name} отсутствует")
-                return None, None, None, None, None, None, None
-        
-        # Получение последних значений
-        rsi_value = float(rsi_series.iloc[-1])
-        ema_fast_value = float(ema_fast_series.iloc[-1])
-        ema_slow_value = float(ema_slow_series.iloc[-1])
-        atr_value = float(atr_series.iloc[-1])
-        macd_line = float(macd_series.iloc[-1])
-        signal_line = float(signal_series.iloc[-1])
-        candle_pattern = detect_candle_patterns(df)
-        
-        # Формирование сводки индикаторов
-        indicator_summary = (
-            f"📊 Текущие индикаторы:\n"
-            f"  RSI: {rsi_value:.2f}\n"
-            f"  EMA12: {ema_fast_value:.2f}\n"
-            f"  EMA26: {ema_slow_value:.2f}\n"
-            f"  ATR: {atr_value:.2f}\n"
-            f"  MACD: {macd_line:.2f}\n"
-            f"  Signal: {signal_line:.2f}\n"
-            f"  Свечной паттерн: {candle_pattern if candle_pattern else 'Не обнаружен'}"
-        )
-        logging.info(indicator_summary)
-        
-        return rsi_value, ema_fast_value, ema_slow_value, atr_value, macd_line, signal_line, candle_pattern
+        symbol = message['topic'].split('.')[-1]
+        book = order_books.get(symbol)
+        if book is None:
+            return
+        gaps = book.gaps
+        book.apply(message['type'], message['data'])
+        if book.gaps != gaps:
+            metrics.inc("orderbook_gap", symbol)
     except Exception as e:
-        logging.error(f"Ошибка при расчете индикаторов: {e}")
-        return None, None, None, None, None, None, None
+        logging.error(f"Ошибка обработки стакана из WebSocket: {e}")
 
-# Функция для генерации торговых сигналов
-def generate_signal(rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern):
-    """Генерация торговых сигналов с расширенным набором паттернов."""
+# Подписка на стакан символа (каждый топик подписывается один раз)
+def subscribe_orderbook(symbol, ws_instance=None):
+    ws_instance = ws_instance or ws
+    if ws_instance is None or symbol in order_book_subscriptions:
+        return
     try:
-        if any(v is None for v in [rsi, ema_fast, ema_slow, atr, candle_pattern]):
-            logging.warning("Не удалось сгенерировать сигнал: одно из значений индикаторов равно None")
-            return None
-        
-        # Логирование входных данных для отладки
-        logging.info(
-            f"Генерация сигнала:\n"
-            f"  RSI: {rsi:.2f}\n"
-            f"  EMA12: {ema_fast:.2f}\n"
-            f"  EMA26: {ema_slow:.2f}\n"
-            f"  Candle Pattern: {candle_pattern if candle_pattern else 'Не обнаружен'}"
-        )
-        
-        # Бычьи паттерны
-        bullish_patterns = [
-            "Bullish Engulfing", "Doji", "Hammer", "Morning Star",
-            "Bullish Harami", "Piercing Line", "Three White Soldiers",
-            "Bullish Kicker", "Inverted Hammer"
-        ]
-        
-        # Медвежьи паттерны
-        bearish_patterns = [
-            "Bearish Engulfing", "Doji", "Shooting Star",
-            "Bearish Harami", "Dark Pool Cover", "Three Black Crows",
-            "Bearish Kicker", "Hanging Man"
-        ]
-        
-        # Условия для покупки: RSI < 55, EMA12 > EMA26, бычьи свечные паттерны
-        if (rsi < 55 and ema_fast > ema_slow and candle_pattern in bullish_patterns):
-            logging.info("Сгенерирован сигнал Buy: все условия выполнены")
-            return "Buy"
-        
-        # Условия для продажи: RSI > 55, EMA12 < EMA26, медвежьи свечные паттерны
-        elif (rsi > 55 and ema_fast < ema_slow and candle_pattern in bearish_patterns):
-            logging.info("Сгенерирован сигнал Sell: все условия выполнены")
-            return "Sell"
-        
-        # Логируем причину отсутствия сигнала
-        if rsi >= 55:
-            logging.info("Нет сигнала Buy: RSI >= 55")
-        elif rsi <= 55:
-            logging.info("Нет сигнала Sell: RSI <= 55")
-        if ema_fast <= ema_slow:
-            logging.info("Нет сигнала Buy: EMA12 <= EMA26")
-        elif ema_fast >= ema_slow:
-            logging.info("Нет сигнала Sell: EMA12 >= EMA26")
-        if candle_pattern not in bullish_patterns:
-            logging.info("Нет сигнала Buy: отсутствует нужный свечной паттерн")
-        if candle_pattern not in bearish_patterns:
-            logging.info("Нет сигнала Sell: отсутствует нужный свечной паттерн")
-        
-        return None
+        order_books.setdefault(symbol, OrderBook(symbol))
+        ws_instance.orderbook_stream(depth=ORDERBOOK_DEPTH, symbol=symbol, callback=handle_orderbook)
+        order_book_subscriptions.add(symbol)
+        logging.info(f"WebSocket подписан на стакан {symbol}")
     except Exception as e:
-        logging.error(f"Ошибка при генерации сигнала: {e}")
-        return None
+        logging.error(f"Ошибка подписки на стакан {symbol}: {e}")
+
+# Обработчик свечей из kline WebSocket
+def handle_kline(message):
+    try:
+        symbol = message['topic'].split('.')[-1]
+        buffer = market_data.peek(symbol, KLINE_INTERVAL)
+        if buffer is None:
+            return  # Буфер вытеснен из кэша; при следующем обращении загрузится заново
+        engine = indicator_engines.get(symbol)
+        for candle in message['data']:
+            high, low, close = float(candle['high']), float(candle['low']), float(candle['close'])
+            accepted = buffer.update(
+                candle['start'],
+                float(candle['open']),
+                high,
+                low,
+                close,
+                float(candle['volume']),
+                float(candle['turnover']),
+                confirmed=bool(candle.get('confirm'))
+            )
+            if accepted and engine is not None:
+                engine.update(int(candle['start']), high, low, close)
+            # Закрытие свечи запускает оценку сигнала в торговом цикле
+            if accepted and candle.get('confirm'):
+                engine_events.put(("kline_closed", symbol))
+    except Exception as e:
+        logging.error(f"Ошибка обработки свечи из WebSocket: {e}")
 
-def generate_signal_test(rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern):
-    """Тестовая версия генерации сигналов с упрощенными условиями."""
+# Подписка на свечи символа (каждый топик подписывается один раз)
+def subscribe_klines(symbol, ws_instance=None):
+    ws_instance = ws_instance or ws
+    if ws_instance is None or symbol in kline_subscriptions:
+        return
     try:
-        if any(v is None for v in [rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern]):
-            logging.warning("Не удалось сгенерировать тестовый сигнал: одно из значений индикаторов равно None")
+        get_kline_buffer(symbol)
+        ws_instance.kline_stream(interval=KLINE_INTERVAL, symbol=symbol, callback=handle_kline)
+        kline_subscriptions.add(symbol)
+        logging.info(f"WebSocket подписан на свечи {symbol}")
+    except Exception as e:
+        logging.error(f"Ошибка подписки на свечи {symbol}: {e}")
+
+# Загрузка истории свечей в буфер из локального хранилища (с биржи — только недостающие свечи)
+def backfill_klines(buffer):
+    current = candle_store.sync(buffer.symbol, buffer.interval, min_candles=buffer.capacity)
+    rows = candle_store.tail(buffer.symbol, buffer.interval, buffer.capacity, current=current)
+    if len(rows) == 0:
+        logging.error(f"Не удалось получить свечи для {buffer.symbol}")
+        return
+    buffer.load_rows(rows)
+    # Пересобираем потоковые индикаторы по загруженной истории
+    data = buffer.arrays()
+    engine = IndicatorEngine()
+    engine.seed(data['timestamp'], data['high'], data['low'], data['close'])
+    indicator_engines[buffer.symbol] = engine
+
+# Получение буфера свечей символа; REST-запрос только при старте, пропуске свечей или без WebSocket
+def get_kline_buffer(symbol):
+    buffer, created = market_data.get(symbol, KLINE_INTERVAL)
+    metrics.inc("market_data_cache", "miss" if created else "hit")
+    stale = symbol not in kline_subscriptions and time.time() - buffer.last_update > KLINE_INTERVAL * 60
+    if buffer.needs_resync or stale:
+        backfill_klines(buffer)
+    return buffer
+
+# Функция для получения 5-минутных свечей
+def get_klines(symbol=None):
+    if symbol is None:
+        symbol = SELECTED_SYMBOL
+    try:
+        with metrics.timer("get_klines"):
+            buffer = get_kline_buffer(symbol)
+        if len(buffer) == 0:
+            logging.error(f"Не удалось получить свечи для {symbol}")
             return None
-        
-        logging.info(
-            f"Генерация тестового сигнала:\n"
-            f"  RSI: {rsi:.2f}\n"
-            f"  EMA12: {ema_fast:.2f}\n"
-            f"  EMA26: {ema_slow:.2f}\n"
-            f"  MACD: {macd_line:.2f}\n"
-            f"  Signal: {signal_line:.2f}\n"
-            f"  Candle Pattern: {candle_pattern if candle_pattern else 'Не обнаружен'}"
-        )
-        
-        # Упрощенные условия для тестирования
-        if rsi < 60 and ema_fast > ema_slow:
-            logging.info("Тестовый сигнал Buy: RSI < 60 и EMA12 > EMA26")
-            return "Buy"
-        elif rsi > 60 and ema_fast < ema_slow:
-            logging.info("Тестовый сигнал Sell: RSI > 60 и EMA12 < EMA26")
-            return "Sell"
-        else:
-            if rsi >= 60:
-                logging.info("Нет тестового сигнала Buy: RSI >= 60")
-            elif rsi <= 60:
-                logging.info("Нет тестового сигнала Sell: RSI <= 60")
-            if ema_fast <= ema_slow:
-                logging.info("Нет тестового сигнала Buy: EMA12 <= EMA26")
-            elif ema_fast >= ema_slow:
-                logging.info("Нет тестового сигнала Sell: EMA12 >= EMA26")
+        with metrics.timer("candles_snapshot"):
+            candles = buffer.candles()
+        logging.info(f"Получено {len(candles)} свечей для {symbol}")
+        # Проверка на достаточное количество данных
+        if len(candles) < 26:
+            logging.error(f"Недостаточно данных для расчета индикаторов: {len(candles)} свечей")
             return None
+        age = time.time() - candles.last_timestamp / 1000
+        if age > 3600:
+            logging.warning(f"Данные устарели: последняя свеча {age / 3600:.1f} ч назад")
+        return candles
     except Exception as e:
-        logging.error(f"Ошибка при генерации тестового сигнала: {e}")
+        logging.error(f"Ошибка при получении свечей для {symbol}: {e}")
         return None
 
-# Функция для проверки открытых позиций
-def check_position(symbol=None):
-    if symbol is None:
-        symbol = SELECTED_SYMBOL
+# Индикаторы из потокового движка символа (O(1) на свечу), если он хранит последнюю свечу df
+# (текущую или предыдущую закрытую); иначе — полный расчёт
+def get_indicators(symbol, df):
+    engine = indicator_engines.get(symbol)
+    values = engine.values(df.last_timestamp) if engine is not None else None
+    if values is None:
+        with metrics.timer("calculate_indicators"):
+            return calculate_indicators(df)
+    rsi_value, ema_fast_value, ema_slow_value, atr_value, macd_line, signal_line = values
+    with metrics.timer("candle_patterns"):
+        candle_pattern = detect_candle_patterns(df)
+    logging.info(
+        f"Потоковые индикаторы {symbol}: RSI: {rsi_value:.2f}, EMA12: {ema_fast_value:.2f}, "
+        f"EMA26: {ema_slow_value:.2f}, ATR: {atr_value:.2f}, MACD: {macd_line:.2f}, Signal: {signal_line:.2f}"
+    )
+    return rsi_value, ema_fast_value, ema_slow_value, atr_value, macd_line, signal_line, candle_pattern
+
+# Функция для проверки открытых позиций (асинхронная версия): из состояния счёта, без него — через REST
+async def check_position_async(symbol):
+    if account_state_ready():
+        position, age = account_state.position(symbol)
+        return position
+    with metrics.timer("position_rest"):
+        return await fetch_position_async(symbol)
+
+# Запрос позиции через REST
+async def fetch_position_async(symbol):
     try:
-        response = session.get_position(category="linear", symbol=symbol)
+        response = await run_blocking(session.get_positions, category="linear", symbol=symbol)
         position = response['result']['list']
         if not position:
             return 0, None, 0
@@ -608,80 +622,179 @@ def check_position(symbol=None):
         logging.error(f"Ошибка при проверке позиции для {symbol}: {e}")
         return 0, None, 0
 
-# Функция для логирования сделок
-def log_trade(action, side, price, qty, status="executed", pnl=0.0):
-    trade = {
-        "timestamp": str(pd.Timestamp.now()),
-        "action": action,
-        "side": side,
-        "price": price,
-        "qty": qty,
-        "status": status,
-        "symbol": SYMBOL,
-        "pnl": pnl,
-        "invested": price * qty if action == "open" else 0.0
-    }
+# Функция для проверки открытых позиций
+def check_position(symbol=None):
+    if symbol is None:
+        symbol = SELECTED_SYMBOL
+    return run_sync(check_position_async(symbol))
+
+# Сверка состояния счёта с REST (при старте и после переподключения приватного WebSocket)
+async def reconcile_account_state_async():
+    snapshot = await gather_dict({
+        "positions": run_blocking(session.get_positions, category="linear", settleCoin="USDT"),
+        "balance": fetch_balance_async(),
+    })
+    if isinstance(snapshot["positions"], Exception):
+        return False
+    account_state.account_type = balance_account_type
+    account_state.reconcile(snapshot["positions"], snapshot["balance"])
+    return True
+
+def reconcile_account_state():
+    return run_sync(reconcile_account_state_async())
+
+# Запуск приватного WebSocket: позиции, баланс, ордера и исполнения обновляются без REST-запросов
+def start_account_stream():
+    global account_ws
+    try:
+        ws_private = create_websocket(
+            "private",
+            api_key=api_key,
+            api_secret=api_secret
+        )
+        account_state.subscribe(ws_private)
+        account_ws = ws_private
+        reconcile_account_state()
+        # После переподключения pybit переподписывается на топики; состояние сверяем с REST в фоне
+        on_open = ws_private._on_open
+        def on_reconnect():
+            on_open()
+            logging.info("Приватный WebSocket переподключён, сверка состояния счёта")
+            threading.Thread(target=reconcile_account_state, name="account-reconcile", daemon=True).start()
+        ws_private._on_open = on_reconnect
+        logging.info("Приватный WebSocket запущен (position, wallet, order, execution)")
+        return ws_private
+    except Exception as e:
+        logging.error(f"Ошибка подключения к приватному WebSocket: {e}")
+        return None
+
+# Запись исполненного или отклонённого ордера в журнал сделок
+def log_trade(ticket, action, pnl=0.0):
+    if ticket.ack_latency_ms is not None:
+        metrics.observe("order_ack", ticket.ack_latency_ms / 1000)
+    if ticket.fill_latency_ms is not None:
+        metrics.observe("order_fill", ticket.fill_latency_ms / 1000)
+    try:
+        status = ticket.status if ticket.status in ("filled", "rejected", "cancelled", "unknown") else "rejected"
+        trade_journal.record(
+            ticket.symbol, action, ticket.side, ticket.avg_fill_price or 0.0,
+            ticket.filled_qty if status == "filled" else ticket.qty, status=status,
+            pnl=pnl, fee=ticket.fees, latency_ms=ticket.fill_latency_ms
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при записи в журнал сделок: {e}")
+
+# Перенос старого trades_log.json в журнал (один раз, файл переименовывается)
+def migrate_trades_log():
+    if not os.path.exists(TRADES_LOG_FILE):
+        return
     try:
-        with open(TRADES_LOG_FILE, 'a') as f:
-            f.write(json.dumps(trade) + "\n")
-        logging.info(f"Сделка записана: {trade}")
+        trade_journal.import_jsonl(TRADES_LOG_FILE)
+        os.replace(TRADES_LOG_FILE, TRADES_LOG_FILE + ".imported")
     except Exception as e:
-        logging.error(f"Ошибка при записи в лог сделок: {e}")
+        logging.error(f"Ошибка переноса {TRADES_LOG_FILE} в журнал сделок: {e}")
 
-# Функция для размещения ордера
+# Функция для размещения ордера (не блокирует: позиция записывается по факту исполнения)
 def place_order(side, price, qty, symbol=None):
     if symbol is None:
         symbol = SELECTED_SYMBOL
     try:
-        order = session.place_order(
-            category="linear",
-            symbol=symbol,
-            side=side,
-            orderType="Market",
-            qty=qty,
-            reduceOnly=False
-        )
-        if order['retCode'] == 0:
-            invested = qty * price
-            positions[symbol] = {"side": side, "qty": qty, "entry_price": price, "invested": invested}
-            message = f"✅ Ордер размещён: {side} {symbol}, Объём: {qty}, Цена: {price} USDT"
-            print(message)
-            send_telegram_message(message)
-        else:
-            logging.error(f"Ошибка при размещении ордера: {order['retMsg']}")
-            send_telegram_message(f"❌ Ошибка при размещении ордера: {order['retMsg']}")
+        # Предыдущий ордер по символу ещё не исполнен — повторно не отправляем
+        if order_gateway.has_active(symbol):
+            logging.warning(f"Ордер {symbol} не размещён: предыдущий ордер ещё не исполнен")
+            return None
+        # Объём округляется вниз до шага инструмента
+        qty = instruments.normalize_qty(symbol, qty)
+        if qty == 0:
+            error_msg = f"❌ Ордер {symbol} не размещён: объём меньше минимального для инструмента"
+            logging.error(error_msg)
+            send_telegram_message(error_msg, priority=PRIORITY_CRITICAL)
+            return None
+
+        def on_done(ticket):
+            log_trade(ticket, "open")
+            if ticket.status == "filled":
+                fill_price = ticket.avg_fill_price or price
+                with positions_lock:
+                    positions[symbol] = {"side": side, "qty": ticket.filled_qty, "entry_price": fill_price,
+                                         "invested": ticket.filled_qty * fill_price}
+                message = (
+                    f"✅ Ордер исполнен: {side} {symbol}, Объём: {ticket.filled_qty}, Цена: {fill_price} USDT "
+                    f"(сигнал: {price}), исполнение за {ticket.fill_latency_ms:.0f} мс"
+                )
+                print(message)
+                send_telegram_message(message, priority=PRIORITY_CRITICAL)
+            elif ticket.status == "unknown":
+                send_telegram_message(f"⚠️ Ордер {side} {symbol}: {ticket.reject_reason}, позиция сверена с биржей",
+                                      priority=PRIORITY_CRITICAL)
+            else:
+                logging.error(f"Ошибка при размещении ордера: {ticket.reject_reason}")
+                send_telegram_message(f"❌ Ошибка при размещении ордера: {ticket.reject_reason}", priority=PRIORITY_CRITICAL)
+
+        return order_gateway.submit(symbol, side, qty, on_done=on_done)
     except Exception as e:
         logging.error(f"Ошибка при размещении ордера для {symbol}: {e}")
-        send_telegram_message(f"❌ Ошибка при размещении ордера: {e}")
+        send_telegram_message(f"❌ Ошибка при размещении ордера: {e}", priority=PRIORITY_CRITICAL)
+        return None
 
-# Функция для закрытия позиции
+# Функция для закрытия позиции (не блокирует; PnL считается по фактической цене исполнения)
 def close_position(side, qty, current_price, entry_price, symbol=None):
-    global total_pnl
     if symbol is None:
         symbol = SELECTED_SYMBOL
     try:
+        if order_gateway.has_active(symbol):
+            logging.warning(f"Закрытие {symbol} не отправлено: предыдущий ордер ещё не исполнен")
+            return None
         close_side = "Sell" if side == "Buy" else "Buy"
-        order = session.place_order(
-            category="linear",
-            symbol=symbol,
-            side=close_side,
-            orderType="Market",
-            qty=qty,
-            reduceOnly=True
-        )
-        if order['retCode'] == 0:
-            pnl = (current_price - entry_price) * qty if side == "Buy" else (entry_price - current_price) * qty
-            total_pnl += pnl
-            positions.pop(symbol, None)
-            message = f"🔒 Позиция закрыта: {side} {symbol}, Объём: {qty}, PnL: {pnl:.2f} USDT"
-            print(message)
-            send_telegram_message(message)
-        else:
-            logging.error(f"Ошибка при закрытии позиции: {order['retMsg']}")
-            send_telegram_message(f"❌ Ошибка при закрытии позиции: {order['retMsg']}")
+
+        def on_done(ticket):
+            global total_pnl
+            if ticket.status == "filled":
+                exit_price = ticket.avg_fill_price or current_price
+                closed_qty = ticket.filled_qty
+                pnl = (exit_price - entry_price) * closed_qty if side == "Buy" else (entry_price - exit_price) * closed_qty
+                with positions_lock:
+                    total_pnl += pnl
+                    positions.pop(symbol, None)
+                log_trade(ticket, "close", pnl=pnl)
+                message = (
+                    f"🔒 Позиция закрыта: {side} {symbol}, Объём: {closed_qty}, Цена: {exit_price} USDT, "
+                    f"PnL: {pnl:.2f} USDT, исполнение за {ticket.fill_latency_ms:.0f} мс"
+                )
+                print(message)
+                send_telegram_message(message, priority=PRIORITY_CRITICAL)
+            elif ticket.status == "unknown":
+                # Позиция уже сверена с биржей: закрытый объём — насколько она уменьшилась. Цена исполнения
+                # неизвестна — PnL по известной части исполнения или по цене на момент закрытия
+                exit_price = ticket.avg_fill_price or current_price
+                with positions_lock:
+                    remaining = positions[symbol]["qty"] if symbol in positions else 0
+                    closed_qty = max(qty - remaining, 0)
+                    pnl = (exit_price - entry_price) * closed_qty if side == "Buy" else (entry_price - exit_price) * closed_qty
+                    total_pnl += pnl
+                log_trade(ticket, "close", pnl=pnl)
+                send_telegram_message(
+                    f"⚠️ Закрытие {side} {symbol}: {ticket.reject_reason}, позиция сверена с биржей "
+                    f"(закрыто {closed_qty}, оценка PnL: {pnl:.2f} USDT)",
+                    priority=PRIORITY_CRITICAL
+                )
+            else:
+                log_trade(ticket, "close")
+                logging.error(f"Ошибка при закрытии позиции: {ticket.reject_reason}")
+                send_telegram_message(f"❌ Ошибка при закрытии позиции: {ticket.reject_reason}", priority=PRIORITY_CRITICAL)
+
+        return order_gateway.submit(symbol, close_side, qty, reduce_only=True, on_done=on_done)
     except Exception as e:
         logging.error(f"Ошибка при закрытии позиции для {symbol}: {e}")
-        send_telegram_message(f"❌ Ошибка при закрытии позиции: {e}")
+        send_telegram_message(f"❌ Ошибка при закрытии позиции: {e}", priority=PRIORITY_CRITICAL)
+        return None
+
+# Ожидание исполнения ордеров (перед итоговым сообщением или остановкой торговли)
+def wait_for_orders(tickets, timeout=ORDER_CLOSE_WAIT):
+    deadline = time.time() + timeout
+    for ticket in tickets:
+        if ticket is not None:
+            order_gateway.wait(ticket, max(0.0, deadline - time.time()))
 
 def get_telegram_updates():
     """Получение обновлений от Telegram API."""
@@ -704,38 +817,48 @@ def get_telegram_updates():
         if updates:
             TELEGRAM_OFFSET = max(update["update_id"] for update in updates) + 1
         
-        # Обрабатываем сообщения и callback-запросы
-        processed_updates = []
-        for update in updates:
-            if "message" in update:
-                processed_updates.append(update)
-            elif "callback_query" in update:
-                logging.info(f"Получен callback: {update['callback_query']['data']}")
-                handle_telegram_callback(update["callback_query"])
-        
-        return processed_updates
+        return updates
     except Exception as e:
         logging.error(f"Ошибка при получении обновлений Telegram: {e}")
         return []
 
+# Последняя цена символа: из ticker WebSocket, без подписки — через REST
+def get_last_price(symbol):
+    price = latest_prices.get(symbol)
+    if price is None:
+        price = float(session.get_tickers(category="linear", symbol=symbol)['result']['list'][0]['lastPrice'])
+    return price
+
 def close_all_positions():
     """Закрытие всех открытых позиций."""
     try:
-        # Проверяем текущие позиции
-        position_qty, position_side, entry_price = check_position()
-        if position_qty == 0:
+        # Открытые позиции: из состояния счёта, без приватного WebSocket — позиция выбранной монеты через REST
+        if account_state_ready():
+            open_positions = account_state.open_positions()
+        else:
+            position_qty, position_side, entry_price = check_position()
+            open_positions = {SELECTED_SYMBOL: (position_qty, position_side, entry_price)} if position_qty > 0 else {}
+        if not open_positions:
             message = "📋 Нет открытых позиций для закрытия."
             print(message)
             send_telegram_message(message)
             logging.info(message)
             return
-        
-        # Получаем текущую цену для расчета PnL
-        current_price = float(session.get_tickers(category="linear", symbol=SYMBOL)['result']['list'][0]['lastPrice'])
-        close_position(position_side, position_qty, current_price, entry_price)
-        message = f"✅ Все позиции закрыты.\n  Символ: {SYMBOL}\n  Цена закрытия: {current_price} USDT\n  Общий PnL: {total_pnl:.2f} USDT"
+
+        closed = []
+        tickets = []
+        for symbol, (position_qty, position_side, entry_price) in open_positions.items():
+            # Текущая цена для расчета PnL, если исполнение не подтвердится
+            current_price = get_last_price(symbol)
+            tickets.append(close_position(position_side, position_qty, current_price, entry_price, symbol=symbol))
+        # Ордера отправлены параллельно; итог — после исполнения
+        wait_for_orders(tickets)
+        for ticket in tickets:
+            if ticket is not None:
+                closed.append(f"  {ticket.symbol}: {ticket.status}, цена закрытия {ticket.avg_fill_price} USDT")
+        message = "✅ Все позиции закрыты.\n" + "\n".join(closed) + f"\n  Общий PnL: {total_pnl:.2f} USDT"
         print(message)
-        send_telegram_message(message)
+        send_telegram_message(message, priority=PRIORITY_CRITICAL)
         logging.info(message)
     except Exception as e:
         error_msg = f"⚠️ Ошибка при закрытии всех позиций: {e}"
@@ -754,8 +877,7 @@ def show_candle_chart():
             return
         
         # Проверка актуальности данных
-        latest_time = df['timestamp'].iloc[-1]
-        time_diff = (pd.Timestamp.now() - latest_time).total_seconds()
+        time_diff = time.time() - df.last_timestamp / 1000
         if time_diff > 10800:  # 3 часа
             warning_msg = f"⚠️ Данные устарели на {time_diff/3600:.1f} часов"
             logging.warning(warning_msg)
@@ -763,19 +885,22 @@ def show_candle_chart():
         
         latest_5 = df.tail(5)
         
-        # Создаем временный HTML файл
+        # Создаем временный HTML файл (модули нужны только для графика)
+        import tempfile
+        import webbrowser
+        from pathlib import Path
         temp_dir = tempfile.gettempdir()
         chart_file = Path(temp_dir) / "candle_chart.html"
         
         # Формируем данные для графика
         chart_data = []
-        for _, row in latest_5.iterrows():
+        for ts, o, h, l, c in zip(*(latest_5[name].tolist() for name in ('timestamp', 'open', 'high', 'low', 'close'))):
             chart_data.append({
-                'x': row['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                'o': float(row['open']),
-                'h': float(row['high']),
-                'l': float(row['low']),
-                'c': float(row['close'])
+                'x': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts / 1000)),
+                'o': o,
+                'h': h,
+                'l': l,
+                'c': c
             })
         
         # Создаем HTML с графиком
@@ -868,91 +993,83 @@ def show_candle_chart():
         logging.error(error_msg)
 
 # Функция для расчёта волатильности одной монеты
-def calculate_volatility(symbol):
-    try:
-        # Запрашиваем 1-часовые свечи за последние 24 часа (24 свечи)
-        klines = session.get_kline(
-            category="linear",
-            symbol=symbol,
-            interval="60",  # 1 час
-            limit=24  # 24 часа
-        )['result']['list']
-        
-        if not klines:
-            return symbol, 0.0
-        
-        # Преобразуем в DataFrame
-        df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
-        df['high'] = df['high'].astype(float)
-        df['low'] = df['low'].astype(float)
-        
-        # Рассчитываем волатильность: ((High - Low) / Low) * 100
-        df['volatility'] = ((df['high'] - df['low']) / df['low']) * 100
-        avg_volatility = df['volatility'].mean()
-        
-        return symbol, avg_volatility
-    except Exception as e:
-        logging.error(f"Ошибка при расчёте волатильности для {symbol}: {e}")
-        return symbol, 0.0
+# Запуск и обновление рейтинга волатильности: один get_tickers и подписка на тикеры всех символов
+def start_volatility_ranker():
+    with volatility_ranker_lock:
+        if not volatility_ranker.needs_reseed():
+            return
+        try:
+            tickers = session.get_tickers(category="linear")['result']['list']
+            volatility_ranker.load_tickers(tickers)
+            ws_instance = volatility_ranker.ws or create_websocket("linear")
+            volatility_ranker.subscribe(ws_instance, volatility_ranker.symbols)
+        except Exception as e:
+            logging.error(f"Ошибка при запуске рейтинга волатильности: {e}")
 
-def get_top_volatile_coins():
+def rank_volatile_coins():
+    """Топ-5 волатильных монет из потокового рейтинга (загрузчик кэша)."""
+    with request_class("scan"):
+        start_volatility_ranker()
+    return volatility_ranker.top(5)
+
+VOLATILE_COINS_CACHE_TTL = 300  # Секунд; обновление начинается за 20% до истечения (кэш создаётся в init_clients)
+
+def get_top_volatile_coins(force_refresh=False):
     """
-    Возвращает список из 5 самых волатильных монет за последние 24 часа с кэшированием.
+    Возвращает список из 5 самых волатильных монет за последние 24 часа.
     Returns:
         List of tuples: [(symbol, volatility), ...]
     """
-    cache_file = "volatile_coins_cache.json"
-    current_time = int(time.time())
-
-    # Проверяем кэш
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, "r") as f:
-                cache = json.load(f)
-            if current_time - cache["timestamp"] < 3600:  # Кэш действителен 1 час
-                logging.info(f"Используется кэш: {cache['timestamp']}")
-                return cache["data"]
-        except Exception as e:
-            logging.error(f"Ошибка при чтении кэша: {e}")
+    coins, age = get_top_volatile_coins_with_age(force_refresh=force_refresh)
+    return coins
 
-    logging.info("Начало анализа волатильных монет")
-    start_time = time.time()
-    try:
-        # Получаем список всех фьючерсных пар
-        tickers = session.get_tickers(category="linear")['result']['list']
-        
-        # Сортируем по объёму торгов (turnover24h) и берём топ-50
-        tickers.sort(key=lambda x: float(x.get('turnover24h', 0)), reverse=True)
-        top_tickers = tickers[:50]
-        symbols = [ticker['symbol'] for ticker in top_tickers]
-        
-        # Параллельно рассчитываем волатильность
-        volatility_data = []
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_symbol = {executor.submit(calculate_volatility, symbol): symbol for symbol in symbols}
-            for future in as_completed(future_to_symbol):
-                symbol, volatility = future.result()
-                if volatility > 0:  # Исключаем пары с нулевой волатильностью
-                    volatility_data.append((symbol, volatility))
-        
-        # Сортируем по убыванию волатильности и берём топ-5
-        volatility_data.sort(key=lambda x: x[1], reverse=True)
-        top_5 = volatility_data[:5]
-        
-        # Сохраняем результат в кэш
-        cache_data = {
-            "timestamp": current_time,
-            "data": top_5
-        }
-        with open(cache_file, "w") as f:
-            json.dump(cache_data, f)
-        
-        elapsed_time = time.time() - start_time
-        logging.info(f"Завершён анализ волатильных монет за {elapsed_time:.2f} секунд")
-        return top_5
-    except Exception as e:
-        logging.error(f"Ошибка при получении волатильных монет: {e}")
-        return []
+def get_top_volatile_coins_with_age(force_refresh=False):
+    """
+    Последний удачный рейтинг и его возраст в секундах; не ждёт обновления, если рейтинг уже есть.
+    Returns:
+        ([(symbol, volatility), ...], age) — ([], None), если рейтинга нет
+    """
+    coins, age = volatile_coins_cache.get(force_refresh=force_refresh)
+    if coins is None:
+        return [], None
+    return [tuple(coin) for coin in coins], age
+
+def format_journal_stats(symbol):
+    """Строки статистики из журнала сделок: по символу и по всем символам."""
+    lines = ""
+    for title, stats in ((symbol, trade_journal.symbol_stats(symbol)), ("Всего", trade_journal.symbol_stats())):
+        if stats["opens"] == 0 and stats["closes"] == 0:
+            continue
+        win_rate = stats["wins"] / stats["closes"] * 100 if stats["closes"] else 0.0
+        lines += (
+            f"\n  {title}: сделок {stats['closes']}, прибыльных {win_rate:.0f}%, "
+            f"PnL {stats['pnl']:.2f} USDT, комиссии {stats['fees']:.2f} USDT"
+        )
+    return ("\n📒 Журнал сделок:" + lines) if lines else ""
+
+def send_perf_report():
+    """Отправка перцентилей задержек этапов цикла, REST-запросов и ордеров."""
+    def row(name, summary):
+        if summary["count"] == 0:
+            return f"  `{name}`: нет данных"
+        return (f"  `{name}`: p50 {summary['p50']:.1f} / p95 {summary['p95']:.1f} / "
+                f"p99 {summary['p99']:.1f} мс (n={summary['count']})")
+    lines = ["⏱ Задержки этапов (мс):"]
+    lines += [row(stage, summary) for stage, summary in metrics.stage_summary().items()]
+    rest = metrics.rest_summary()
+    if rest:
+        lines.append("🌐 REST-запросы:")
+        lines += [row(f"{service} {endpoint}", summary) for (service, endpoint), summary in rest.items()]
+    cache_stats = market_data.stats()
+    hit_rate = f"{cache_stats['hit_rate'] * 100:.0f}%" if cache_stats['hit_rate'] is not None else "—"
+    lines.append(
+        f"🗄 Кэш свечей: {cache_stats['entries']} символов, {cache_stats['bytes'] / 1024 / 1024:.1f} "
+        f"из {cache_stats['budget_bytes'] / 1024 / 1024:.0f} МБ, попаданий {hit_rate}, вытеснено {cache_stats['evictions']}"
+    )
+    order_stats = order_gateway.latency_stats()
+    if order_stats["avg_fill_ms"] is not None:
+        lines.append(f"📨 Ордера: {order_stats['orders']}, среднее исполнение {order_stats['avg_fill_ms']:.0f} мс")
+    send_telegram_message("\n".join(lines), coalesce_key="perf")
 
 def send_status():
     """Отправка текущего статуса бота."""
@@ -963,10 +1080,12 @@ def send_status():
             send_telegram_message("📊 Статус бота:\n  Монета не выбрана. Выберите монету через меню.")
             return
 
-        current_balance = check_balance()
-        position_qty, position_side, entry_price = check_position(symbol=SELECTED_SYMBOL)
-        current_price = float(session.get_tickers(category="linear", symbol=SELECTED_SYMBOL)['result']['list'][0]['lastPrice']) if SELECTED_SYMBOL else 0.0
-        invested_total = sum(pos["invested"] for pos in positions.values()) if positions else 0
+        with request_class("status"):
+            current_balance = check_balance()
+            position_qty, position_side, entry_price = check_position(symbol=SELECTED_SYMBOL)
+            current_price = get_last_price(SELECTED_SYMBOL)
+        with positions_lock:
+            invested_total = sum(pos["invested"] for pos in positions.values())
         unrealized_pnl = 0
         if position_qty > 0:
             unrealized_pnl = (current_price - entry_price) * position_qty if position_side == "Buy" else (entry_price - current_price) * position_qty
@@ -979,8 +1098,12 @@ def send_status():
             f"  Открытых позиций: {position_qty if position_qty > 0 else 0}\n"
             f"  Текущая цена: {current_price:.2f} USDT"
         )
+        if account_state_ready():
+            position, age = account_state.position(SELECTED_SYMBOL)
+            status_message += f"\n  Данные счёта (WebSocket): обновлены {age:.0f} с назад"
+        status_message += format_journal_stats(SELECTED_SYMBOL)
         logging.info(f"Статус отправлен для SELECTED_SYMBOL: {SELECTED_SYMBOL}")
-        send_telegram_message(status_message)
+        send_telegram_message(status_message, coalesce_key="status")
     except Exception as e:
         logging.error(f"Ошибка при отправке статуса: {e}")
         send_telegram_message(f"⚠️ Ошибка при получении статуса: {e}")
@@ -993,7 +1116,7 @@ def handle_telegram_commands(message):
     if message == "/closeall":
         if SELECTED_SYMBOL is None:
             return True  # Убираем уведомление, так как меню уже отображено
-        close_all_positions()
+        engine_events.put(("close_all", None))
         return True
     elif message == "/status":
         send_status()
@@ -1004,11 +1127,11 @@ def handle_telegram_commands(message):
         show_candle_chart()
         return True
     elif message == "/refreshcoins":
-        TOP_VOLATILE_COINS = get_top_volatile_coins()
+        TOP_VOLATILE_COINS, age = get_top_volatile_coins_with_age(force_refresh=True)
         if TOP_VOLATILE_COINS:
             coin_list = "\n".join([f"{i+1}. {symbol} - {volatility:.2f}%" for i, (symbol, volatility) in enumerate(TOP_VOLATILE_COINS)])
             selection_message = (
-                f"📈 Топ-5 волатильных монет:\n"
+                f"📈 Топ-5 волатильных монет (обновлено {age:.0f} с назад):\n"
                 f"{coin_list}\n"
                 f"Выберите монету для анализа:"
             )
@@ -1021,6 +1144,19 @@ def handle_telegram_commands(message):
         else:
             send_telegram_message("⚠️ Не удалось получить список волатильных монет.")
         return True
+    elif message.startswith("/multitrade"):
+        symbols = [symbol.upper() for symbol in message.split()[1:]] or [symbol for symbol, _ in TOP_VOLATILE_COINS]
+        if not symbols:
+            send_telegram_message("⚠️ Список волатильных монет пуст. Используйте /refreshcoins для обновления.")
+            return True
+        engine_events.put(("multi_symbols", symbols))
+        return True
+    elif message == "/singletrade":
+        engine_events.put(("multi_symbols", []))
+        return True
+    elif message == "/perf":
+        send_perf_report()
+        return True
     elif message.startswith("/selectcoin"):
         try:
             parts = message.split()
@@ -1044,11 +1180,8 @@ def handle_telegram_commands(message):
                 return True
             
             symbol = parts[1].upper()
-            tickers = session.get_tickers(category="linear")['result']['list']
-            available_symbols = [ticker['symbol'] for ticker in tickers]
-            
-            if symbol in available_symbols:
-                SELECTED_SYMBOL = symbol
+            if instruments.is_tradable(symbol):
+                engine_events.put(("select_symbol", symbol))
                 send_telegram_message(
                     f"✅ Монета для торговли выбрана: {symbol}\n"
                     f"ℹ️ Вы выбрали монету через команду. Рекомендуется использовать меню волатильных монет для выбора с анализом."
@@ -1062,10 +1195,286 @@ def handle_telegram_commands(message):
             return True
     return False
 
+# Стратегия одного символа в мультисимвольном режиме
+class SymbolWorker:
+    """Независимая стратегия символа: собственные индикаторы, сигнал и позиция.
+    Рыночные данные (буферы свечей, WebSocket) и отправка ордеров общие."""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.latest_indicators = dict.fromkeys(latest_indicators)
+        self.leverage_ready = set_symbol_leverage(symbol)
+        self.fresh = False  # Последняя оценка посчитана по новой закрытой свече
+
+    def evaluate(self, current_price, position):
+        """Один цикл стратегии по общему снимку рынка. Возвращает строку для сводки."""
+        symbol = self.symbol
+        position_qty, position_side, entry_price = position
+        subscribe_klines(symbol)
+        df = get_klines(symbol=symbol)
+        if df is None or current_price is None:
+            return f"{symbol}: нет данных"
+
+        signal = rsi = None
+        evaluation, self.fresh = evaluate_closed_candles(symbol, df)
+        if evaluation is not None:
+            rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern, signal = evaluation
+            self.latest_indicators.update({
+                "rsi": rsi, "ema_fast": ema_fast, "ema_slow": ema_slow, "atr": atr,
+                "macd": macd_line, "signal_line": signal_line, "candle_pattern": candle_pattern
+            })
+        self.latest_indicators["signal"] = signal
+
+        if position_qty > 0:
+            unrealized_pnl = (current_price - entry_price) * position_qty if position_side == "Buy" else (entry_price - current_price) * position_qty
+            if position_side == "Buy":
+                exit_hit = current_price <= entry_price * (1 - STOP_LOSS_PCT) or current_price >= entry_price * (1 + TAKE_PROFIT_PCT)
+            else:
+                exit_hit = current_price >= entry_price * (1 + STOP_LOSS_PCT) or current_price <= entry_price * (1 - TAKE_PROFIT_PCT)
+            if exit_hit:
+                close_position(position_side, position_qty, current_price, entry_price, symbol=symbol)
+            return f"{symbol}: {position_side} {position_qty} @ {entry_price}, PnL {unrealized_pnl:.2f} USDT"
+
+        if signal and self.leverage_ready:
+            if check_liquidity(current_price, POSITION_SIZE, symbol=symbol, side=signal):
+                place_order(signal, current_price, POSITION_SIZE, symbol=symbol)
+            else:
+                logging.warning(f"Ордер {symbol} не размещен: недостаточно ликвидности")
+        rsi_text = f"{rsi:.1f}" if rsi is not None else "-"
+        return f"{symbol}: {current_price}, RSI {rsi_text}, сигнал {signal if signal else 'нет'}"
+
+def _parse_positions(response):
+    """Ответ get_positions -> {symbol: (qty, side, entry_price)} для открытых позиций."""
+    result = {}
+    for pos in response['result']['list']:
+        if pos['side'] in ["Buy", "Sell"] and float(pos['size']) > 0:
+            result[pos['symbol']] = (float(pos['size']), pos['side'], float(pos['entryPrice']))
+    return result
+
+# Общий снимок рынка для всех символов: три REST-запроса независимо от числа символов
+async def fetch_market_snapshot_async():
+    requests_map = {
+        "tickers": run_blocking(session.get_tickers, category="linear"),
+        "balance": check_balance_async(),
+    }
+    # Позиции берутся из состояния счёта, если приватный WebSocket актуален
+    if not account_state_ready():
+        requests_map["positions"] = run_blocking(session.get_positions, category="linear", settleCoin="USDT")
+    return await gather_dict(requests_map)
+
+def set_multi_symbols(symbols):
+    """Включение мультисимвольного режима для списка символов (пустой список — выключение)."""
+    global MULTI_SYMBOLS
+    MULTI_SYMBOLS = list(dict.fromkeys(symbols))
+    for symbol in list(symbol_workers):
+        if symbol not in MULTI_SYMBOLS:
+            del symbol_workers[symbol]
+    if MULTI_SYMBOLS:
+        send_telegram_message(f"🔀 Мультисимвольный режим: {', '.join(MULTI_SYMBOLS)}")
+    else:
+        send_telegram_message("🔀 Мультисимвольный режим выключен")
+
+def run_multi_symbol_cycle():
+    """Цикл по всем символам MULTI_SYMBOLS. Возвращает False, если торговлю нужно остановить."""
+    global ws
+    if ws is None:
+        ws = start_websocket(symbol=MULTI_SYMBOLS[0])
+        if ws is None:
+            send_telegram_message("⚠️ Не удалось запустить WebSocket.")
+            return True
+    for symbol in MULTI_SYMBOLS:
+        if symbol not in symbol_workers:
+            symbol_workers[symbol] = SymbolWorker(symbol)
+        subscribe_ticker(symbol)
+        subscribe_orderbook(symbol)
+
+    snapshot = run_sync(fetch_market_snapshot_async())
+    if "positions" not in snapshot:
+        snapshot["positions"] = None
+    if isinstance(snapshot["tickers"], Exception) or isinstance(snapshot["positions"], Exception):
+        error_msg = "⚠️ Не удалось получить цены или позиции для мультисимвольного режима"
+        print(error_msg)
+        send_telegram_message(error_msg, priority=PRIORITY_STATUS, coalesce_key="multi_summary")
+        return True
+    prices = {t['symbol']: float(t['lastPrice']) for t in snapshot["tickers"]['result']['list']}
+    open_positions = account_state.open_positions() if snapshot["positions"] is None else _parse_positions(snapshot["positions"])
+    with positions_lock:
+        tracked = set(MULTI_SYMBOLS) | set(positions)
+    for symbol in tracked:
+        sync_local_position(symbol, *open_positions.get(symbol, (0, None, 0)))
+
+    # Максимальный убыток считается по всем символам вместе
+    unrealized_total = 0
+    for symbol, (qty, side, entry_price) in open_positions.items():
+        price = prices.get(symbol, entry_price)
+        unrealized_total += (price - entry_price) * qty if side == "Buy" else (entry_price - price) * qty
+    total_pnl_current = total_pnl + unrealized_total
+    if total_pnl_current < 0 and abs(total_pnl_current) > initial_balance * MAX_LOSS_PCT:
+        error_msg = f"⚠️ Достигнут максимальный убыток {MAX_LOSS_PCT*100}%: {abs(total_pnl_current):.2f} USDT"
+        logging.error(error_msg)
+        wait_for_orders([
+            close_position(side, qty, prices.get(symbol, entry_price), entry_price, symbol=symbol)
+            for symbol, (qty, side, entry_price) in open_positions.items()
+        ])
+        send_telegram_message(error_msg, priority=PRIORITY_CRITICAL)
+        return False
+
+    # Символы обрабатываются параллельно: время цикла определяется самым медленным символом
+    futures = {
+        symbol: symbol_executor.submit(symbol_workers[symbol].evaluate, prices.get(symbol), open_positions.get(symbol, (0, None, 0)))
+        for symbol in MULTI_SYMBOLS
+    }
+    lines = []
+    for symbol, future in futures.items():
+        try:
+            lines.append(future.result())
+        except Exception as e:
+            logging.error(f"Ошибка стратегии {symbol}: {e}")
+            lines.append(f"{symbol}: ошибка")
+    summary = (
+        f"🔀 Символов: {len(MULTI_SYMBOLS)}, открытых позиций: {len(open_positions)}\n"
+        + "\n".join(lines)
+        + f"\n💰 Баланс: {snapshot['balance']:.2f} USDT, "
+        f"текущий PnL: {total_pnl_current:.2f} USDT"
+    )
+    print(summary)
+    # Сводка уходит в Telegram, только если закрылась новая свеча хотя бы по одному символу
+    if any(symbol_workers[symbol].fresh for symbol in futures if symbol in symbol_workers):
+        send_telegram_message(summary, priority=PRIORITY_STATUS, coalesce_key="multi_summary")
+    return True
+
+# Один цикл стратегии для выбранной монеты. Возвращает False, если торговлю нужно остановить
+def run_trading_cycle(symbol):
+    global ws
+    if ws is None:
+        ws = start_websocket(symbol=symbol)
+        if ws is None:
+            error_msg = "⚠️ Не удалось запустить WebSocket."
+            print(error_msg)
+            send_telegram_message(error_msg)
+            return True
+
+    subscribe_ticker(symbol)
+    subscribe_klines(symbol)
+    subscribe_orderbook(symbol)
+    # Свечи, позиция, цена и баланс запрашиваются параллельно (стакан — локальный, из WebSocket)
+    snapshot = fetch_cycle_snapshot(symbol)
+    df = snapshot["klines"] if not isinstance(snapshot["klines"], Exception) else None
+    current_price = snapshot["price"]
+    if df is not None and current_price is not None:
+        latest_5 = df.tail(5)
+        candles_summary = "\n📅 Последние 5 свечей (5-минутный таймфрейм):\n" + latest_5.to_string()
+        print(candles_summary)
+
+        position_qty, position_side, entry_price = snapshot["position"]
+        sync_local_position(symbol, position_qty, position_side, entry_price)
+        current_balance = snapshot["balance"]
+        with positions_lock:
+            invested_total = sum(pos["invested"] for pos in positions.values())
+        unrealized_pnl = 0
+        if position_qty > 0:
+            unrealized_pnl = (current_price - entry_price) * position_qty if position_side == "Buy" else (entry_price - current_price) * position_qty
+            position_summary = (
+                f"\n📋 Открытая позиция ({symbol}):\n"
+                f"  Символ: {symbol}\n"
+                f"  Сторона: {position_side}\n"
+                f"  Цена входа: {entry_price} USDT\n"
+                f"  Текущая цена: {current_price} USDT\n"
+                f"  Объем: {position_qty}\n"
+                f"  Вложено: {invested_total:.2f} USDT\n"
+                f"  Нереализованный PnL: {unrealized_pnl:.2f} USDT"
+            )
+            print(position_summary)
+        else:
+            position_summary = f"\n📋 Открытых позиций нет ({symbol})."
+            print(position_summary)
+
+        total_pnl_current = total_pnl + unrealized_pnl
+        status_summary = (
+            f"\n💰 Статус счета:\n"
+            f"  Текущий баланс: {current_balance:.2f} USDT\n"
+            f"  Вложено в позиции: {invested_total:.2f} USDT\n"
+            f"  Текущий PnL: {total_pnl_current:.2f} USDT\n"
+            f"  Общий PnL: {total_pnl:.2f} USDT"
+        )
+        print(status_summary)
+
+        signal = None
+        closed = closed_candles(df)
+        evaluation, fresh = evaluate_closed_candles(symbol, closed)
+        if evaluation is not None:
+            rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern, signal = evaluation
+            latest_indicators.update({
+                "rsi": rsi, "ema_fast": ema_fast, "ema_slow": ema_slow, "atr": atr,
+                "macd": macd_line, "signal_line": signal_line, "candle_pattern": candle_pattern, "signal": signal
+            })
+            # Сводка по свече отправляется один раз — после её закрытия
+            if fresh:
+                engine = indicator_engines.get(symbol)
+                # ATR и свечи те же, что у оценённого сигнала — без формирующейся свечи
+                atr_window = engine.atr_window(closed.last_timestamp) if engine is not None else None
+                with metrics.timer("ai_assist"):
+                    adjusted_rsi_threshold = ai_assist(closed, base_rsi_threshold=55, atr_window=atr_window)
+                indicator_summary = (
+                    f"\n📊 Текущие индикаторы ({symbol}):\n"
+                    f"  RSI: {rsi:.2f} (скорректированный порог: {adjusted_rsi_threshold})\n"
+                    f"  EMA12: {ema_fast:.2f}\n"
+                    f"  EMA26: {ema_slow:.2f}\n"
+                    f"  ATR: {atr:.2f}\n"
+                    f"  MACD: {macd_line:.2f}\n"
+                    f"  Signal: {signal_line:.2f}\n"
+                    f"  Свечной паттерн: {candle_pattern if candle_pattern else 'Не обнаружен'}"
+                )
+                print(indicator_summary)
+                signal_msg = f"📡 Сигнал: {signal if signal else 'Нет сигнала'}"
+                print(signal_msg)
+                send_telegram_message(indicator_summary + "\n" + signal_msg + "\n" + position_summary + status_summary,
+                                      priority=PRIORITY_STATUS, coalesce_key="cycle_summary")
+        else:
+            error_msg = "⚠️ Не удалось рассчитать индикаторы"
+            print(error_msg)
+            send_telegram_message(error_msg, priority=PRIORITY_STATUS, coalesce_key="cycle_summary")
+
+        if position_qty > 0:
+            if total_pnl_current < 0 and abs(total_pnl_current) > initial_balance * MAX_LOSS_PCT:
+                error_msg = f"⚠️ Достигнут максимальный убыток {MAX_LOSS_PCT*100}%: {abs(total_pnl_current):.2f} USDT"
+                logging.error(error_msg)
+                wait_for_orders([close_position(position_side, position_qty, current_price, entry_price, symbol=symbol)])
+                send_telegram_message(error_msg, priority=PRIORITY_CRITICAL)
+                return False
+            if position_side == "Buy":
+                if current_price <= entry_price * (1 - STOP_LOSS_PCT) or current_price >= entry_price * (1 + TAKE_PROFIT_PCT):
+                    close_position(position_side, position_qty, current_price, entry_price, symbol=symbol)
+            else:
+                if current_price >= entry_price * (1 + STOP_LOSS_PCT) or current_price <= entry_price * (1 - TAKE_PROFIT_PCT):
+                    close_position(position_side, position_qty, current_price, entry_price, symbol=symbol)
+
+        if signal and position_qty == 0:
+            if check_liquidity(current_price, POSITION_SIZE, symbol=symbol, side=signal):
+                place_order(signal, current_price, POSITION_SIZE, symbol=symbol)
+            else:
+                liquidity_msg = "⚠️ Ордер не размещен: недостаточно ликвидности"
+                print(liquidity_msg)
+                send_telegram_message(liquidity_msg)
+        else:
+            status_msg = "Ордер не размещен: нет сигнала или открыта позиция"
+            print(status_msg)
+    else:
+        error_msg = f"⚠️ Не удалось получить свечи или цену для {symbol}"
+        print(error_msg)
+        send_telegram_message(error_msg, priority=PRIORITY_STATUS, coalesce_key="cycle_summary")
+    return True
+
 # Основная торговая функция
-def trading_loop():
+def trading_loop(startup=None, started_at=None):
+    """
+    Args:
+        startup: результаты bootstrap() (баланс и топ волатильных монет берутся оттуда)
+        started_at: time.perf_counter() запуска процесса — для времени до первой оценки сигнала
+    """
     global initial_balance, total_pnl, positions, SELECTED_SYMBOL, ws, TOP_VOLATILE_COINS
-    initial_balance = check_balance()
+    startup = startup or {}
+    initial_balance = startup_result(startup, "balance", check_balance)
     if initial_balance < POSITION_SIZE * 10000:
         error_msg = "⚠️ Недостаточно средств на балансе. Пополните USDT на testnet или переведите в Derivatives."
         logging.error(error_msg)
@@ -1079,12 +1488,15 @@ def trading_loop():
         "/closeall - Закрыть все позиции\n"
         "/status - Показать текущий статус\n"
         "/showchart - Показать график свечей\n"
-        "/refreshcoins - Обновить список волатильных монет"
+        "/refreshcoins - Обновить список волатильных монет\n"
+        "/multitrade [SYMBOL ...] - Торговать несколькими монетами (по умолчанию топ волатильных)\n"
+        "/singletrade - Вернуться к торговле одной монетой\n"
+        "/perf - Задержки этапов цикла и REST-запросов"
     )
     send_telegram_message(commands_message)
 
-    # Получаем топ-5 волатильных монет
-    TOP_VOLATILE_COINS = get_top_volatile_coins()
+    # Топ-5 волатильных монет
+    TOP_VOLATILE_COINS = startup_result(startup, "volatile_coins", get_top_volatile_coins)
     if TOP_VOLATILE_COINS:
         coin_list = "\n".join([f"{i+1}. {symbol} - {volatility:.2f}%" for i, (symbol, volatility) in enumerate(TOP_VOLATILE_COINS)])
         selection_message = (
@@ -1101,201 +1513,296 @@ def trading_loop():
     else:
         send_telegram_message("⚠️ Не удалось получить список волатильных монет. Используйте /refreshcoins для повторной попытки.")
 
-    last_update = 0
+    if TRADING_SYMBOLS:
+        set_multi_symbols([symbol for symbol, _ in TOP_VOLATILE_COINS] if TRADING_SYMBOLS == ["TOP"] else TRADING_SYMBOLS)
+
+    # Оценка сигнала по закрытию свечи (событие из WebSocket или расписание по времени биржи),
+    # SL/TP — по каждому тику; без событий поток спит в ожидании очереди до следующего закрытия
+    scheduler = CandleCloseScheduler(KLINE_INTERVAL, offset=CANDLE_CLOSE_OFFSET, clock=server_clock)
+    last_evaluation = 0
     try:
         while True:
-            current_time = time.time()
-            if current_time - last_update >= UPDATE_INTERVAL:
-                # Проверяем, выбрана ли монета
-                if SELECTED_SYMBOL is None:
-                    last_update = current_time
-                    continue
-
-                if ws is None:
-                    ws = start_websocket(symbol=SELECTED_SYMBOL)
-                    if ws is None:
-                        error_msg = "⚠️ Не удалось запустить WebSocket."
-                        print(error_msg)
-                        send_telegram_message(error_msg)
-                        last_update = current_time
-                        continue
-
-                df = get_klines(symbol=SELECTED_SYMBOL)
-                if df is not None:
-                    latest_5 = df.tail(5)
-                    candles_summary = "\n📅 Последние 5 свечей (5-минутный таймфрейм):\n" + latest_5.to_string(index=False)
-                    print(candles_summary)
-
-                    rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern = calculate_indicators(df)
-                    if rsi is not None and ema_fast is not None and ema_slow is not None and \
-                       atr is not None and macd_line is not None and signal_line is not None:
-                        adjusted_rsi_threshold = ai_assist(df, base_rsi_threshold=55)
-                        indicator_summary = (
-                            f"\n📊 Текущие индикаторы ({SELECTED_SYMBOL}):\n"
-                            f"  RSI: {rsi:.2f} (скорректированный порог: {adjusted_rsi_threshold})\n"
-                            f"  EMA12: {ema_fast:.2f}\n"
-                            f"  EMA26: {ema_slow:.2f}\n"
-                            f"  ATR: {atr:.2f}\n"
-                            f"  MACD: {macd_line:.2f}\n"
-                            f"  Signal: {signal_line:.2f}\n"
-                            f"  Свечной паттерн: {candle_pattern if candle_pattern else 'Не обнаружен'}"
-                        )
-                        print(indicator_summary)
-                        latest_indicators["rsi"] = rsi
-                        latest_indicators["ema_fast"] = ema_fast
-                        latest_indicators["ema_slow"] = ema_slow
-                        latest_indicators["atr"] = atr
-                        latest_indicators["macd"] = macd_line
-                        latest_indicators["signal_line"] = signal_line
-                        latest_indicators["candle_pattern"] = candle_pattern
-                        signal = generate_signal(rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern)
-                        latest_indicators["signal"] = signal
-                        signal_msg = f"📡 Сигнал: {signal if signal else 'Нет сигнала'}"
-                        print(signal_msg)
-                        send_telegram_message(indicator_summary + "\n" + signal_msg + "\n" + position_summary + status_summary)
-                    else:
-                        error_msg = "⚠️ Не удалось рассчитать индикаторы"
-                        print(error_msg)
-                        send_telegram_message(error_msg)
-
-                    position_qty, position_side, entry_price = check_position(symbol=SELECTED_SYMBOL)
-                    current_price = float(session.get_tickers(category="linear", symbol=SELECTED_SYMBOL)['result']['list'][0]['lastPrice'])
-                    invested_total = sum(pos["invested"] for pos in positions.values()) if positions else 0
-                    unrealized_pnl = 0
-                    if position_qty > 0:
-                        unrealized_pnl = (current_price - entry_price) * position_qty if position_side == "Buy" else (entry_price - current_price) * position_qty
-                        position_summary = (
-                            f"\n📋 Открытая позиция ({SELECTED_SYMBOL}):\n"
-                            f"  Символ: {SELECTED_SYMBOL}\n"
-                            f"  Сторона: {position_side}\n"
-                            f"  Цена входа: {entry_price} USDT\n"
-                            f"  Текущая цена: {current_price} USDT\n"
-                            f"  Объем: {position_qty}\n"
-                            f"  Вложено: {invested_total:.2f} USDT\n"
-                            f"  Нереализованный PnL: {unrealized_pnl:.2f} USDT"
-                        )
-                        print(position_summary)
-                    else:
-                        position_summary = f"\n📋 Открытых позиций нет ({SELECTED_SYMBOL})."
-                        print(position_summary)
-
-                    total_pnl_current = total_pnl + unrealized_pnl
-                    current_balance = check_balance()
-                    status_summary = (
-                        f"\n💰 Статус счета:\n"
-                        f"  Текущий баланс: {current_balance:.2f} USDT\n"
-                        f"  Вложено в позиции: {invested_total:.2f} USDT\n"
-                        f"  Текущий PnL: {total_pnl_current:.2f} USDT\n"
-                        f"  Общий PnL: {total_pnl:.2f} USDT"
-                    )
-                    print(status_summary)
-
-                    if position_qty > 0:
-                        if total_pnl_current < 0 and abs(total_pnl_current) > initial_balance * MAX_LOSS_PCT:
-                            error_msg = f"⚠️ Достигнут максимальный убыток {MAX_LOSS_PCT*100}%: {abs(total_pnl_current):.2f} USDT"
-                            logging.error(error_msg)
-                            close_position(position_side, position_qty, current_price, entry_price, symbol=SELECTED_SYMBOL)
-                            send_telegram_message(error_msg)
-                            break
-                        if position_side == "Buy":
-                            if current_price <= entry_price * (1 - STOP_LOSS_PCT) or current_price >= entry_price * (1 + TAKE_PROFIT_PCT):
-                                close_position(position_side, position_qty, current_price, entry_price, symbol=SELECTED_SYMBOL)
-                        else:
-                            if current_price >= entry_price * (1 + STOP_LOSS_PCT) or current_price <= entry_price * (1 - TAKE_PROFIT_PCT):
-                                close_position(position_side, position_qty, current_price, entry_price, symbol=SELECTED_SYMBOL)
-
-                    if signal and position_qty == 0:
-                        if check_liquidity(current_price, POSITION_SIZE, symbol=SELECTED_SYMBOL):
-                            place_order(signal, current_price, POSITION_SIZE, symbol=SELECTED_SYMBOL)
-                        else:
-                            liquidity_msg = "⚠️ Ордер не размещен: недостаточно ликвидности"
-                            print(liquidity_msg)
-                            send_telegram_message(liquidity_msg)
-                    else:
-                        status_msg = "Ордер не размещен: нет сигнала или открыта позиция"
-                        print(status_msg)
+            evaluate = False
+            stop = False
+            # Первая оценка — сразу после запуска, не дожидаясь событий
+            timeout = min(UPDATE_INTERVAL, scheduler.seconds_until_due()) if last_evaluation else 0
+            for event, payload in wait_engine_events(timeout=timeout):
+                if event == "tick":
+                    with metrics.timer("tick"):
+                        stop = not handle_tick(payload)
+                    if stop:
+                        break
+                elif event == "kline_closed":
+                    evaluate = evaluate or payload in (MULTI_SYMBOLS or [SELECTED_SYMBOL])
+                else:
+                    evaluate = apply_engine_command(event, payload) or evaluate
+            if stop:
+                break
+            # Оценка по расписанию (закрытие свечи из WebSocket не пришло) или тики по открытой позиции перестали приходить
+            now = time.time()
+            if scheduler.due() or \
+               (positions and now - last_tick_time > UPDATE_INTERVAL and now - last_evaluation > UPDATE_INTERVAL):
+                evaluate = True
+            if evaluate:
+                if MULTI_SYMBOLS:
+                    with metrics.timer("multi_cycle"):
+                        keep_trading = run_multi_symbol_cycle()
+                elif SELECTED_SYMBOL is not None:
+                    with metrics.timer("cycle"):
+                        keep_trading = run_trading_cycle(SELECTED_SYMBOL)
                 else:
-                    error_msg = f"⚠️ Не удалось получить свечи для {SELECTED_SYMBOL}"
-                    print(error_msg)
-                    send_telegram_message(error_msg)
-                last_update = current_time
-
-            # Проверка новых сообщений и callback-запросов в Telegram
-            updates = get_telegram_updates()
-            logging.info(f"Проверка новых сообщений Telegram: {updates}")
-            if updates:
-                for update in updates:
-                    if 'message' in update and 'text' in update['message']:
-                        message = update['message']['text']
-                        if handle_telegram_commands(message):
-                            continue
-
-            time.sleep(1)
+                    keep_trading = True
+                if not last_evaluation and started_at is not None and (MULTI_SYMBOLS or SELECTED_SYMBOL):
+                    time_to_signal = time.perf_counter() - started_at
+                    metrics.observe("time_to_first_signal", time_to_signal)
+                    logging.info(f"Первая оценка сигнала через {time_to_signal:.2f} с после запуска")
+                last_evaluation = time.time()
+                scheduler.advance()
+                server_clock.maybe_sync()
+                if not keep_trading:
+                    break
     except KeyboardInterrupt:
         logging.info("Программа остановлена пользователем")
-        if ws is not None:
-            ws.exit()
+    finally:
+        shutdown_trading()
+
+# Остановка торговли (в т.ч. по максимальному убытку): сделки ордеров в работе попадают в журнал до его закрытия,
+# уведомления (включая сообщение об остановке) — в Telegram до выхода процесса
+def shutdown_trading():
+    wait_for_orders(order_gateway.active_tickets())
+    trade_journal.close()
+    if ws is not None:
+        ws.exit()
+    telegram_outbox.flush(timeout=5)
+
+# Ожидание событий торгового цикла
+def wait_engine_events(timeout):
+    """Ждёт первое событие не дольше timeout секунд и возвращает его вместе со всеми накопившимися."""
+    try:
+        events = [engine_events.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while True:
+        try:
+            events.append(engine_events.get_nowait())
+        except queue.Empty:
+            return events
 
-# Основная функция
-def main():
-    send_telegram_message("🔔 Бот запущен! Проверка уведомлений.")
-    trading_loop()
+# Применение команд из Telegram в торговом цикле. Возвращает True, если нужна немедленная оценка сигнала
+def apply_engine_command(command, payload):
+    global SELECTED_SYMBOL
+    try:
+        logging.info(f"Команда торговому циклу: {command} {payload}")
+        if command == "close_all":
+            close_all_positions()
+        elif command == "select_symbol":
+            SELECTED_SYMBOL = payload
+            return True
+        elif command == "multi_symbols":
+            set_multi_symbols(payload)
+            return True
+        else:
+            logging.warning(f"Неизвестная команда торговому циклу: {command}")
+    except Exception as e:
+        logging.error(f"Ошибка при выполнении команды {command}: {e}")
+    return False
+
+# Проверка открытой позиции по тику. Возвращает False, если достигнут максимальный убыток
+def handle_tick(symbol):
+    pending_ticks.discard(symbol)
+    current_price = latest_prices.get(symbol)
+    with positions_lock:
+        position = positions.get(symbol)
+        if position is None or current_price is None:
+            return True
+        side, qty, entry_price = position["side"], position["qty"], position["entry_price"]
+        position["unrealized_pnl"] = (current_price - entry_price) * qty if side == "Buy" else (entry_price - current_price) * qty
+        total_pnl_current = total_pnl + sum(pos.get("unrealized_pnl", 0) for pos in positions.values())
+        open_positions = [(pos_symbol, dict(pos)) for pos_symbol, pos in positions.items()]
+
+    if total_pnl_current < 0 and abs(total_pnl_current) > initial_balance * MAX_LOSS_PCT:
+        error_msg = f"⚠️ Достигнут максимальный убыток {MAX_LOSS_PCT*100}%: {abs(total_pnl_current):.2f} USDT"
+        logging.error(error_msg)
+        # Ожидание — без блокировки: обработчики закрытий обновляют позиции под ней
+        wait_for_orders([
+            close_position(pos["side"], pos["qty"], latest_prices.get(pos_symbol, pos["entry_price"]), pos["entry_price"], symbol=pos_symbol)
+            for pos_symbol, pos in open_positions
+        ])
+        send_telegram_message(error_msg, priority=PRIORITY_CRITICAL)
+        return False
+
+    if side == "Buy":
+        exit_hit = current_price <= entry_price * (1 - STOP_LOSS_PCT) or current_price >= entry_price * (1 + TAKE_PROFIT_PCT)
+    else:
+        exit_hit = current_price >= entry_price * (1 + STOP_LOSS_PCT) or current_price <= entry_price * (1 - TAKE_PROFIT_PCT)
+    # После неудачной попытки закрытия не повторяем ордер на каждом тике
+    if exit_hit and time.time() - position.get("close_attempt", 0) >= 5:
+        position["close_attempt"] = time.time()
+        logging.info(f"SL/TP по тику {symbol}: цена {current_price}, вход {entry_price}")
+        close_position(side, qty, current_price, entry_price, symbol=symbol)
+    return True
+
+# Сверка локальной позиции (для проверок по тикам) с позицией на бирже
+def sync_local_position(symbol, qty, side, entry_price):
+    with positions_lock:
+        if qty > 0:
+            position = positions.setdefault(symbol, {"invested": qty * entry_price})
+            position.update({"side": side, "qty": qty, "entry_price": entry_price})
+        else:
+            positions.pop(symbol, None)
 
-def ai_assist(df, base_rsi_threshold=55):
+def reconcile_position(symbol):
+    """Сверка локальной позиции с биржей через REST, когда исполнение ордера не подтвердилось."""
+    response = session.get_positions(category="linear", symbol=symbol)
+    qty, side, entry_price = _parse_positions(response).get(symbol, (0, None, 0))
+    sync_local_position(symbol, qty, side, entry_price)
+    logging.info(f"Позиция {symbol} сверена с биржей: {side or 'нет'} {qty} @ {entry_price}")
+
+# Цикл приёма сообщений Telegram (отдельный поток, не блокирует торговый цикл)
+def telegram_polling_loop():
+    while True:
+        poll_started = time.time()
+        updates = get_telegram_updates()
+        for update in updates:
+            try:
+                if "callback_query" in update:
+                    logging.info(f"Получен callback: {update['callback_query']['data']}")
+                    handle_telegram_callback(update["callback_query"])
+                elif 'message' in update and 'text' in update['message']:
+                    handle_telegram_commands(update['message']['text'])
+            except Exception as e:
+                logging.error(f"Ошибка при обработке обновления Telegram: {e}")
+        if not updates and time.time() - poll_started < 1:
+            time.sleep(1)  # Long poll вернулся сразу (например, ошибка сети) — не крутим цикл вхолостую
+
+def start_telegram_polling():
+    global telegram_thread
+    if telegram_thread is None or not telegram_thread.is_alive():
+        telegram_thread = threading.Thread(target=telegram_polling_loop, name="telegram", daemon=True)
+        telegram_thread.start()
+    return telegram_thread
+
+# Загрузка истории свечей символов параллельно (буферы и потоковые индикаторы)
+def preload_history(symbols):
+    buffers = list(symbol_executor.map(get_kline_buffer, symbols))
+    return {buffer.symbol: len(buffer) for buffer in buffers}
+
+def start_trade_journal():
+    migrate_trades_log()
+    trade_journal.start()
+    return True
+
+BOOTSTRAP_WORKERS = 8
+
+def bootstrap():
     """
-    Динамически корректирует пороговые значения RSI на основе волатильности (ATR).
-    Args:
-        df: DataFrame с данными свечей
-        base_rsi_threshold: Базовый порог RSI (по умолчанию 55)
+    Параллельная подготовка к торговле: инструменты и плечо, баланс, рейтинг волатильности,
+    приватный WebSocket, история свечей торгуемых символов и журнал сделок.
     Returns:
-        Корректированный порог RSI
+        {задача: результат}; если задача завершилась ошибкой — исключение вместо результата
     """
-    try:
-        if len(df) < 14:
-            logging.warning("Недостаточно данных для расчета ATR в ai_assist")
-            return base_rsi_threshold
-        
-        atr_series = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14).average_true_range()
-        if atr_series.isna().all():
-            logging.warning("ATR содержит NaN, используется базовый порог RSI")
-            return base_rsi_threshold
-        
-        latest_atr = float(atr_series.iloc[-1])
-        avg_atr = atr_series[-14:].mean()
-        
-        # Корректировка порога RSI
-        if latest_atr > avg_atr * 1.2:  # Если ATR выше среднего на 20%
-            adjusted_rsi = base_rsi_threshold - 5
-            logging.info(f"Высокая волатильность (ATR: {latest_atr:.2f}, среднее: {avg_atr:.2f}), RSI порог снижен до {adjusted_rsi}")
-            return max(30, adjusted_rsi)  # Не опускаем ниже 30
-        elif latest_atr < avg_atr * 0.8:  # Если ATR ниже среднего на 20%
-            adjusted_rsi = base_rsi_threshold + 5
-            logging.info(f"Низкая волатильность (ATR: {latest_atr:.2f}, среднее: {avg_atr:.2f}), RSI порог увеличен до {adjusted_rsi}")
-            return min(70, adjusted_rsi)  # Не поднимаем выше 70
-        else:
-            logging.info(f"Волатильность в норме (ATR: {latest_atr:.2f}, среднее: {avg_atr:.2f}), используется базовый RSI порог {base_rsi_threshold}")
-            return base_rsi_threshold
-    except Exception as e:
-        logging.error(f"Ошибка в ai_assist: {e}")
-        return base_rsi_threshold
+    started = time.perf_counter()
+    timings = {}  # задача -> (собственная длительность, готова через столько секунд от начала)
+
+    def timed(name, func, *args, wait_for=()):
+        def run():
+            for future in wait_for:
+                future.exception()  # Ждём зависимость; её ошибка не отменяет задачу
+            task_started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+                timings[name] = (finished - task_started, finished - started)
+                metrics.observe(f"startup_{name}", finished - task_started)
+        return run
+
+    with ThreadPoolExecutor(max_workers=BOOTSTRAP_WORKERS, thread_name_prefix="bootstrap") as pool:
+        futures = {}
+        futures["instruments"] = pool.submit(timed("instruments", instruments.all))
+        # Плечо ограничивается максимумом инструмента — после загрузки инструментов
+        futures["leverage"] = pool.submit(timed("leverage", set_symbol_leverage, SYMBOL, wait_for=[futures["instruments"]]))
+        futures["balance"] = pool.submit(timed("balance", check_balance))
+        futures["volatile_coins"] = pool.submit(timed("volatile_coins", get_top_volatile_coins))
+        futures["account_stream"] = pool.submit(timed("account_stream", start_account_stream))
+        futures["trade_journal"] = pool.submit(timed("trade_journal", start_trade_journal))
+        futures["server_time"] = pool.submit(timed("server_time", server_clock.sync))
+        if TRADING_SYMBOLS == ["TOP"]:
+            futures["history"] = pool.submit(timed(
+                "history", lambda: preload_history([symbol for symbol, _ in futures["volatile_coins"].result()]),
+                wait_for=[futures["volatile_coins"]]
+            ))
+        elif TRADING_SYMBOLS:
+            futures["history"] = pool.submit(timed("history", preload_history, TRADING_SYMBOLS))
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logging.error(f"Ошибка подготовки к торговле ({name}): {e}")
+                results[name] = e
+
+    total = time.perf_counter() - started
+    metrics.observe("startup", total)
+    lines = [f"  {name:15s} {duration:6.2f} с, готово через {ready:6.2f} с"
+             for name, (duration, ready) in sorted(timings.items(), key=lambda item: item[1][1])]
+    report = (f"⏱ Подготовка к торговле за {total:.2f} с "
+              f"(последовательно было бы {sum(duration for duration, _ in timings.values()):.2f} с):\n" + "\n".join(lines))
+    print(report)
+    logging.info(report)
+    return results
+
+def startup_result(startup, name, fallback):
+    """Результат задачи bootstrap(); если её не было или она завершилась ошибкой — fallback()."""
+    result = startup.get(name)
+    if result is None or isinstance(result, Exception):
+        return fallback()
+    return result
+
+# Основная функция
+def main():
+    started_at = time.perf_counter()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    # Проверка версии Python
+    if sys.version_info.major == 3 and sys.version_info.minor >= 13:
+        logging.warning("Python 3.13 не поддерживается. Используйте Python 3.12 или ниже и создайте новое виртуальное окружение: /opt/homebrew/bin/python3.12 -m venv venv")
+    if not init_clients():
+        return 1
+    send_telegram_message("🔔 Бот запущен! Проверка уведомлений.")
+    if METRICS_PORT:
+        start_metrics_server(metrics, port=METRICS_PORT)
+    startup = bootstrap()
+    if startup["leverage"] is not True:
+        return 1
+    # Периодическое обновление кэшей после первой загрузки
+    volatile_coins_cache.start()
+    instruments.start()
+    start_telegram_polling()
+    trading_loop(startup, started_at=started_at)
+    return 0
 
 # Новая функция для ИИ-анализа
 def perform_ai_analysis(symbol):
     try:
-        # Получаем данные свечей
-        df = get_klines(symbol=symbol)
+        # Получаем данные свечей из буфера (подписка нужна, чтобы повторный анализ не ходил в REST)
+        subscribe_klines(symbol)
+        with request_class("analysis"):
+            df = get_klines(symbol=symbol)
         if df is None or len(df) < 200:
             return f"⚠️ Недостаточно данных для анализа {symbol}"
 
         # Рассчитываем индикаторы
-        rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern = calculate_indicators(df)
+        rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern = get_indicators(symbol, df)
         if any(v is None for v in [rsi, ema_fast, ema_slow, atr]):
             return f"⚠️ Не удалось рассчитать индикаторы для {symbol}"
 
         # Формируем анализ
         rsi_status = "перепродан" if rsi < 30 else "перекуплен" if rsi > 70 else "нейтрально"
         ema_status = "выше" if ema_fast > ema_slow else "ниже"
-        atr_avg = df.tail(14)['high'].astype(float).mean() - df.tail(14)['low'].astype(float).mean()
+        atr_avg = df.tail(14)['high'].mean() - df.tail(14)['low'].mean()
         atr_status = "высокая" if atr > atr_avg else "низкая"
         
         market_outlook = ""
@@ -1338,7 +1845,7 @@ def handle_telegram_callback(callback_query):
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/answerCallbackQuery"
         payload = {"callback_query_id": callback_id}
-        requests.post(url, json=payload)
+        telegram_outbox.session.post(url, json=payload, timeout=10)
     except Exception as e:
         logging.error(f"Ошибка при отправке ответа на callback: {e}")
 
@@ -1346,9 +1853,8 @@ def handle_telegram_callback(callback_query):
         symbol = callback_data.replace("coin_", "")
         perform_ai_analysis(symbol)
     elif callback_data.startswith("trade_"):
-        global SELECTED_SYMBOL
         symbol = callback_data.replace("trade_", "")
-        SELECTED_SYMBOL = symbol
+        engine_events.put(("select_symbol", symbol))
         send_telegram_message(f"✅ Монета для торговли выбрана: {symbol}")
     elif callback_data == "back":
         if TOP_VOLATILE_COINS:
@@ -1368,4 +1874,4 @@ def handle_telegram_callback(callback_query):
             send_telegram_message("⚠️ Список волатильных монет пуст. Используйте /refreshcoins для обновления.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(main())
\ No newline at end of file
@@ -0,0 +1,149 @@
+import numpy as np
+
+# Свечные паттерны в порядке приоритета detect_candle_patterns:
+# бит i маски соответствует PATTERN_NAMES[i]
+PATTERN_NAMES = (
+    "Doji",
+    "Bullish Engulfing",
+    "Bearish Engulfing",
+    "Hammer",
+    "Shooting Star",
+    "Morning Star",
+    "Bullish Harami",
+    "Bearish Harami",
+    "Piercing Line",
+    "Dark Pool Cover",
+    "Three White Soldiers",
+    "Three Black Crows",
+    "Bullish Kicker",
+    "Bearish Kicker",
+    "Inverted Hammer",
+    "Hanging Man",
+)
+PATTERN_BITS = {name: 1 << i for i, name in enumerate(PATTERN_NAMES)}
+
+def _shift(values, periods):
+    """Сдвиг массива вправо с заполнением NaN (аналог Series.shift)."""
+    shifted = np.empty_like(values)
+    shifted[:periods] = np.nan
+    shifted[periods:] = values[:-periods]
+    return shifted
+
+def scan_candle_patterns(open_, high, low, close):
+    """
+    Векторный поиск всех паттернов по всей истории за один проход.
+    Args:
+        open_, high, low, close: массивы OHLC в хронологическом порядке
+    Returns:
+        np.ndarray[uint32]: битовая маска паттернов для каждой свечи; свеча i
+        оценивается так же, как detect_candle_patterns оценил бы df[:i + 1]
+    """
+    o = np.asarray(open_, dtype=np.float64)
+    h = np.asarray(high, dtype=np.float64)
+    l = np.asarray(low, dtype=np.float64)
+    c = np.asarray(close, dtype=np.float64)
+    n = len(c)
+    mask = np.zeros(n, dtype=np.uint32)
+    if n < 2:
+        return mask
+
+    # Предыдущая (prev) и третья с конца (first) свечи
+    po, ph, pl, pc = _shift(o, 1), _shift(h, 1), _shift(l, 1), _shift(c, 1)
+    fo, fh, fl, fc = _shift(o, 2), _shift(h, 2), _shift(l, 2), _shift(c, 2)
+    has_prev = np.arange(n) >= 1
+    has_three = np.arange(n) >= 2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        body = np.abs(c - o)
+        body_prev = np.abs(pc - po)
+        body_first = np.abs(fc - fo)
+        rng = h - l
+        rng_prev = ph - pl
+        body_ratio = body / rng
+        body_ratio_prev = body_prev / rng_prev
+
+        bull, bear = c > o, c < o
+        bull_prev, bear_prev = pc > po, pc < po
+        bull_first, bear_first = fc > fo, fc < fo
+
+        lower_shadow = np.where(bull, o - l, c - l)
+        upper_shadow = np.where(bull, h - c, h - o)
+        small_body = body_ratio < 0.2
+
+        # Верхние тени для Three White Soldiers и нижние для Three Black Crows
+        upper_prev = np.where(bull_prev, ph - pc, ph - po)
+        upper_first = np.where(bull_first, fh - fc, fh - fo)
+        lower = np.where(bear, o - l, c - l)
+        lower_prev = np.where(bear_prev, po - pl, pc - pl)
+        lower_first = np.where(bear_first, fo - fl, fc - fl)
+
+        conditions = (
+            # Doji
+            (body_ratio < 0.1) & (body < 0.1 * rng_prev),
+            # Bullish Engulfing
+            bear_prev & bull & (o < pc) & (c > po) & (body > body_prev),
+            # Bearish Engulfing
+            bull_prev & bear & (o > pc) & (c < po) & (body > body_prev),
+            # Hammer
+            (lower_shadow >= 2 * body) & small_body & bull,
+            # Shooting Star
+            (upper_shadow >= 2 * body) & small_body & bear,
+            # Morning Star
+            has_three & bear_first & (body_ratio_prev < 0.1) & bull & (c > (fo + fc) / 2),
+            # Bullish Harami
+            bear_prev & bull & (o >= pc) & (c <= po),
+            # Bearish Harami
+            bull_prev & bear & (o <= pc) & (c >= po),
+            # Piercing Line
+            bear_prev & bull & (o < pl) & (c > (po + pc) / 2),
+            # Dark Pool Cover
+            bull_prev & bear & (o > ph) & (c < (po + pc) / 2),
+            # Three White Soldiers
+            has_three & bull_first & bull_prev & bull & (pc > fc) & (c > pc) &
+            (upper_first / body_first < 0.1) & (upper_prev / body_prev < 0.1) & (upper_shadow / body < 0.1),
+            # Three Black Crows
+            has_three & bear_first & bear_prev & bear & (pc < fc) & (c < pc) &
+            (lower_first / body_first < 0.1) & (lower_prev / body_prev < 0.1) & (lower / body < 0.1),
+            # Bullish Kicker
+            bear_prev & bull & (o > pc),
+            # Bearish Kicker
+            bull_prev & bear & (o < pc),
+            # Inverted Hammer
+            (upper_shadow >= 2 * body) & small_body & ((l - np.minimum(o, c)) < 0.1 * body),
+            # Hanging Man (до этого не было нисходящего тренда по двум предыдущим свечам)
+            has_three & (lower_shadow >= 2 * body) & small_body &
+            ((np.maximum(o, c) - h) < 0.1 * body) & ~((fc + pc) / 2 < (fo + po) / 2),
+        )
+
+    for bit, condition in enumerate(conditions):
+        mask |= (condition & has_prev).astype(np.uint32) << np.uint32(bit)
+    return mask
+
+def first_pattern_index(mask):
+    """Индекс паттерна с наивысшим приоритетом для каждой свечи (-1, если паттерна нет)."""
+    mask = np.asarray(mask, dtype=np.int64)
+    lowest = mask & -mask
+    index = np.full(mask.shape, -1, dtype=np.int64)
+    nonzero = lowest > 0
+    index[nonzero] = np.log2(lowest[nonzero]).astype(np.int64)
+    return index
+
+def pattern_names(mask):
+    """Список всех паттернов, закодированных в маске одной свечи."""
+    mask = int(mask)
+    return [name for i, name in enumerate(PATTERN_NAMES) if mask & (1 << i)]
+
+def first_pattern(mask):
+    """Паттерн с наивысшим приоритетом в маске одной свечи или None."""
+    names = pattern_names(mask)
+    return names[0] if names else None
+
+# Функция для поиска свечных паттернов
+def detect_candle_patterns(df):
+    """Поиск свечных паттернов по последней свече (первый найденный по приоритету)."""
+    if len(df) < 2:
+        return None
+    # Паттерны смотрят не дальше чем на две свечи назад; df — DataFrame или kline_buffer.Candles
+    tail = df.tail(3)
+    mask = scan_candle_patterns(*(np.asarray(tail[name]) for name in ('open', 'high', 'low', 'close')))
+    return first_pattern(mask[-1])
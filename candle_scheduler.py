@@ -0,0 +1,112 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Оценка стратегии по закрытию свечи: моменты запуска выровнены по границам
+# таймфрейма по времени биржи (смещение локальных часов измеряется по
+# /v5/market/time), а результаты оценки запоминаются по (символ, метка
+# последней закрытой свечи, подтверждённой биржей) — повторные циклы внутри
+# одной свечи ничего не пересчитывают.
+
+CLOSE_OFFSET = 2.0  # Секунд после закрытия свечи: закрытая свеча успевает прийти из WebSocket
+CLOCK_SYNC_INTERVAL = 900  # Секунд между измерениями смещения часов
+CLOCK_SAMPLES = 3  # Запросов на измерение; берётся самый быстрый (наименьшая погрешность)
+MEMO_SIZE = 1024  # Записей в кэше оценок (по одной на символ и свечу)
+
+class ServerClock:
+    """Время биржи: локальные часы плюс смещение, измеренное по get_server_time."""
+
+    def __init__(self, session=None, sync_interval=CLOCK_SYNC_INTERVAL):
+        self.session = session
+        self.sync_interval = sync_interval
+        self.offset = 0.0  # Секунды: время биржи минус локальное
+        self.rtt = None
+        self.synced_at = None
+
+    def sync(self, samples=CLOCK_SAMPLES):
+        """Измерение смещения; погрешность не больше половины времени ответа самого быстрого запроса."""
+        best = None
+        for _ in range(samples):
+            sent = time.time()
+            response = self.session.get_server_time()
+            received = time.time()
+            server_time = int(response['result']['timeNano']) / 1e9
+            rtt = received - sent
+            if best is None or rtt < best[0]:
+                best = (rtt, server_time - (sent + received) / 2)
+        self.rtt, self.offset = best
+        self.synced_at = time.time()
+        logging.info(f"Смещение часов относительно биржи: {self.offset * 1000:+.1f} мс (RTT {self.rtt * 1000:.1f} мс)")
+        return self.offset
+
+    def maybe_sync(self):
+        """Повторное измерение, если прошлое устарело; ошибки только логируются."""
+        if self.session is None or (self.synced_at is not None and time.time() - self.synced_at < self.sync_interval):
+            return
+        try:
+            self.sync()
+        except Exception as e:
+            self.synced_at = time.time()  # Не повторяем запрос на каждом цикле
+            logging.error(f"Ошибка синхронизации времени с биржей: {e}")
+
+    def now(self):
+        return time.time() + self.offset
+
+class CandleCloseScheduler:
+    """Моменты оценки: закрытие каждой свечи таймфрейма плюс offset секунд по времени биржи."""
+
+    def __init__(self, interval_minutes, offset=CLOSE_OFFSET, clock=None):
+        self.interval = interval_minutes * 60
+        self.offset = offset
+        self.clock = clock or ServerClock()
+        self.next_due = self._next_after(self.clock.now())
+
+    def _next_after(self, now):
+        last_due = (now - self.offset) // self.interval * self.interval + self.offset
+        return last_due + self.interval
+
+    def due(self):
+        return self.clock.now() >= self.next_due
+
+    def seconds_until_due(self):
+        return max(0.0, self.next_due - self.clock.now())
+
+    def advance(self):
+        """
+        После оценки: следующий момент — закрытие текущей свечи плюс offset. Оценка сразу после
+        закрытия (по событию WebSocket) засчитывает и плановую; пропущенные закрытия не накапливаются.
+        """
+        now = self.clock.now()
+        self.next_due = now // self.interval * self.interval + self.interval + self.offset
+
+class CandleMemo:
+    """Результаты оценки по (символ, метка последней закрытой свечи) с вытеснением давно не использованных."""
+
+    def __init__(self, maxsize=MEMO_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, symbol, timestamp, compute):
+        """
+        Returns:
+            (значение, fresh) — fresh=True, если значение только что посчитано.
+            None от compute() не запоминается: следующий вызов посчитает заново.
+        """
+        key = (symbol, timestamp)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key], False
+            self.misses += 1
+        value = compute()
+        if value is not None:
+            with self._lock:
+                self._items[key] = value
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+        return value, True
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import logging
+import threading
+import numpy as np
+from kline_buffer import KLINE_COLUMNS, parse_klines
+
+# Локальное хранилище истории свечей: для каждой пары (символ, таймфрейм)
+# отдельный каталог с файлом на колонку (float64, только дозапись) и meta.json.
+# Хранятся только закрытые свечи; синхронизация запрашивает у биржи лишь
+# недостающий диапазон, пропуски дозапрашиваются, а не заполняются ffill.
+
+CANDLE_STORE_DIR = "candle_store"
+KLINE_PAGE_LIMIT = 1000  # Максимум свечей в одном ответе get_kline
+
+class CandleSeries:
+    """Колоночный файл свечей одного символа и таймфрейма."""
+
+    def __init__(self, root, symbol, interval):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = int(interval) * 60 * 1000
+        self.path = os.path.join(root, f"{symbol}_{interval}")
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self.meta = self._load_meta()
+        self._truncate_to_meta()
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.f8")
+
+    def _load_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json"), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"count": 0, "first_timestamp": None, "last_timestamp": None, "requested_from": None, "gaps": []}
+
+    def _save_meta(self):
+        # Запись через временный файл и rename, чтобы meta.json не был прочитан наполовину
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def _truncate_to_meta(self):
+        """Отбрасываем хвост колонок, дописанный до сбоя, но не зафиксированный в meta.json."""
+        size = self.meta["count"] * 8
+        for name in KLINE_COLUMNS:
+            column_path = self._column_path(name)
+            if os.path.exists(column_path) and os.path.getsize(column_path) > size:
+                with open(column_path, "r+b") as f:
+                    f.truncate(size)
+
+    def __len__(self):
+        return self.meta["count"]
+
+    @property
+    def last_timestamp(self):
+        return self.meta["last_timestamp"]
+
+    @property
+    def first_timestamp(self):
+        return self.meta["first_timestamp"]
+
+    def read(self, limit=None):
+        """Колонки в хронологическом порядке как memmap (без копирования); limit — последние N свечей."""
+        count = self.meta["count"]
+        start = 0 if limit is None else max(0, count - limit)
+        if count == 0 or start >= count:
+            return {name: np.empty(0) for name in KLINE_COLUMNS}
+        return {
+            name: np.memmap(self._column_path(name), dtype=np.float64, mode='r', offset=start * 8, shape=(count - start,))
+            for name in KLINE_COLUMNS
+        }
+
+    def append(self, rows):
+        """Дозапись закрытых свечей (n, 7); принимаются только свечи новее последней."""
+        if self.meta["last_timestamp"] is not None:
+            rows = rows[rows[:, 0] > self.meta["last_timestamp"]]
+        if len(rows) == 0:
+            return 0
+        for i, name in enumerate(KLINE_COLUMNS):
+            with open(self._column_path(name), "ab") as f:
+                f.write(np.ascontiguousarray(rows[:, i]).tobytes())
+        if self.meta["first_timestamp"] is None:
+            self.meta["first_timestamp"] = int(rows[0, 0])
+        self.meta["last_timestamp"] = int(rows[-1, 0])
+        self.meta["count"] += len(rows)
+        self._save_meta()
+        return len(rows)
+
+    def rewrite(self, rows):
+        """Полная перезапись серии (нужна только при догрузке истории старше первой свечи)."""
+        for i, name in enumerate(KLINE_COLUMNS):
+            tmp_path = self._column_path(name) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(np.ascontiguousarray(rows[:, i]).tobytes())
+            os.replace(tmp_path, self._column_path(name))
+        self.meta["count"] = len(rows)
+        self.meta["first_timestamp"] = int(rows[0, 0]) if len(rows) else None
+        self.meta["last_timestamp"] = int(rows[-1, 0]) if len(rows) else None
+        self._save_meta()
+
+    def find_gaps(self):
+        """Пропуски внутри сохранённой истории: список (последняя свеча до пропуска, первая после)."""
+        timestamps = self.read()["timestamp"]
+        if len(timestamps) < 2:
+            return []
+        breaks = np.flatnonzero(np.diff(timestamps) != self.interval_ms)
+        return [(int(timestamps[i]), int(timestamps[i + 1])) for i in breaks]
+
+class CandleStore:
+    """Хранилище свечей с инкрементальной синхронизацией через session.get_kline."""
+
+    def __init__(self, session, root=CANDLE_STORE_DIR):
+        self.session = session
+        self.root = root
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def series(self, symbol, interval):
+        key = (symbol, str(interval))
+        with self._lock:
+            if key not in self._series:
+                self._series[key] = CandleSeries(self.root, symbol, interval)
+            return self._series[key]
+
+    def _fetch_range(self, symbol, interval, start, end):
+        """Загрузка свечей [start, end] постранично (по KLINE_PAGE_LIMIT свечей)."""
+        interval_ms = int(interval) * 60 * 1000
+        pages = []
+        cursor = start
+        while cursor <= end:
+            page_end = min(end, cursor + (KLINE_PAGE_LIMIT - 1) * interval_ms)
+            response = self.session.get_kline(
+                category="linear",
+                symbol=symbol,
+                interval=interval,
+                start=cursor,
+                end=page_end,
+                limit=KLINE_PAGE_LIMIT
+            )
+            pages.extend(response['result']['list'])
+            cursor = page_end + interval_ms
+        return parse_klines(pages)
+
+    def _fill_gaps(self, symbol, interval, rows, start):
+        """Повторный запрос пропущенных свечей; то, чего нет и на бирже, записывается в meta как пропуск."""
+        interval_ms = int(interval) * 60 * 1000
+        if len(rows) == 0:
+            return rows, []
+        expected = np.concatenate(([start - interval_ms], rows[:, 0]))
+        breaks = np.flatnonzero(np.diff(expected) != interval_ms)
+        if len(breaks) == 0:
+            return rows, []
+        refetched = [rows]
+        for i in breaks:
+            gap_start, gap_end = int(expected[i]) + interval_ms, int(expected[i + 1]) - interval_ms
+            logging.warning(f"Пропуск свечей {symbol} ({interval}): {gap_start}-{gap_end}, повторный запрос")
+            refetched.append(self._fetch_range(symbol, interval, gap_start, gap_end))
+        rows = parse_klines(np.concatenate(refetched).tolist())
+        expected = np.concatenate(([start - interval_ms], rows[:, 0]))
+        still_missing = [
+            (int(expected[i]) + interval_ms, int(expected[i + 1]) - interval_ms)
+            for i in np.flatnonzero(np.diff(expected) != interval_ms)
+        ]
+        for gap in still_missing:
+            logging.warning(f"Свечи {symbol} ({interval}) отсутствуют на бирже: {gap[0]}-{gap[1]}")
+        return rows, still_missing
+
+    def sync(self, symbol, interval, min_candles=500, include_current=True):
+        """
+        Догружает недостающие закрытые свечи и возвращает текущую (незакрытую) свечу.
+        Args:
+            min_candles: сколько закрытых свечей должно быть в истории
+            include_current: запрашивать текущую свечу; при False и актуальной истории запросов нет
+        Returns:
+            np.ndarray (7,) с текущей свечой или None
+        """
+        series = self.series(symbol, interval)
+        interval_ms = series.interval_ms
+        now = int(time.time() * 1000)
+        current_start = now - now % interval_ms
+        wanted_first = current_start - min_candles * interval_ms
+        with series.lock:
+            current = None
+            requested_from = series.meta.get("requested_from")
+            # Догрузка истории старше первой сохранённой свечи (перезапись серии)
+            if series.first_timestamp is not None and (requested_from is None or wanted_first < requested_from) \
+                    and series.first_timestamp > wanted_first:
+                older = self._fetch_range(symbol, interval, wanted_first, series.first_timestamp - interval_ms)
+                older, gaps = self._fill_gaps(symbol, interval, older, wanted_first)
+                series.meta["gaps"].extend(gaps)
+                if len(older):
+                    existing = np.column_stack([np.asarray(series.read()[name]) for name in KLINE_COLUMNS])
+                    series.rewrite(np.concatenate([older, existing]))
+            if requested_from is None or wanted_first < requested_from:
+                series.meta["requested_from"] = wanted_first
+            start = wanted_first if series.last_timestamp is None else series.last_timestamp + interval_ms
+            end = current_start if include_current else current_start - interval_ms
+            if start <= end:
+                rows = self._fetch_range(symbol, interval, start, end)
+                if len(rows) and rows[-1, 0] == current_start:
+                    current, rows = rows[-1], rows[:-1]
+                rows, gaps = self._fill_gaps(symbol, interval, rows, start)
+                series.meta["gaps"].extend(gaps)
+                appended = series.append(rows)
+                if not appended:
+                    series._save_meta()
+                else:
+                    logging.info(f"Хранилище свечей {symbol} ({interval}): дописано {appended}, всего {len(series)}")
+        return current
+
+    def tail(self, symbol, interval, limit, current=None):
+        """Последние limit свечей (включая текущую, если передана) массивом (n, 7)."""
+        data = self.series(symbol, interval).read(limit=limit)
+        rows = np.column_stack([np.asarray(data[name]) for name in KLINE_COLUMNS]) if len(data['timestamp']) else np.empty((0, len(KLINE_COLUMNS)))
+        if current is not None:
+            rows = np.vstack([rows, current])[-limit:]
+        return rows
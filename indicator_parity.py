@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from ta.momentum import RSIIndicator
+from ta.trend import EMAIndicator, MACD
+from ta.volatility import AverageTrueRange
+from array_indicators import ema, rsi, average_true_range, macd
+from streaming_indicators import IndicatorEngine
+
+# Проверка совпадения собственных индикаторов с библиотекой ta на случайном
+# блуждании: потоковый движок (текущая и предыдущая закрытая свеча) и версии
+# на массивах numpy. Расхождение больше допуска — AssertionError. Запускается
+# отдельно (python indicator_parity.py) и перед замерами benchmark.py.
+
+RTOL = 1e-9
+ATOL = 1e-9
+INDICATORS = ('RSI', 'EMA12', 'EMA26', 'ATR', 'MACD', 'Signal')  # Порядок IndicatorEngine.values()
+
+def sample_candles(n=1000, seed=42):
+    """(high, low, close) случайного блуждания."""
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    high = close + rng.uniform(0, 1, n)
+    low = close - rng.uniform(0, 1, n)
+    return high, low, close
+
+def reference_indicators(high, low, close):
+    """Эталонные значения ta на всей истории."""
+    df = pd.DataFrame({'high': high, 'low': low, 'close': close})
+    macd_obj = MACD(close=df['close'], window_slow=26, window_fast=12, window_sign=9)
+    return {
+        'RSI': RSIIndicator(close=df['close'], window=14).rsi().to_numpy(),
+        'EMA12': EMAIndicator(close=df['close'], window=12).ema_indicator().to_numpy(),
+        'EMA26': EMAIndicator(close=df['close'], window=26).ema_indicator().to_numpy(),
+        'ATR': AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14).average_true_range().to_numpy(),
+        'MACD': macd_obj.macd().to_numpy(),
+        'Signal': macd_obj.macd_signal().to_numpy(),
+    }
+
+def array_values(high, low, close):
+    macd_line, signal_line = macd(close)
+    return {
+        'RSI': rsi(close), 'EMA12': ema(close, 12), 'EMA26': ema(close, 26),
+        'ATR': average_true_range(high, low, close), 'MACD': macd_line, 'Signal': signal_line,
+    }
+
+def streaming_values(high, low, close):
+    """
+    Значения IndicatorEngine: каждая свеча приходит тремя обновлениями (два промежуточных и финальное).
+    Returns:
+        (значения текущей свечи после финального обновления, значения свечи как предыдущей закрытой —
+        после первого обновления следующей)
+    """
+    n = len(close)
+    engine = IndicatorEngine()
+    current = {name: np.full(n, np.nan) for name in INDICATORS}
+    closed = {name: np.full(n, np.nan) for name in INDICATORS}
+    for i in range(n + 1):
+        if i < n:
+            engine.update(i, high[i] + 5, low[i] - 5, close[i] + 3)
+        if i > 0:
+            values = engine.values(i - 1)
+            if values is not None:
+                for name, value in zip(INDICATORS, values):
+                    closed[name][i - 1] = value
+        if i == n:
+            break
+        engine.update(i, high[i], low[i], close[i] - 2)
+        engine.update(i, high[i], low[i], close[i])
+        values = engine.values()
+        if values is not None:
+            for name, value in zip(INDICATORS, values):
+                current[name][i] = value
+    return current, closed
+
+def assert_parity(label, expected, actual, defined_from=0):
+    """
+    Сравнение с эталоном; AssertionError при расхождении больше RTOL/ATOL или разных NaN.
+    defined_from: с какой свечи actual определён (values() движка — None, пока истории меньше 26 свечей).
+    Returns:
+        {индикатор: максимальное расхождение}
+    """
+    diffs = {}
+    for name in INDICATORS:
+        want, got = expected[name][defined_from:], actual[name][defined_from:]
+        assert np.array_equal(np.isnan(want), np.isnan(got)), f"{label} {name}: NaN не совпадают с ta"
+        diffs[name] = float(np.nanmax(np.abs(want - got)))
+        assert np.allclose(want, got, rtol=RTOL, atol=ATOL, equal_nan=True), \
+            f"{label} {name}: расхождение с ta {diffs[name]:.2e}"
+    return diffs
+
+def check(n=1000, seed=42):
+    """Все проверки. Returns: {реализация: {индикатор: максимальное расхождение}}."""
+    high, low, close = sample_candles(n, seed)
+    expected = reference_indicators(high, low, close)
+    current, closed = streaming_values(high, low, close)
+    # values() движка появляются, когда определены все индикаторы (MACD signal — с 34-й свечи)
+    defined_from = int(np.argmax(~np.isnan(current['Signal'])))
+    return {
+        "numpy": assert_parity("numpy", expected, array_values(high, low, close)),
+        "streaming": assert_parity("streaming", expected, current, defined_from),
+        "streaming closed": assert_parity("streaming closed", expected, closed, defined_from),
+    }
+
+# Проверка совпадения с библиотекой ta: python indicator_parity.py
+def main():
+    try:
+        results = check()
+    except AssertionError as e:
+        print(f"ОШИБКА: {e}")
+        return 1
+    for label, diffs in results.items():
+        print(f"{label}: " + ", ".join(f"{name} {diff:.2e}" for name, diff in diffs.items()))
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,84 @@
+import logging
+from decimal import Decimal, ROUND_DOWN
+from swr_cache import StaleWhileRevalidateCache
+
+# Локальный индекс параметров инструментов Bybit (шаг цены, шаг и минимум объёма,
+# максимальное плечо). Загружается один раз через get_instruments_info, хранится
+# в файле и обновляется в фоне; проверка символа и нормализация ордера — поиск в словаре.
+
+INSTRUMENTS_CACHE_FILE = "instruments_cache.json"
+INSTRUMENTS_CACHE_TTL = 24 * 3600
+
+def fetch_instruments(session, category="linear"):
+    """Все инструменты категории (постранично): {symbol: {tick_size, qty_step, min_qty, max_qty, max_leverage, status}}."""
+    instruments = {}
+    cursor = None
+    while True:
+        params = {"category": category, "limit": 1000}
+        if cursor:
+            params["cursor"] = cursor
+        result = session.get_instruments_info(**params)['result']
+        for item in result['list']:
+            instruments[item['symbol']] = {
+                "tick_size": float(item['priceFilter']['tickSize']),
+                "qty_step": float(item['lotSizeFilter']['qtyStep']),
+                "min_qty": float(item['lotSizeFilter']['minOrderQty']),
+                "max_qty": float(item['lotSizeFilter']['maxOrderQty']),
+                "max_leverage": float(item['leverageFilter']['maxLeverage']),
+                "status": item.get('status', 'Trading'),
+            }
+        cursor = result.get('nextPageCursor')
+        if not cursor:
+            break
+    logging.info(f"Загружены параметры {len(instruments)} инструментов")
+    return instruments
+
+def round_to_step(value, step):
+    """Округление вниз до шага (через Decimal, без ошибок двоичной арифметики)."""
+    step = Decimal(str(step))
+    return float((Decimal(str(value)) / step).to_integral_value(rounding=ROUND_DOWN) * step)
+
+def format_decimal(value):
+    """Число для параметров API без экспоненциальной записи (1e-05 -> "0.00001")."""
+    return format(Decimal(str(value)).normalize(), 'f')
+
+class InstrumentsCache:
+    """Индекс инструментов по символу с фоновым обновлением и сохранением на диск."""
+
+    def __init__(self, session, path=INSTRUMENTS_CACHE_FILE, ttl=INSTRUMENTS_CACHE_TTL, category="linear"):
+        self._cache = StaleWhileRevalidateCache(
+            path, lambda: fetch_instruments(session, category), ttl=ttl, name="instruments"
+        )
+
+    def start(self):
+        self._cache.start()
+
+    def all(self):
+        instruments, age = self._cache.get()
+        return instruments or {}
+
+    def get(self, symbol):
+        """Параметры инструмента или None, если символ неизвестен."""
+        return self.all().get(symbol)
+
+    def is_tradable(self, symbol):
+        instrument = self.get(symbol)
+        return instrument is not None and instrument["status"] == "Trading"
+
+    def normalize_qty(self, symbol, qty):
+        """Объём, округлённый вниз до шага; 0, если он меньше минимального. Без данных — qty как есть."""
+        instrument = self.get(symbol)
+        if instrument is None:
+            return qty
+        qty = round_to_step(min(qty, instrument["max_qty"]), instrument["qty_step"])
+        return qty if qty >= instrument["min_qty"] else 0.0
+
+    def normalize_price(self, symbol, price):
+        instrument = self.get(symbol)
+        if instrument is None:
+            return price
+        return round_to_step(price, instrument["tick_size"])
+
+    def max_leverage(self, symbol, default=None):
+        instrument = self.get(symbol)
+        return instrument["max_leverage"] if instrument is not None else default
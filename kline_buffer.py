@@ -0,0 +1,195 @@
+import threading
+import time
+import logging
+import numpy as np
+
+# Порядок колонок совпадает с ответом Bybit get_kline / kline WebSocket
+KLINE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover')
+KLINE_INDEX = {name: i for i, name in enumerate(KLINE_COLUMNS)}
+
+def parse_klines(klines):
+    """Список свечей Bybit (строки, новые первыми) -> массив (n, 7), отсортированный по времени без дубликатов."""
+    if not len(klines):
+        return np.empty((0, len(KLINE_COLUMNS)))
+    rows = np.array(klines, dtype=np.float64).reshape(-1, len(KLINE_COLUMNS))
+    rows = rows[~np.isnan(rows).any(axis=1)]
+    # Сортировка по времени и удаление дубликатов (оставляем последнюю запись)
+    rows = rows[np.argsort(rows[:, 0], kind='stable')]
+    if len(rows):
+        rows = rows[np.append(rows[1:, 0] != rows[:-1, 0], True)]
+    return rows
+
+# Колонки значений, которые хранятся в памяти (turnover стратегии не нужен)
+VALUE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+class Candles:
+    """Свечи одного символа без DataFrame: метки времени int64 и непрерывный массив значений (k, n).
+
+    Поддерживает то, что нужно стратегии от DataFrame: len(), candles['close'],
+    tail(n). Метки времени — миллисекунды; точность значений задаётся dtype
+    массива (float32 в кэше рыночных данных). confirmed_timestamp — метка
+    последней окончательной свечи (confirm из WebSocket), None — неизвестно.
+    """
+
+    __slots__ = ('timestamps', 'values', 'columns', 'confirmed_timestamp')
+
+    def __init__(self, timestamps, values, columns=VALUE_COLUMNS, confirmed_timestamp=None):
+        self.timestamps = timestamps
+        self.values = values
+        self.columns = columns
+        self.confirmed_timestamp = confirmed_timestamp
+
+    @classmethod
+    def from_klines(cls, klines, columns=VALUE_COLUMNS, dtype=np.float64):
+        """Из ответа Bybit get_kline (строки, новые первыми)."""
+        return cls.from_rows(parse_klines(klines), columns=columns, dtype=dtype)
+
+    @classmethod
+    def from_rows(cls, rows, columns=VALUE_COLUMNS, dtype=np.float64):
+        """Из массива (n, 7) в порядке KLINE_COLUMNS, отсортированного по времени."""
+        values = np.ascontiguousarray(rows[:, [KLINE_INDEX[name] for name in columns]].T, dtype=dtype)
+        return cls(rows[:, 0].astype(np.int64), values, tuple(columns))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, name):
+        if name == 'timestamp':
+            return self.timestamps
+        return self.values[self.columns.index(name)]
+
+    def _slice(self, index):
+        return Candles(self.timestamps[index], self.values[:, index], self.columns, self.confirmed_timestamp)
+
+    def tail(self, n):
+        return self._slice(slice(-n, None))
+
+    def closed(self, interval_ms, now_ms):
+        """Только закрытые к моменту now_ms свечи (без текущей формирующейся)."""
+        return self._slice(slice(None, np.searchsorted(self.timestamps, now_ms - interval_ms, side='right')))
+
+    @property
+    def last_timestamp(self):
+        return int(self.timestamps[-1]) if len(self) else None
+
+    @property
+    def final(self):
+        """Все свечи окончательные: последняя подтверждена биржей и больше не изменится."""
+        return self.confirmed_timestamp is not None and len(self) > 0 and self.last_timestamp <= self.confirmed_timestamp
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.values.nbytes
+
+    def to_string(self):
+        """Таблица свечей (время UTC и OHLCV) для вывода в консоль."""
+        lines = [f"{'timestamp':19s} {'open':>12s} {'high':>12s} {'low':>12s} {'close':>12s} {'volume':>14s}"]
+        for ts, o, h, l, c, v in zip(*(self[name].tolist() for name in KLINE_COLUMNS[:6])):
+            moment = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts / 1000))
+            lines.append(f"{moment:19s} {o:12.6g} {h:12.6g} {l:12.6g} {c:12.6g} {v:14.6g}")
+        return "\n".join(lines)
+
+class KlineRingBuffer:
+    """Кольцевой буфер свечей фиксированной ёмкости для одного символа.
+
+    Заполняется один раз через REST (load), затем обновляется по одной свече
+    из kline WebSocket (update) за O(1). Метки времени хранятся в массиве int64,
+    значения — в одном массиве numpy формы (k, capacity) заданной точности,
+    поэтому чтение не требует сортировки и удаления дубликатов.
+    """
+
+    def __init__(self, symbol, interval=5, capacity=500, dtype=np.float64, columns=VALUE_COLUMNS):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = int(interval) * 60 * 1000
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        self._source = [KLINE_INDEX[name] for name in self.columns]  # Позиции колонок в строке свечи
+        self._times = np.zeros(capacity, dtype=np.int64)
+        self._data = np.zeros((len(self.columns), capacity), dtype=dtype)
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.needs_resync = True  # Требуется REST-загрузка (старт или пропуск свечей)
+        self.last_update = 0.0
+        self.confirmed_timestamp = None  # Метка последней окончательной свечи
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._times.nbytes + self._data.nbytes
+
+    @property
+    def last_timestamp(self):
+        if self._size == 0:
+            return None
+        return int(self._times[(self._start + self._size - 1) % self.capacity])
+
+    def load(self, klines):
+        """Полная загрузка буфера из списка свечей Bybit (новые первыми, строки)."""
+        self.load_rows(parse_klines(klines))
+
+    def load_rows(self, rows):
+        """Полная загрузка буфера из массива (n, 7), отсортированного по времени."""
+        rows = rows[-self.capacity:]
+        with self._lock:
+            self._times[:len(rows)] = rows[:, 0]
+            self._data[:, :len(rows)] = rows[:, self._source].T
+            self._start = 0
+            self._size = len(rows)
+            self.needs_resync = False
+            self.last_update = time.time()
+            # Свечи истории, закрытые к моменту загрузки, окончательные
+            closed = rows[:, 0][rows[:, 0] + self.interval_ms <= self.last_update * 1000]
+            self.confirmed_timestamp = int(closed[-1]) if len(closed) else None
+        logging.info(f"Буфер свечей {self.symbol}: загружено {len(rows)} свечей")
+
+    def update(self, timestamp, open_, high, low, close, volume, turnover=0.0, confirmed=False):
+        """Обновление текущей свечи или добавление новой (confirmed — свеча закрыта). Возвращает True, если свеча принята."""
+        timestamp = int(timestamp)
+        row = (timestamp, open_, high, low, close, volume, turnover)
+        with self._lock:
+            last_ts = self.last_timestamp
+            if last_ts is not None and timestamp < last_ts:
+                return False  # Устаревшее сообщение
+            if last_ts is not None and timestamp == last_ts:
+                idx = (self._start + self._size - 1) % self.capacity
+            else:
+                if last_ts is not None and timestamp != last_ts + self.interval_ms:
+                    logging.warning(f"Буфер свечей {self.symbol}: пропуск свечей между {last_ts} и {timestamp}")
+                    self.needs_resync = True
+                idx = (self._start + self._size) % self.capacity
+                if self._size < self.capacity:
+                    self._size += 1
+                else:
+                    self._start = (self._start + 1) % self.capacity
+            self._times[idx] = timestamp
+            self._data[:, idx] = [row[i] for i in self._source]
+            self.last_update = time.time()
+            if confirmed:
+                self.confirmed_timestamp = timestamp
+        return True
+
+    def _ordered_index(self):
+        if self._start + self._size <= self.capacity:
+            return slice(self._start, self._start + self._size)
+        return (self._start + np.arange(self._size)) % self.capacity
+
+    def arrays(self):
+        """Возвращает словарь колонок в хронологическом порядке (копии), включая timestamp."""
+        with self._lock:
+            index = self._ordered_index()
+            result = {'timestamp': self._times[index].copy()}
+            data = self._data[:, index].copy()
+        result.update({name: data[i] for i, name in enumerate(self.columns)})
+        return result
+
+    def candles(self):
+        """Снимок буфера в хронологическом порядке (копия, значения — одним непрерывным массивом)."""
+        with self._lock:
+            index = self._ordered_index()
+            # Явная копия: без переполнения индекс — срез, и ascontiguousarray вернул бы вид живого буфера
+            return Candles(self._times[index].copy(), self._data[:, index].copy(), self.columns,
+                           self.confirmed_timestamp)
@@ -0,0 +1,143 @@
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from kline_buffer import KlineRingBuffer, VALUE_COLUMNS
+
+# Кэш рыночных данных по (символ, таймфрейм): кольцевые буферы свечей с
+# колонками заданной точности (по умолчанию float32, без turnover) и общим
+# бюджетом памяти. При превышении бюджета вытесняются давно не использованные
+# символы, кроме закреплённых (выбранный, торгуемые, с открытой позицией), —
+# просмотр всех волатильных монет не увеличивает память процесса без предела.
+
+BUDGET_MB = 32  # Общий бюджет буферов свечей
+DTYPE = 'float32'  # Точность значений свечей: float32 или float64
+
+class MarketDataCache:
+    """Буферы свечей по (символ, таймфрейм) с LRU-вытеснением по общему бюджету памяти."""
+
+    def __init__(self, capacity=500, budget_bytes=int(BUDGET_MB * 1024 * 1024), dtype=DTYPE,
+                 columns=VALUE_COLUMNS, keep=None, on_evict=None):
+        """
+        Args:
+            capacity: свечей в буфере на символ
+            budget_bytes: общий объём массивов всех буферов
+            dtype: точность значений свечей (метки времени всегда int64)
+            keep: keep(symbol) -> True для символов, которые нельзя вытеснять
+            on_evict: on_evict(symbol, interval) после вытеснения буфера
+        """
+        self.capacity = capacity
+        self.budget_bytes = budget_bytes
+        self.dtype = np.dtype(dtype)
+        self.columns = tuple(columns)
+        self.keep = keep or (lambda symbol: False)
+        self.on_evict = on_evict
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def peek(self, symbol, interval):
+        """Буфер без учёта обращения (для обновлений из WebSocket); None, если вытеснен или не создан."""
+        return self._buffers.get((symbol, interval))
+
+    def get(self, symbol, interval):
+        """
+        Returns:
+            (буфер, created) — created=True, если буфер только что создан и пуст.
+        """
+        key = (symbol, interval)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is not None:
+                self._buffers.move_to_end(key)
+                self.hits += 1
+                return buffer, False
+            self.misses += 1
+            buffer = KlineRingBuffer(symbol, interval=interval, capacity=self.capacity,
+                                     dtype=self.dtype, columns=self.columns)
+            self._buffers[key] = buffer
+            self.nbytes += buffer.nbytes
+            evicted = self._evict(keep_key=key)
+        for evicted_symbol, evicted_interval in evicted:
+            if self.on_evict is not None:
+                self.on_evict(evicted_symbol, evicted_interval)
+        return buffer, True
+
+    def _evict(self, keep_key):
+        """Вытеснение давно не использованных буферов сверх бюджета (вызывается под блокировкой)."""
+        evicted = []
+        for key in list(self._buffers):
+            if self.nbytes <= self.budget_bytes:
+                break
+            if key == keep_key or self.keep(key[0]):
+                continue
+            buffer = self._buffers.pop(key)
+            self.nbytes -= buffer.nbytes
+            self.evictions += 1
+            evicted.append(key)
+            logging.info(f"Кэш свечей: вытеснен {key[0]} ({key[1]} мин)")
+        if self.nbytes > self.budget_bytes:
+            logging.warning(f"Кэш свечей: закреплённые символы занимают {self.nbytes / 1024 / 1024:.1f} МБ "
+                            f"при бюджете {self.budget_bytes / 1024 / 1024:.1f} МБ")
+        return evicted
+
+    def stats(self):
+        """Счётчики обращений и занятая память."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._buffers),
+                "bytes": self.nbytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else None,
+            }
+
+# Проверка вытеснения и объёма памяти: python market_data_cache.py
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    capacity = 500
+    per_symbol = {name: KlineRingBuffer("X", capacity=capacity, dtype=name).nbytes for name in ("float64", "float32")}
+    print(f"Буфер на символ ({capacity} свечей): float64 {per_symbol['float64'] / 1024:.1f} КБ, "
+          f"float32 {per_symbol['float32'] / 1024:.1f} КБ")
+
+    pinned = {"BTCUSDT"}
+    evicted = []
+    cache = MarketDataCache(capacity=capacity, budget_bytes=per_symbol['float32'] * 10,
+                            keep=lambda symbol: symbol in pinned,
+                            on_evict=lambda symbol, interval: evicted.append(symbol))
+    cache.get("BTCUSDT", 5)
+    for i in range(100):
+        cache.get(f"COIN{i}USDT", 5)
+        cache.get("COIN0USDT", 5)  # Часто используемый символ остаётся в кэше
+    stats = cache.stats()
+    print(f"Символов: {stats['entries']}, память {stats['bytes'] / 1024:.1f} КБ, "
+          f"попаданий {stats['hits']}, промахов {stats['misses']}, вытеснено {stats['evictions']}")
+    ok = (stats['bytes'] <= stats['budget_bytes'] and cache.peek("BTCUSDT", 5) is not None
+          and cache.peek("COIN0USDT", 5) is not None and cache.peek("COIN1USDT", 5) is None
+          and len(evicted) == stats['evictions'])
+
+    # Снимок свечей не меняется при обновлениях буфера из WebSocket (в т.ч. сразу после полной загрузки)
+    buffer = KlineRingBuffer("X", capacity=capacity, dtype="float32")
+    interval_ms = buffer.interval_ms
+    buffer.load_rows(np.array([[i * interval_ms, 1, 2, 0.5, 1, 10, 10] for i in range(capacity)], dtype=np.float64))
+    snapshot = buffer.candles()
+    before = snapshot.values.copy(), snapshot.timestamps.copy()
+    buffer.update(buffer.last_timestamp, 1, 3, 0.5, 2.5, 11)
+    buffer.update(buffer.last_timestamp + interval_ms, 2, 3, 1, 2, 5)
+    isolated = np.array_equal(snapshot.values, before[0]) and np.array_equal(snapshot.timestamps, before[1])
+    print(f"Снимок свечей после обновлений буфера: {'не изменился' if isolated else 'ИЗМЕНИЛСЯ'}")
+    ok = ok and isolated
+    print("OK" if ok else "ОШИБКА")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,196 @@
+import math
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Метрики производительности: гистограммы длительности этапов торгового цикла
+# (фиксированные логарифмические корзины — запись стоит один bisect и
+# инкремент, память не растёт), счётчики REST-запросов по эндпоинтам и
+# локальный HTTP-эндпоинт /metrics в текстовом формате Prometheus.
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+HISTOGRAM_MIN = 1e-5  # Нижняя граница корзин (секунды)
+HISTOGRAM_GROWTH = 2 ** 0.25  # Соседние корзины отличаются на ~19% — такова и точность перцентилей
+HISTOGRAM_BUCKETS = 96  # До ~170 секунд
+QUANTILES = (0.5, 0.95, 0.99)
+
+_BOUNDS = [HISTOGRAM_MIN * HISTOGRAM_GROWTH ** i for i in range(HISTOGRAM_BUCKETS)]
+
+class LatencyHistogram:
+    """Гистограмма длительностей с логарифмическими корзинами."""
+
+    def __init__(self):
+        self.counts = [0] * (HISTOGRAM_BUCKETS + 1)  # Последняя корзина — всё, что больше верхней границы
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Оценка квантиля (середина корзины в логарифмической шкале, не больше максимума)."""
+        if self.count == 0:
+            return None
+        rank = math.ceil(q * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index == HISTOGRAM_BUCKETS:
+                    return self.max
+                middle = _BOUNDS[index] / math.sqrt(HISTOGRAM_GROWTH) if index > 0 else _BOUNDS[0]
+                return min(middle, self.max)
+        return self.max
+
+class Metrics:
+    """Реестр гистограмм этапов и счётчиков (потокобезопасный)."""
+
+    def __init__(self):
+        self._stages = {}  # stage -> LatencyHistogram
+        self._rest = {}  # (service, endpoint) -> LatencyHistogram
+        self._counters = {}  # (name, label) -> int
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """with metrics.timer("stage"): ... — длительность блока в гистограмму этапа."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Декоратор: длительность каждого вызова функции в гистограмму этапа."""
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    def inc(self, name, label="", value=1):
+        with self._lock:
+            self._counters[(name, label)] = self._counters.get((name, label), 0) + value
+
+    def observe_request(self, service, endpoint, seconds, status_code):
+        with self._lock:
+            histogram = self._rest.get((service, endpoint))
+            if histogram is None:
+                histogram = self._rest[(service, endpoint)] = LatencyHistogram()
+            histogram.observe(seconds)
+            key = ("http_errors", f"{service} {endpoint} {status_code}")
+            if status_code >= 400:
+                self._counters[key] = self._counters.get(key, 0) + 1
+
+    def stage_summary(self):
+        """{stage: {count, p50, p95, p99, max}} в миллисекундах."""
+        with self._lock:
+            return {stage: _summarize(histogram) for stage, histogram in sorted(self._stages.items())}
+
+    def rest_summary(self):
+        """{(service, endpoint): {count, p50, p95, p99, max}} в миллисекундах."""
+        with self._lock:
+            return {key: _summarize(histogram) for key, histogram in sorted(self._rest.items())}
+
+    def render_prometheus(self):
+        """Текстовый формат Prometheus (summary с квантилями для каждой гистограммы)."""
+        lines = []
+        with self._lock:
+            lines.append("# TYPE bot_stage_seconds summary")
+            for stage, histogram in sorted(self._stages.items()):
+                _render_summary(lines, "bot_stage_seconds", f'stage="{stage}"', histogram)
+            lines.append("# TYPE bot_rest_request_seconds summary")
+            for (service, endpoint), histogram in sorted(self._rest.items()):
+                _render_summary(lines, "bot_rest_request_seconds", f'service="{service}",endpoint="{endpoint}"', histogram)
+            names = sorted({name for name, label in self._counters})
+            for name in names:
+                lines.append(f"# TYPE bot_{name}_total counter")
+                for (counter_name, label), value in sorted(self._counters.items()):
+                    if counter_name == name:
+                        labels = f'{{label="{label}"}}' if label else ""
+                        lines.append(f"bot_{name}_total{labels} {value}")
+        lines.append(f"bot_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def instrument_session(self, client, service, endpoint_name=None):
+        """
+        Учёт всех ответов requests.Session (число, длительность, HTTP-ошибки по эндпоинтам).
+        Args:
+            client: requests.Session (для pybit — session.client)
+            endpoint_name: функция path -> имя эндпоинта (например, чтобы убрать токен из пути)
+        """
+        def on_response(response, *args, **kwargs):
+            try:
+                path = urlsplit(response.request.url).path
+                endpoint = endpoint_name(path) if endpoint_name else path
+                self.observe_request(service, endpoint, response.elapsed.total_seconds(), response.status_code)
+            except Exception as e:
+                logging.error(f"Ошибка учёта запроса {service}: {e}")
+            return response
+        client.hooks["response"].append(on_response)
+
+def _summarize(histogram):
+    summary = {"count": histogram.count, "max": histogram.max * 1000}
+    for q in QUANTILES:
+        value = histogram.quantile(q)
+        summary[f"p{int(q * 100)}"] = value * 1000 if value is not None else None
+    return summary
+
+def _render_summary(lines, name, labels, histogram):
+    for q in QUANTILES:
+        value = histogram.quantile(q)
+        if value is not None:
+            lines.append(f'{name}{{{labels},quantile="{q}"}} {value:.6f}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.total:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+def start_metrics_server(registry, host=METRICS_HOST, port=METRICS_PORT):
+    """HTTP-сервер метрик в фоновом потоке (GET /metrics); None, если порт занят."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        logging.error(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
+
+# Общий реестр метрик бота
+metrics = Metrics()
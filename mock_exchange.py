@@ -0,0 +1,731 @@
+import json
+import math
+import time
+import uuid
+import base64
+import random
+import socket
+import struct
+import hashlib
+import logging
+import argparse
+import threading
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Локальная замена Bybit для нагрузочного тестирования без сети.
+# Один порт обслуживает REST v5 (эндпоинты, которые использует бот) и
+# WebSocket (публичные tickers / kline / orderbook и приватные position /
+# wallet / order / execution). Цены — синтетические пути (геометрическое
+# случайное блуждание) для сотен символов; задержка ответов, ошибки REST и
+# обрывы WebSocket настраиваются. Подпись запросов не проверяется.
+#
+# python mock_exchange.py --port 8765 --symbols 300 --latency-ms 20 --error-rate 0.01
+# BYBIT_BASE_URL=http://127.0.0.1:8765 python bybit_scalping_bot.py
+
+MOCK_HOST = "127.0.0.1"
+MOCK_PORT = 8765
+MOCK_SYMBOLS = ("BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT", "DOGEUSDT")
+KLINE_HISTORY = 1000  # Закрытых свечей на символ при старте
+ORDERBOOK_DEPTH = 50
+TAKER_FEE = 0.00055
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+def use_local_exchange(base_url):
+    """
+    Направляет pybit (HTTP и WebSocket, созданные после вызова) на base_url вместо api-testnet.bybit.com.
+    Пример: use_local_exchange("http://127.0.0.1:8765").
+    """
+    import pybit._http_manager as http_manager
+    import pybit.unified_trading as unified_trading
+    base_url = base_url.rstrip("/")
+    ws_url = "ws" + base_url[len("http"):] if base_url.startswith("http") else base_url
+    http_manager.HTTP_URL = base_url
+    unified_trading.PUBLIC_WSS = ws_url + "/v5/public/{CHANNEL_TYPE}"
+    unified_trading.PRIVATE_WSS = ws_url + "/v5/private"
+    logging.info(f"pybit направлен на {base_url}")
+
+class WebSocketConnection:
+    """Серверная сторона WebSocket (RFC 6455) поверх сокета HTTP-обработчика: только текстовые кадры."""
+
+    def __init__(self, sock, channel):
+        self.sock = sock
+        self.channel = channel  # "linear" или "private"
+        self.conn_id = uuid.uuid4().hex[:20]
+        self.topics = set()
+        self.authorized = False
+        self.closed = False
+        self._send_lock = threading.Lock()
+
+    @staticmethod
+    def accept_key(key):
+        return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+    def _recv_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("соединение закрыто")
+            data += chunk
+        return data
+
+    def _send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([length])
+        elif length < 65536:
+            header += bytes([126]) + struct.pack("!H", length)
+        else:
+            header += bytes([127]) + struct.pack("!Q", length)
+        with self._send_lock:
+            if self.closed:
+                return
+            try:
+                self.sock.sendall(header + payload)
+            except OSError:
+                self.closed = True
+
+    def send_json(self, message):
+        self._send_frame(0x1, json.dumps(message).encode())
+
+    def recv(self):
+        """Следующее текстовое сообщение; None, если соединение закрыто."""
+        message = b""
+        while True:
+            first, second = self._recv_exact(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._recv_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._recv_exact(8))[0]
+            mask = self._recv_exact(4) if second & 0x80 else b"\0\0\0\0"
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._recv_exact(length)))
+            if opcode == 0x8:
+                self.close()
+                return None
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            message += payload
+            if first & 0x80:
+                return message.decode()
+
+    def close(self):
+        if not self.closed:
+            self._send_frame(0x8, b"")
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class SymbolMarket:
+    """Синтетический рынок одного символа: путь цены, свечи, стакан."""
+
+    def __init__(self, symbol, price, rng, interval, volatility, tick_size, qty_step):
+        self.symbol = symbol
+        self.rng = rng
+        self.interval_ms = interval * 60 * 1000
+        self.volatility = volatility  # Стандартное отклонение доходности за свечу
+        self.tick_size = tick_size
+        self.qty_step = qty_step
+        self.candles = deque(maxlen=KLINE_HISTORY)  # Закрытые свечи [start, o, h, l, c, volume, turnover]
+        now = int(time.time() * 1000)
+        current_start = now - now % self.interval_ms
+        returns = rng.normal(0, volatility, KLINE_HISTORY)
+        closes = price * np.exp(np.cumsum(returns) - returns.sum())
+        open_price = closes[0] / math.exp(returns[0])
+        for i, close in enumerate(closes):
+            high = max(open_price, close) * (1 + abs(rng.normal(0, volatility / 2)))
+            low = min(open_price, close) * (1 - abs(rng.normal(0, volatility / 2)))
+            volume = float(rng.uniform(100, 10000))
+            start = current_start - (KLINE_HISTORY - i) * self.interval_ms
+            self.candles.append([start, open_price, high, low, close, volume, volume * close])
+            open_price = close
+        self.price = float(closes[-1])
+        self.current = [current_start, self.price, self.price, self.price, self.price, 0.0, 0.0]
+        self.book_seq = 0
+        self.book_update_id = 0
+        self.bids, self.asks = self._build_book()
+
+    def round_price(self, price):
+        return round(round(price / self.tick_size) * self.tick_size, 10)
+
+    def _build_book(self):
+        bids, asks = {}, {}
+        best_bid = self.round_price(self.price - self.tick_size)
+        best_ask = self.round_price(self.price + self.tick_size)
+        for level in range(ORDERBOOK_DEPTH):
+            size = round(float(self.rng.exponential(50)) * self.qty_step * 100, 8) + self.qty_step
+            bids[self.round_price(best_bid - level * self.tick_size)] = size
+            asks[self.round_price(best_ask + level * self.tick_size)] = round(size * float(self.rng.uniform(0.5, 1.5)), 8)
+        return bids, asks
+
+    def step(self, dt):
+        """
+        Сдвиг цены на dt секунд.
+        Returns:
+            (закрытая свеча или None, дельта стакана {"b": [...], "a": [...]})
+        """
+        sigma = self.volatility * math.sqrt(dt * 1000 / self.interval_ms)
+        self.price = float(self.price * math.exp(self.rng.normal(0, sigma)))
+        now = int(time.time() * 1000)
+        closed = None
+        if now >= self.current[0] + self.interval_ms:
+            closed = list(self.current)
+            self.candles.append(closed)
+            start = now - now % self.interval_ms
+            self.current = [start, closed[4], closed[4], closed[4], closed[4], 0.0, 0.0]
+        volume = float(self.rng.uniform(0, 50))
+        self.current[2] = max(self.current[2], self.price)
+        self.current[3] = min(self.current[3], self.price)
+        self.current[4] = self.price
+        self.current[5] += volume
+        self.current[6] += volume * self.price
+        bids, asks = self._build_book()
+        delta = {"b": _book_delta(self.bids, bids), "a": _book_delta(self.asks, asks)}
+        self.bids, self.asks = bids, asks
+        self.book_seq += 1
+        self.book_update_id += 1
+        return closed, delta
+
+    def ticker(self):
+        day = list(self.candles)[-(24 * 60 * 60 * 1000 // self.interval_ms):] + [self.current]
+        return {
+            "symbol": self.symbol,
+            "lastPrice": _fmt(self.price),
+            "markPrice": _fmt(self.price),
+            "indexPrice": _fmt(self.price),
+            "bid1Price": _fmt(max(self.bids)),
+            "ask1Price": _fmt(min(self.asks)),
+            "highPrice24h": _fmt(max(candle[2] for candle in day)),
+            "lowPrice24h": _fmt(min(candle[3] for candle in day)),
+            "prevPrice24h": _fmt(day[0][1]),
+            "price24hPcnt": _fmt(self.price / day[0][1] - 1),
+            "volume24h": _fmt(sum(candle[5] for candle in day)),
+            "turnover24h": _fmt(sum(candle[6] for candle in day)),
+        }
+
+    def kline_message(self, candle, confirm):
+        return {
+            "start": int(candle[0]), "end": int(candle[0] + self.interval_ms - 1),
+            "interval": str(self.interval_ms // 60000),
+            "open": _fmt(candle[1]), "close": _fmt(candle[4]), "high": _fmt(candle[2]), "low": _fmt(candle[3]),
+            "volume": _fmt(candle[5]), "turnover": _fmt(candle[6]),
+            "confirm": confirm, "timestamp": int(time.time() * 1000),
+        }
+
+    def book(self, limit=ORDERBOOK_DEPTH):
+        return {
+            "s": self.symbol,
+            "b": [[_fmt(price), _fmt(self.bids[price])] for price in sorted(self.bids, reverse=True)[:limit]],
+            "a": [[_fmt(price), _fmt(self.asks[price])] for price in sorted(self.asks)[:limit]],
+            "u": self.book_update_id, "seq": self.book_seq, "ts": int(time.time() * 1000),
+        }
+
+def _book_delta(old, new):
+    changes = [[_fmt(price), _fmt(size)] for price, size in new.items() if old.get(price) != size]
+    changes += [[_fmt(price), "0"] for price in old if price not in new]
+    return changes
+
+def _fmt(value):
+    return format(float(value), ".10g") if abs(value) < 1e15 else str(value)
+
+class MockExchange:
+    """Состояние биржи: рынки, счёт, ордера и подписки WebSocket."""
+
+    def __init__(self, symbols=MOCK_SYMBOLS, seed=0, interval=5, volatility=0.003, tick_interval=0.5,
+                 latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit=50, ws_drop_interval=0.0,
+                 balance=10000.0, spread_bps=2.0):
+        """
+        Args:
+            latency_ms, jitter_ms: задержка каждого REST-ответа (равномерно в [latency, latency + jitter])
+            error_rate: доля REST-запросов, завершающихся ошибкой (HTTP 500, retCode 10016 или 10006)
+            rate_limit: запросов в секунду на эндпоинт (заголовки X-Bapi-Limit*, сверх лимита — retCode 10006)
+            ws_drop_interval: раз в столько секунд все WebSocket-соединения обрываются (0 — никогда)
+        """
+        self.rng = np.random.default_rng(seed)
+        self.random = random.Random(seed)
+        self.interval = interval
+        self.tick_interval = tick_interval
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.ws_drop_interval = ws_drop_interval
+        self.spread_bps = spread_bps
+        self.markets = {}
+        for i, symbol in enumerate(symbols):
+            price = float(10 ** self.rng.uniform(-2, 4.5))
+            tick_size = 10 ** math.floor(math.log10(price) - 4)
+            qty_step = 10 ** -max(0, min(3, math.floor(4 - math.log10(price))))
+            self.markets[symbol] = SymbolMarket(symbol, price, self.rng, interval, volatility, tick_size, qty_step)
+        self.balance = balance
+        self.positions = {}  # symbol -> {"side", "size", "avg_price", "updated_time"}
+        self.leverage = {}
+        self.orders = {}  # orderLinkId или orderId -> order
+        self.lock = threading.RLock()
+        self.connections = set()
+        self.subscribers = {}  # topic -> set(WebSocketConnection)
+        self._rate_windows = {}  # endpoint -> (секунда, число запросов)
+        self.stats = {"rest": 0, "errors": 0, "ws_messages": 0, "orders": 0}
+        self._stopped = False
+
+    # --- рынок ---
+
+    def start(self):
+        threading.Thread(target=self._market_loop, name="mock-market", daemon=True).start()
+        if self.ws_drop_interval:
+            threading.Thread(target=self._drop_loop, name="mock-ws-drop", daemon=True).start()
+
+    def stop(self):
+        self._stopped = True
+
+    def _market_loop(self):
+        last = time.time()
+        while not self._stopped:
+            time.sleep(self.tick_interval)
+            now = time.time()
+            dt, last = now - last, now
+            with self.lock:
+                updates = [(market, *market.step(dt)) for market in self.markets.values()]
+            for market, closed, delta in updates:
+                symbol = market.symbol
+                self.publish(f"tickers.{symbol}", market.ticker(), message_type="snapshot")
+                kline_topic = f"kline.{self.interval}.{symbol}"
+                if closed is not None:
+                    self.publish(kline_topic, [market.kline_message(closed, True)])
+                self.publish(kline_topic, [market.kline_message(market.current, False)])
+                self.publish(f"orderbook.{ORDERBOOK_DEPTH}.{symbol}", {
+                    "s": symbol, "b": delta["b"], "a": delta["a"], "u": market.book_update_id, "seq": market.book_seq
+                }, message_type="delta")
+
+    def _drop_loop(self):
+        while not self._stopped:
+            time.sleep(self.ws_drop_interval)
+            with self.lock:
+                connections = list(self.connections)
+            logging.info(f"Обрыв {len(connections)} WebSocket-соединений")
+            for connection in connections:
+                connection.close()
+
+    # --- WebSocket ---
+
+    def publish(self, topic, data, message_type="snapshot", connections=None):
+        with self.lock:
+            targets = list(connections if connections is not None else self.subscribers.get(topic, ()))
+        if not targets:
+            return
+        message = {"topic": topic, "type": message_type, "ts": int(time.time() * 1000), "data": data}
+        if topic.startswith("orderbook"):
+            message["cts"] = message["ts"]
+        for connection in targets:
+            connection.send_json(message)
+        self.stats["ws_messages"] += len(targets)
+
+    def serve_websocket(self, connection):
+        with self.lock:
+            self.connections.add(connection)
+        try:
+            while True:
+                text = connection.recv()
+                if text is None:
+                    break
+                self._handle_ws_message(connection, json.loads(text))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                self.connections.discard(connection)
+                for subscribers in self.subscribers.values():
+                    subscribers.discard(connection)
+            connection.close()
+
+    def _handle_ws_message(self, connection, message):
+        op = message.get("op")
+        response = {"success": True, "ret_msg": "", "conn_id": connection.conn_id, "op": op}
+        if message.get("req_id"):
+            response["req_id"] = message["req_id"]
+        if op == "ping":
+            response["ret_msg"] = "pong"
+            connection.send_json(response)
+        elif op == "auth":
+            connection.authorized = True
+            connection.send_json(response)
+        elif op == "subscribe":
+            topics = message.get("args", [])
+            valid = all(self._valid_topic(connection, topic) for topic in topics)
+            if not valid:
+                response.update(success=False, ret_msg=f"error:handler not found,topic:{topics}")
+                connection.send_json(response)
+                return
+            with self.lock:
+                for topic in topics:
+                    self.subscribers.setdefault(topic, set()).add(connection)
+                    connection.topics.add(topic)
+            connection.send_json(response)
+            for topic in topics:
+                self._send_initial(connection, topic)
+        elif op == "unsubscribe":
+            with self.lock:
+                for topic in message.get("args", []):
+                    self.subscribers.get(topic, set()).discard(connection)
+                    connection.topics.discard(topic)
+            connection.send_json(response)
+
+    def _valid_topic(self, connection, topic):
+        if connection.channel == "private":
+            return connection.authorized and topic in ("position", "wallet", "order", "execution")
+        parts = topic.split(".")
+        if parts[0] == "tickers" and len(parts) == 2:
+            return parts[1] in self.markets
+        if parts[0] == "kline" and len(parts) == 3:
+            return parts[1] == str(self.interval) and parts[2] in self.markets
+        if parts[0] == "orderbook" and len(parts) == 3:
+            return parts[1] == str(ORDERBOOK_DEPTH) and parts[2] in self.markets
+        return False
+
+    def _send_initial(self, connection, topic):
+        """Снимок стакана сразу после подписки (как на бирже)."""
+        if topic.startswith("orderbook"):
+            with self.lock:
+                book = self.markets[topic.split(".")[2]].book()
+            self.publish(topic, book, message_type="snapshot", connections=[connection])
+
+    # --- REST ---
+
+    def rest_headers(self, endpoint):
+        """Заголовки лимитов Bybit; второй элемент — True, если лимит превышен."""
+        now = time.time()
+        second = int(now)
+        with self.lock:
+            window, count = self._rate_windows.get(endpoint, (second, 0))
+            if window != second:
+                window, count = second, 0
+            count += 1
+            self._rate_windows[endpoint] = (window, count)
+        headers = {
+            "X-Bapi-Limit": str(self.rate_limit),
+            "X-Bapi-Limit-Status": str(max(0, self.rate_limit - count)),
+            "X-Bapi-Limit-Reset-Timestamp": str((second + 1) * 1000),
+        }
+        return headers, count > self.rate_limit
+
+    def handle_rest(self, method, path, params):
+        """(HTTP-код, тело ответа, заголовки)."""
+        self.stats["rest"] += 1
+        delay = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        headers, limited = self.rest_headers(path)
+        if limited:
+            return 200, _response(10006, "Too many visits!"), headers
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            kind = self.random.choice(("http_500", "server_error", "rate_limit"))
+            if kind == "http_500":
+                return 500, {"error": "injected"}, headers
+            if kind == "rate_limit":
+                return 200, _response(10006, "Too many visits!"), headers
+            return 200, _response(10016, "Server error."), headers
+        handler = ROUTES.get((method, path))
+        if handler is None:
+            return 404, {"retCode": 404, "retMsg": "Not Found"}, headers
+        try:
+            return 200, handler(self, params), headers
+        except KeyError as e:
+            return 200, _response(10001, f"params error: {e}"), headers
+
+    def _market(self, params):
+        symbol = params["symbol"]
+        if symbol not in self.markets:
+            raise KeyError(f"symbol invalid: {symbol}")
+        return self.markets[symbol]
+
+    def get_time(self, params):
+        now = time.time()
+        return _response(0, "OK", {"timeSecond": str(int(now)), "timeNano": str(int(now * 1e9))})
+
+    def get_kline(self, params):
+        market = self._market(params)
+        limit = min(int(params.get("limit", 200)), 1000)
+        start = int(params["start"]) if "start" in params else None
+        end = int(params["end"]) if "end" in params else None
+        with self.lock:
+            candles = list(market.candles) + [market.current]
+        rows = [
+            [str(int(c[0])), _fmt(c[1]), _fmt(c[2]), _fmt(c[3]), _fmt(c[4]), _fmt(c[5]), _fmt(c[6])]
+            for c in reversed(candles)
+            if (start is None or c[0] >= start) and (end is None or c[0] <= end)
+        ]
+        if start is not None and end is None:
+            rows = rows[-limit:]
+        return _response(0, "OK", {"category": "linear", "symbol": market.symbol, "list": rows[:limit]})
+
+    def get_tickers(self, params):
+        with self.lock:
+            markets = [self._market(params)] if "symbol" in params else list(self.markets.values())
+            tickers = [market.ticker() for market in markets]
+        return _response(0, "OK", {"category": "linear", "list": tickers})
+
+    def get_orderbook(self, params):
+        market = self._market(params)
+        with self.lock:
+            return _response(0, "OK", market.book(min(int(params.get("limit", 25)), ORDERBOOK_DEPTH)))
+
+    def get_instruments_info(self, params):
+        with self.lock:
+            items = [{
+                "symbol": market.symbol, "status": "Trading", "contractType": "LinearPerpetual",
+                "priceFilter": {"tickSize": _fmt(market.tick_size)},
+                "lotSizeFilter": {"qtyStep": _fmt(market.qty_step), "minOrderQty": _fmt(market.qty_step),
+                                  "maxOrderQty": _fmt(market.qty_step * 1e6)},
+                "leverageFilter": {"minLeverage": "1", "maxLeverage": "50", "leverageStep": "0.01"},
+            } for market in self.markets.values()]
+        return _response(0, "OK", {"category": "linear", "list": items, "nextPageCursor": ""})
+
+    def _position_item(self, symbol):
+        position = self.positions.get(symbol)
+        market = self.markets[symbol]
+        if position is None or position["size"] == 0:
+            return {"symbol": symbol, "side": "", "size": "0", "avgPrice": "0", "entryPrice": "0",
+                    "unrealisedPnl": "0", "leverage": str(self.leverage.get(symbol, 10)),
+                    "updatedTime": str(position["updated_time"] if position else 0), "category": "linear"}
+        direction = 1 if position["side"] == "Buy" else -1
+        return {
+            "symbol": symbol, "side": position["side"], "size": _fmt(position["size"]),
+            "avgPrice": _fmt(position["avg_price"]), "entryPrice": _fmt(position["avg_price"]),
+            "markPrice": _fmt(market.price),
+            "unrealisedPnl": _fmt((market.price - position["avg_price"]) * position["size"] * direction),
+            "leverage": str(self.leverage.get(symbol, 10)), "updatedTime": str(position["updated_time"]),
+            "category": "linear",
+        }
+
+    def get_positions(self, params):
+        with self.lock:
+            if "symbol" in params:
+                items = [self._position_item(self._market(params).symbol)]
+            else:
+                items = [self._position_item(symbol) for symbol, position in self.positions.items() if position["size"] > 0]
+        return _response(0, "OK", {"category": "linear", "list": items, "nextPageCursor": ""})
+
+    def _wallet_item(self):
+        balance = _fmt(self.balance)
+        return {"accountType": "UNIFIED", "coin": [{
+            "coin": "USDT", "walletBalance": balance, "equity": balance,
+            "availableToWithdraw": balance, "availableBalance": balance,
+        }]}
+
+    def get_wallet_balance(self, params):
+        with self.lock:
+            return _response(0, "OK", {"list": [self._wallet_item()]})
+
+    def set_leverage(self, params):
+        market = self._market(params)
+        leverage = params["buyLeverage"]
+        with self.lock:
+            if self.leverage.get(market.symbol) == leverage:
+                return _response(110043, "leverage not modified")
+            self.leverage[market.symbol] = leverage
+        return _response(0, "OK", {})
+
+    def place_order(self, params):
+        """Рыночный ордер исполняется сразу по цене ± половина спреда; события уходят в приватные топики."""
+        market = self._market(params)
+        side = params["side"]
+        qty = float(params["qty"])
+        reduce_only = str(params.get("reduceOnly", "false")).lower() == "true"
+        if side not in ("Buy", "Sell") or qty <= 0:
+            return _response(10001, "params error: side or qty")
+        now = int(time.time() * 1000)
+        with self.lock:
+            position = self.positions.setdefault(market.symbol, {"side": "", "size": 0.0, "avg_price": 0.0, "updated_time": 0})
+            if reduce_only:
+                if position["size"] == 0 or position["side"] == side:
+                    return _response(110017, "current position is zero, cannot fix reduce-only order qty")
+                qty = min(qty, position["size"])
+            direction = 1 if side == "Buy" else -1
+            price = market.price * (1 + direction * self.spread_bps / 2 / 10000)
+            fee = price * qty * TAKER_FEE
+            order_id = str(uuid.uuid4())
+            link_id = params.get("orderLinkId") or ""
+            if position["size"] == 0 or position["side"] == side:
+                total = position["size"] + qty
+                position["avg_price"] = (position["avg_price"] * position["size"] + price * qty) / total
+                position["size"], position["side"] = total, side
+            else:
+                closed = min(qty, position["size"])
+                entry_direction = 1 if position["side"] == "Buy" else -1
+                self.balance += (price - position["avg_price"]) * closed * entry_direction
+                position["size"] -= closed
+                if qty > closed:
+                    position.update(side=side, size=qty - closed, avg_price=price)
+                elif position["size"] == 0:
+                    position.update(side="", avg_price=0.0)
+            position["updated_time"] = now
+            self.balance -= fee
+            order = {
+                "orderId": order_id, "orderLinkId": link_id, "symbol": market.symbol, "side": side,
+                "orderType": "Market", "qty": _fmt(qty), "price": _fmt(price), "avgPrice": _fmt(price),
+                "cumExecQty": _fmt(qty), "cumExecValue": _fmt(price * qty), "cumExecFee": _fmt(fee),
+                "leavesQty": "0", "orderStatus": "Filled", "reduceOnly": reduce_only,
+                "createdTime": str(now), "updatedTime": str(now), "category": "linear", "rejectReason": "EC_NoError",
+            }
+            self.orders[order_id] = order
+            if link_id:
+                self.orders[link_id] = order
+            position_item = self._position_item(market.symbol)
+            wallet_item = self._wallet_item()
+        self.stats["orders"] += 1
+        execution = {
+            "category": "linear", "symbol": market.symbol, "orderId": order_id, "orderLinkId": link_id,
+            "side": side, "execId": str(uuid.uuid4()), "execPrice": _fmt(price), "execQty": _fmt(qty),
+            "execFee": _fmt(fee), "execType": "Trade", "leavesQty": "0", "execTime": str(now),
+        }
+        # Порядок как на бирже: ответ REST, затем order (New -> Filled), execution, position, wallet
+        threading.Timer(0.005, self._publish_fill, args=(order, execution, position_item, wallet_item)).start()
+        return _response(0, "OK", {"orderId": order_id, "orderLinkId": link_id})
+
+    def _publish_fill(self, order, execution, position_item, wallet_item):
+        self.publish("order", [dict(order, orderStatus="New", cumExecQty="0", avgPrice="0", leavesQty=order["qty"])])
+        self.publish("execution", [execution])
+        self.publish("order", [order])
+        self.publish("position", [position_item])
+        self.publish("wallet", [wallet_item])
+
+    def get_order_history(self, params):
+        with self.lock:
+            key = params.get("orderLinkId") or params.get("orderId")
+            if key:
+                items = [self.orders[key]] if key in self.orders else []
+            else:
+                items = list({order["orderId"]: order for order in self.orders.values()}.values())[-50:]
+        return _response(0, "OK", {"category": "linear", "list": items, "nextPageCursor": ""})
+
+ROUTES = {
+    ("GET", "/v5/market/time"): MockExchange.get_time,
+    ("GET", "/v5/market/kline"): MockExchange.get_kline,
+    ("GET", "/v5/market/tickers"): MockExchange.get_tickers,
+    ("GET", "/v5/market/orderbook"): MockExchange.get_orderbook,
+    ("GET", "/v5/market/instruments-info"): MockExchange.get_instruments_info,
+    ("GET", "/v5/position/list"): MockExchange.get_positions,
+    ("GET", "/v5/account/wallet-balance"): MockExchange.get_wallet_balance,
+    ("GET", "/v5/order/history"): MockExchange.get_order_history,
+    ("GET", "/v5/order/realtime"): MockExchange.get_order_history,
+    ("POST", "/v5/order/create"): MockExchange.place_order,
+    ("POST", "/v5/position/set-leverage"): MockExchange.set_leverage,
+}
+
+def _response(code, message, result=None):
+    return {"retCode": code, "retMsg": message, "result": result if result is not None else {},
+            "retExtInfo": {}, "time": int(time.time() * 1000)}
+
+def make_handler(exchange):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, как у пула соединений pybit
+
+        def _reply(self, status, body, headers):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if self.headers.get("Upgrade", "").lower() == "websocket":
+                self._upgrade(url.path)
+                return
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            self._reply(*exchange.handle_rest("GET", url.path, params))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                params = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                params = {}
+            self._reply(*exchange.handle_rest("POST", urlsplit(self.path).path, params))
+
+        def _upgrade(self, path):
+            if path == "/v5/private":
+                channel = "private"
+            elif path.startswith("/v5/public/"):
+                channel = path.rsplit("/", 1)[-1]
+            else:
+                self.send_error(404)
+                return
+            self.send_response(101, "Switching Protocols")
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", WebSocketConnection.accept_key(self.headers["Sec-WebSocket-Key"]))
+            self.end_headers()
+            self.wfile.flush()
+            exchange.serve_websocket(WebSocketConnection(self.connection, channel))
+            self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def start_mock_exchange(exchange, host=MOCK_HOST, port=MOCK_PORT):
+    """Запуск HTTP/WebSocket-сервера и генератора цен в фоновых потоках."""
+    server = ThreadingHTTPServer((host, port), make_handler(exchange))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-http", daemon=True).start()
+    exchange.start()
+    logging.info(f"Тестовая биржа: http://{host}:{server.server_address[1]} ({len(exchange.markets)} символов)")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная тестовая биржа Bybit (REST v5 + WebSocket)")
+    parser.add_argument("--host", default=MOCK_HOST)
+    parser.add_argument("--port", type=int, default=MOCK_PORT)
+    parser.add_argument("--symbols", type=int, default=0,
+                        help="Число синтетических символов (по умолчанию BTC, ETH, SOL, XRP, DOGE)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--interval", type=int, default=5, help="Таймфрейм свечей, минут")
+    parser.add_argument("--tick-interval", type=float, default=0.5, help="Период обновления цен, секунд")
+    parser.add_argument("--volatility", type=float, default=0.003, help="Волатильность за свечу")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=50, help="Запросов в секунду на эндпоинт")
+    parser.add_argument("--ws-drop-interval", type=float, default=0.0, help="Обрыв WebSocket раз в N секунд")
+    parser.add_argument("--balance", type=float, default=10000.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    symbols = MOCK_SYMBOLS + tuple(f"SYN{i:03d}USDT" for i in range(max(0, args.symbols - len(MOCK_SYMBOLS))))
+    if args.symbols:
+        symbols = symbols[:args.symbols]
+    exchange = MockExchange(
+        symbols=symbols, seed=args.seed, interval=args.interval, volatility=args.volatility,
+        tick_interval=args.tick_interval, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, rate_limit=args.rate_limit, ws_drop_interval=args.ws_drop_interval,
+        balance=args.balance
+    )
+    start_mock_exchange(exchange, host=args.host, port=args.port)
+    try:
+        while True:
+            time.sleep(10)
+            logging.info(
+                f"REST: {exchange.stats['rest']}, ошибок: {exchange.stats['errors']}, ордеров: {exchange.stats['orders']}, "
+                f"WebSocket: {len(exchange.connections)} соединений, {exchange.stats['ws_messages']} сообщений"
+            )
+    except KeyboardInterrupt:
+        exchange.stop()
+
+if __name__ == "__main__":
+    main()
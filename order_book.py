@@ -0,0 +1,206 @@
+import time
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+# Локальная копия стакана по WebSocket orderbook Bybit: снимок при подписке,
+# затем дельты (размер уровня абсолютный, "0" — удаление уровня). Номер
+# обновления u должен расти на 1; пропуск или пересечение лучших цен помечает
+# стакан несинхронизированным до нового снимка (WebSocket при переподключении
+# или REST get_orderbook). Запросы ликвидности — без сетевых вызовов.
+# Нужны сырые сообщения биржи: pybit сам сливает дельты и отдаёт снимки
+# (см. raw_orderbook_messages в bybit_scalping_bot.py).
+
+ORDERBOOK_DEPTH = 50  # Глубина подписки orderbook.50.SYMBOL и REST-снимка
+
+class OrderBook:
+    """Стакан одного символа. Стороны запросов — стороны рыночного ордера: Buy забирает аски, Sell — биды."""
+
+    def __init__(self, symbol, depth=ORDERBOOK_DEPTH):
+        self.symbol = symbol
+        self.depth = depth
+        self._bids = {}  # цена -> объём
+        self._asks = {}
+        self._bid_keys = []  # -цена по возрастанию (лучший бид первым)
+        self._ask_keys = []  # цена по возрастанию (лучший аск первым)
+        self._lock = threading.Lock()
+        self.update_id = None
+        self.synced = False
+        self.last_update = 0.0
+        self.gaps = 0
+        self._accept_next = False  # После REST-снимка принимается первая более новая дельта
+
+    # --- обновление ---
+
+    def apply(self, message_type, data):
+        """Сообщение orderbook из WebSocket. Returns: True, если стакан синхронизирован после обновления."""
+        if message_type == "snapshot":
+            self.load_snapshot(data)
+            return True
+        update_id = int(data['u'])
+        with self._lock:
+            if not self.synced or update_id <= self.update_id:
+                return self.synced  # Ждём снимок или устаревшее сообщение
+            if update_id != self.update_id + 1 and not self._accept_next:
+                self.synced = False
+                self.gaps += 1
+                logging.warning(f"Стакан {self.symbol}: пропуск обновлений {self.update_id} -> {update_id}")
+                return False
+            self._accept_next = False
+            self._apply_levels(self._bids, self._bid_keys, data['b'], -1)
+            self._apply_levels(self._asks, self._ask_keys, data['a'], 1)
+            self.update_id = update_id
+            self.last_update = time.time()
+            if self._bid_keys and self._ask_keys and -self._bid_keys[0] >= self._ask_keys[0]:
+                self.synced = False
+                self.gaps += 1
+                logging.warning(f"Стакан {self.symbol}: пересечение лучших цен, нужен новый снимок")
+            return self.synced
+
+    def load_snapshot(self, data, from_rest=False):
+        """Снимок стакана (data из WebSocket snapshot или result из REST get_orderbook)."""
+        with self._lock:
+            self._bids, self._asks = {}, {}
+            self._bid_keys, self._ask_keys = [], []
+            self._apply_levels(self._bids, self._bid_keys, data['b'], -1)
+            self._apply_levels(self._asks, self._ask_keys, data['a'], 1)
+            self.update_id = int(data['u'])
+            self.synced = True
+            # Номера REST и WebSocket могут не совпасть: уровни в дельтах абсолютные, стакан сходится
+            self._accept_next = from_rest
+            self.last_update = time.time()
+
+    @staticmethod
+    def _apply_levels(levels, keys, changes, sign):
+        for price, size in changes:
+            price, size = float(price), float(size)
+            key = sign * price
+            if size == 0:
+                if levels.pop(price, None) is not None:
+                    del keys[bisect_left(keys, key)]
+            else:
+                if price not in levels:
+                    insort(keys, key)
+                levels[price] = size
+
+    # --- запросы ---
+
+    def age(self):
+        """Секунд с последнего обновления."""
+        return time.time() - self.last_update
+
+    def _side(self, side):
+        """Уровни, которые забирает рыночный ордер стороны side: [(цена, объём)] от лучшего."""
+        if side == "Buy":
+            return [(price, self._asks[price]) for price in self._ask_keys]
+        return [(-key, self._bids[-key]) for key in self._bid_keys]
+
+    def best(self):
+        """(лучший бид, лучший аск); None для пустой стороны."""
+        with self._lock:
+            return (-self._bid_keys[0] if self._bid_keys else None,
+                    self._ask_keys[0] if self._ask_keys else None)
+
+    def mid(self):
+        bid, ask = self.best()
+        return (bid + ask) / 2 if bid is not None and ask is not None else None
+
+    def depth_within(self, bps):
+        """(объём бидов, объём асков) в пределах bps базисных пунктов от середины спреда."""
+        with self._lock:
+            if not self._bid_keys or not self._ask_keys:
+                return 0.0, 0.0
+            mid = (-self._bid_keys[0] + self._ask_keys[0]) / 2
+            low, high = mid * (1 - bps / 1e4), mid * (1 + bps / 1e4)
+            bid_qty = sum(self._bids[-key] for key in self._bid_keys[:bisect_right(self._bid_keys, -low)])
+            ask_qty = sum(self._asks[key] for key in self._ask_keys[:bisect_right(self._ask_keys, high)])
+        return bid_qty, ask_qty
+
+    def cumulative_qty(self, side, limit_price):
+        """Объём, доступный рыночному ордеру side не хуже limit_price."""
+        with self._lock:
+            levels = self._side(side)
+        if side == "Buy":
+            return sum(size for price, size in levels if price <= limit_price)
+        return sum(size for price, size in levels if price >= limit_price)
+
+    def fill(self, side, qty):
+        """
+        Исполнение рыночного ордера side объёмом qty по текущему стакану.
+        Returns:
+            (средняя цена VWAP, худшая цена) или None, если глубины стакана не хватает
+        """
+        with self._lock:
+            levels = self._side(side)
+        remaining, cost = qty, 0.0
+        for price, size in levels:
+            take = min(size, remaining)
+            cost += take * price
+            remaining -= take
+            if remaining <= 0:
+                return cost / qty, price
+        return None
+
+    def slippage_bps(self, side, qty):
+        """Проскальзывание VWAP рыночного ордера относительно лучшей цены в bps; None без достаточной глубины."""
+        result = self.fill(side, qty)
+        if result is None:
+            return None
+        vwap = result[0]
+        bid, ask = self.best()
+        best = ask if side == "Buy" else bid
+        return abs(vwap - best) / best * 1e4
+
+# Проверка на синтетическом потоке дельт: python order_book.py
+def main():
+    import random
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rng = random.Random(1)
+    reference = {"b": {}, "a": {}}
+
+    def level_changes(mid, update_id):
+        changes = {"b": [], "a": []}
+        for side, sign in (("b", -1), ("a", 1)):
+            for _ in range(5):
+                price = round(mid + sign * rng.randint(1, ORDERBOOK_DEPTH) * 0.5, 1)
+                size = 0.0 if rng.random() < 0.3 else round(rng.uniform(0.1, 10), 3)
+                changes[side].append([str(price), str(size)])
+                if size == 0:
+                    reference[side].pop(price, None)
+                else:
+                    reference[side][price] = size
+        changes["u"] = update_id
+        return changes
+
+    book = OrderBook("BTCUSDT")
+    snapshot = level_changes(30000.0, 1)
+    book.apply("snapshot", snapshot)
+    for update_id in range(2, 2001):
+        book.apply("delta", level_changes(30000.0, update_id))
+    ok = book.synced and book._bids == reference["b"] and book._asks == reference["a"]
+
+    # Пропуск обновления: стакан не синхронизирован до нового снимка
+    book.apply("delta", level_changes(30000.0, 2002))
+    ok = ok and not book.synced and book.gaps == 1
+    book.load_snapshot({"b": [[str(p), str(s)] for p, s in reference["b"].items()],
+                        "a": [[str(p), str(s)] for p, s in reference["a"].items()], "u": 2001}, from_rest=True)
+    book.apply("delta", level_changes(30000.0, 2005))
+    ok = ok and book.synced and book._bids == reference["b"]
+
+    bid, ask = book.best()
+    qty = sum(size for _, size in book._side("Buy")[:3])
+    vwap, worst = book.fill("Buy", qty)
+    ok = ok and ask <= vwap <= worst and book.fill("Buy", 1e9) is None
+    print(f"Лучшие цены {bid} / {ask}, в пределах 5 bps: {book.depth_within(5)}, "
+          f"VWAP {qty:.3f} = {vwap:.2f} (проскальзывание {book.slippage_bps('Buy', qty):.2f} bps)")
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        book.slippage_bps("Buy", qty)
+        book.slippage_bps("Sell", qty)
+    print(f"Проверка ликвидности (обе стороны): {(time.perf_counter() - start) / 10000 * 1e6:.1f} мкс")
+    print("OK" if ok else "ОШИБКА")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,284 @@
+import time
+import uuid
+import heapq
+import logging
+import itertools
+import threading
+from instruments import format_decimal
+
+# Шлюз ордеров: отправка без блокировки стратегии, клиентский orderLinkId для
+# каждого ордера и отслеживание подтверждения, частичного и полного исполнения
+# или отклонения по приватным топикам order и execution. Для каждого ордера
+# доступны средняя цена исполнения и задержки отправка -> подтверждение -> исполнение.
+# Пул потоков занят только на время REST-запросов: ожидание исполнения после
+# подтверждения и опрос ордера планирует отдельный поток order-watcher.
+
+ORDER_POLL_TIMEOUT = 10.0  # Сколько ждать исполнения через REST, если приватный WebSocket недоступен
+STREAM_FILL_TIMEOUT = 2.0  # Если событие исполнения из WebSocket не пришло за это время — проверка через REST
+
+class OrderTicket:
+    """Состояние одного ордера."""
+
+    def __init__(self, symbol, side, qty, reduce_only=False, on_done=None):
+        self.order_link_id = f"sb{uuid.uuid4().hex[:30]}"
+        self.symbol = symbol
+        self.side = side
+        self.qty = qty
+        self.reduce_only = reduce_only
+        self.on_done = on_done
+        self.status = "pending"  # pending -> submitted -> acked -> partially_filled -> filled | rejected | cancelled | unknown
+        self.order_id = None
+        self.reject_reason = None
+        # Два независимых источника исполнения; складывать их нельзя — объём учитывается дважды
+        self.exec_qty = 0.0  # Сумма исполнений из топика execution (без повторов по execId)
+        self.exec_value = 0.0
+        self.order_qty = 0.0  # Накопленные cumExecQty/avgPrice из топика order или REST
+        self.order_value = 0.0
+        self.fees = 0.0
+        self.exec_ids = set()
+        self.created_at = time.perf_counter()
+        self.ack_at = None
+        self.first_fill_at = None
+        self.done_at = None
+        self.done = threading.Event()
+        self.poll_deadline = None  # Опрос REST: срок и текущий интервал
+        self.poll_delay = 0.1
+
+    @property
+    def filled_qty(self):
+        return max(self.exec_qty, self.order_qty)
+
+    @property
+    def fill_value(self):
+        """Стоимость исполненного объёма по более полному источнику (при равенстве — по исполнениям)."""
+        return self.exec_value if self.exec_qty >= self.order_qty else self.order_value
+
+    @property
+    def avg_fill_price(self):
+        return self.fill_value / self.filled_qty if self.filled_qty else None
+
+    @property
+    def ack_latency_ms(self):
+        return (self.ack_at - self.created_at) * 1000 if self.ack_at is not None else None
+
+    @property
+    def fill_latency_ms(self):
+        """Задержка от создания ордера до полного исполнения."""
+        if self.status != "filled" or self.done_at is None:
+            return None
+        return (self.done_at - self.created_at) * 1000
+
+    def __repr__(self):
+        return (f"OrderTicket({self.order_link_id}, {self.side} {self.qty} {self.symbol}, {self.status}, "
+                f"filled={self.filled_qty}, avg={self.avg_fill_price})")
+
+class OrderGateway:
+    """Отправка рыночных ордеров и сопоставление событий order/execution по orderLinkId."""
+
+    def __init__(self, session, executor, stream_ready=None, reconcile=None, category="linear"):
+        """
+        Args:
+            executor: пул потоков для REST-запросов (отправка не блокирует вызывающий код)
+            stream_ready: функция, возвращающая True, если приватный WebSocket доставляет order/execution
+            reconcile: reconcile(symbol) — сверка позиции с биржей, если исполнение ордера не подтвердилось
+        """
+        self.session = session
+        self.executor = executor
+        self.stream_ready = stream_ready or (lambda: False)
+        self.reconcile = reconcile
+        self.category = category
+        self._tickets = {}  # orderLinkId -> OrderTicket (активные ордера)
+        self._lock = threading.Lock()
+        self.completed = []  # Последние завершённые ордера (для статистики задержек)
+        self._timers = []  # Куча (срок, seq, ticket, action): отложенные проверки ордеров
+        self._timer_seq = itertools.count()
+        self._timer_cond = threading.Condition()
+        self._watcher = None
+
+    def submit(self, symbol, side, qty, reduce_only=False, on_done=None):
+        """Постановка рыночного ордера; on_done(ticket) вызывается после исполнения или отклонения."""
+        ticket = OrderTicket(symbol, side, qty, reduce_only=reduce_only, on_done=on_done)
+        with self._lock:
+            self._tickets[ticket.order_link_id] = ticket
+        self.executor.submit(self._send, ticket)
+        return ticket
+
+    def has_active(self, symbol):
+        """Есть ли по символу ордер, ещё не исполненный и не отклонённый."""
+        with self._lock:
+            return any(ticket.symbol == symbol for ticket in self._tickets.values())
+
+    def active_tickets(self):
+        """Ордера, ещё не исполненные и не отклонённые (например, для ожидания перед остановкой)."""
+        with self._lock:
+            return list(self._tickets.values())
+
+    def wait(self, ticket, timeout=None):
+        """Ожидание завершения ордера вместе с его обработчиком on_done."""
+        return ticket.done.wait(timeout)
+
+    def _send(self, ticket):
+        try:
+            response = self.session.place_order(
+                category=self.category,
+                symbol=ticket.symbol,
+                side=ticket.side,
+                orderType="Market",
+                qty=format_decimal(ticket.qty),
+                reduceOnly=ticket.reduce_only,
+                orderLinkId=ticket.order_link_id
+            )
+        except Exception as e:
+            self._finish(ticket, "rejected", reason=str(e))
+            return
+        if response.get('retCode') != 0:
+            self._finish(ticket, "rejected", reason=response.get('retMsg'))
+            return
+        with self._lock:
+            ticket.order_id = response['result'].get('orderId')
+            if ticket.ack_at is None:
+                ticket.ack_at = time.perf_counter()
+            if ticket.status == "pending":
+                ticket.status = "submitted"
+        # Поток пула освобождается: исполнение ждём по событиям WebSocket, без них — опросом REST
+        if self.stream_ready():
+            self._schedule(ticket, STREAM_FILL_TIMEOUT, self._start_poll)
+        else:
+            self._start_poll(ticket)
+
+    def _schedule(self, ticket, delay, action):
+        """action(ticket) в пуле потоков через delay секунд, если ордер ещё не завершён."""
+        with self._timer_cond:
+            heapq.heappush(self._timers, (time.perf_counter() + delay, next(self._timer_seq), ticket, action))
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name="order-watcher", daemon=True)
+                self._watcher.start()
+            self._timer_cond.notify()
+
+    def _watch(self):
+        while True:
+            with self._timer_cond:
+                while not self._timers or self._timers[0][0] > time.perf_counter():
+                    self._timer_cond.wait(self._timers[0][0] - time.perf_counter() if self._timers else None)
+                _, _, ticket, action = heapq.heappop(self._timers)
+            if ticket.order_link_id in self._tickets:
+                self.executor.submit(action, ticket)
+
+    def _start_poll(self, ticket):
+        """Исполнение через REST get_order_history, когда события приватного WebSocket не приходят."""
+        ticket.poll_deadline = time.perf_counter() + ORDER_POLL_TIMEOUT
+        self._schedule(ticket, ticket.poll_delay, self._poll_fill)
+
+    def _poll_fill(self, ticket):
+        """Один запрос состояния ордера; следующий — с удвоенным интервалом (до 1 с) до ORDER_POLL_TIMEOUT."""
+        try:
+            orders = self.session.get_order_history(
+                category=self.category, symbol=ticket.symbol, orderLinkId=ticket.order_link_id
+            )['result']['list']
+            if orders:
+                self.handle_order_update(orders[0])
+        except Exception as e:
+            logging.error(f"Ошибка запроса ордера {ticket.order_link_id}: {e}")
+        if ticket.order_link_id not in self._tickets:
+            return  # Уже завершён (обработчик on_done может ещё выполняться)
+        if time.perf_counter() < ticket.poll_deadline:
+            ticket.poll_delay = min(ticket.poll_delay * 2, 1.0)
+            self._schedule(ticket, ticket.poll_delay, self._poll_fill)
+            return
+        # Ордер завершается в любом случае, иначе has_active() навсегда блокирует новые ордера по символу
+        reason = f"исполнение не подтверждено за {ORDER_POLL_TIMEOUT:g} с"
+        logging.warning(f"Ордер {ticket.order_link_id}: {reason}, сверка позиции {ticket.symbol}")
+        if self.reconcile is not None:
+            try:
+                self.reconcile(ticket.symbol)
+            except Exception as e:
+                logging.error(f"Ошибка сверки позиции {ticket.symbol}: {e}")
+        self._finish(ticket, "unknown", reason=reason)
+
+    def _finish(self, ticket, status, reason=None):
+        with self._lock:
+            # Ордер завершается один раз: из активных его удаляет только _finish
+            if self._tickets.pop(ticket.order_link_id, None) is None:
+                return
+            ticket.status = status
+            ticket.reject_reason = reason
+            ticket.done_at = time.perf_counter()
+            self.completed.append(ticket)
+            del self.completed[:-200]
+        if status == "filled":
+            logging.info(
+                f"Ордер {ticket.order_link_id} исполнен: {ticket.side} {ticket.filled_qty} {ticket.symbol} "
+                f"по {ticket.avg_fill_price}, подтверждение {ticket.ack_latency_ms:.1f} мс, "
+                f"исполнение {ticket.fill_latency_ms:.1f} мс"
+            )
+        else:
+            logging.error(f"Ордер {ticket.order_link_id} {status}: {reason}")
+        if ticket.on_done is not None:
+            try:
+                ticket.on_done(ticket)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика ордера {ticket.order_link_id}: {e}")
+        # done — после on_done: дождавшийся ордера видит записанную сделку и обновлённую позицию
+        ticket.done.set()
+
+    def handle_order_update(self, order):
+        """Сообщение топика order (или строка get_order_history)."""
+        ticket = self._tickets.get(order.get('orderLinkId'))
+        if ticket is None:
+            return
+        status = order.get('orderStatus')
+        with self._lock:
+            ticket.order_id = order.get('orderId') or ticket.order_id
+            if ticket.ack_at is None:
+                ticket.ack_at = time.perf_counter()
+            if status in ("New", "Created", "Untriggered") and ticket.status in ("pending", "submitted"):
+                ticket.status = "acked"
+            # Исполнения могли не прийти (REST-опрос) — накопленные значения ордера, только рост
+            cum_qty = float(order.get('cumExecQty') or 0)
+            avg_price = float(order.get('avgPrice') or 0)
+            if cum_qty > ticket.order_qty and avg_price:
+                ticket.order_qty = cum_qty
+                ticket.order_value = cum_qty * avg_price
+                if ticket.first_fill_at is None:
+                    ticket.first_fill_at = time.perf_counter()
+            if status == "PartiallyFilled":
+                ticket.status = "partially_filled"
+        if status == "Filled":
+            self._finish(ticket, "filled")
+        elif status in ("Cancelled", "Rejected", "Deactivated", "PartiallyFilledCanceled"):
+            self._finish(ticket, "filled" if ticket.filled_qty else "cancelled" if status != "Rejected" else "rejected",
+                         reason=order.get('rejectReason') or status)
+
+    def handle_execution(self, execution):
+        """Сообщение топика execution: накопление объёма, стоимости и комиссий."""
+        ticket = self._tickets.get(execution.get('orderLinkId'))
+        if ticket is None or execution.get('execType', 'Trade') != 'Trade':
+            return
+        with self._lock:
+            if execution.get('execId') in ticket.exec_ids:
+                return
+            ticket.exec_ids.add(execution.get('execId'))
+            qty = float(execution['execQty'])
+            ticket.exec_qty += qty
+            ticket.exec_value += qty * float(execution['execPrice'])
+            ticket.fees += float(execution.get('execFee') or 0)
+            if ticket.first_fill_at is None:
+                ticket.first_fill_at = time.perf_counter()
+            if ticket.ack_at is None:
+                ticket.ack_at = ticket.first_fill_at
+            filled = float(execution.get('leavesQty') or 0) == 0
+            if not filled:
+                ticket.status = "partially_filled"
+        if filled:
+            self._finish(ticket, "filled")
+
+    def latency_stats(self):
+        """Средние задержки подтверждения и исполнения (мс) по последним завершённым ордерам."""
+        with self._lock:
+            acks = [t.ack_latency_ms for t in self.completed if t.ack_latency_ms is not None]
+            fills = [t.fill_latency_ms for t in self.completed if t.fill_latency_ms is not None]
+        return {
+            "orders": len(self.completed),
+            "avg_ack_ms": sum(acks) / len(acks) if acks else None,
+            "avg_fill_ms": sum(fills) / len(fills) if fills else None,
+        }
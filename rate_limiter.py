@@ -0,0 +1,235 @@
+import time
+import logging
+import threading
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+# Общий планировщик REST-запросов к Bybit: все запросы pybit проходят через
+# адаптер requests и получают токен из корзины своего эндпоинта и из общей
+# корзины IP-лимита. Лимиты Bybit заданы на эндпоинт: корзина стартует с
+# лимита группы эндпоинта (ENDPOINT_GROUPS) и подстраивается по заголовкам
+# X-Bapi-Limit*; при исчерпании лимита эндпоинт ждёт до сброса. Ордера и отмены
+# имеют строгий приоритет и резерв общей корзины, остальные запросы
+# обслуживаются по классу вызывающего кода (request_class).
+
+# Группы эндпоинтов: первый подходящий префикс пути
+ENDPOINT_GROUPS = (
+    ("/v5/order/create", "order"),
+    ("/v5/order/cancel", "order"),  # cancel и cancel-all
+    ("/v5/order/amend", "order"),
+    ("/v5/order/", "order_query"),
+    ("/v5/execution/", "order_query"),
+    ("/v5/position/", "position"),
+    ("/v5/account/", "account"),
+    ("/v5/market/", "market"),
+)
+DEFAULT_GROUP = "other"
+GROUP_RATES = {  # Запросов в секунду на эндпоинт группы до первого ответа с заголовками лимита
+    "order": 10,
+    "order_query": 50,
+    "position": 50,
+    "account": 50,
+    "market": 100,
+    "other": 20,
+}
+GLOBAL_RATE = 120  # Лимит на IP: 600 запросов за 5 секунд
+ORDER_RESERVE = 0.2  # Доля общей корзины, которую неордерные запросы не расходуют
+
+# Классы запросов по вызывающему коду; меньше — важнее
+CLASS_PRIORITY = {
+    "order": 0,  # Создание и отмена ордеров (определяется по пути)
+    "trading": 1,  # Торговый цикл (класс по умолчанию)
+    "status": 2,  # /status
+    "analysis": 3,  # ИИ-анализ монеты из Telegram
+    "scan": 4,  # Рейтинг волатильности и массовые загрузки
+}
+DEFAULT_CLASS = "trading"
+
+_request_class = ContextVar("request_class", default=DEFAULT_CLASS)
+
+@contextmanager
+def request_class(name):
+    """with request_class("scan"): ... — класс всех REST-запросов блока (в т.ч. через run_sync/run_blocking)."""
+    token = _request_class.set(name)
+    try:
+        yield
+    finally:
+        _request_class.reset(token)
+
+def endpoint_group(path):
+    for prefix, group in ENDPOINT_GROUPS:
+        if path.startswith(prefix):
+            return group
+    return DEFAULT_GROUP
+
+class TokenBucket:
+    """Корзина токенов: rate в секунду, ёмкость — секунда лимита."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # monotonic; до этого момента токены не выдаются (лимит исчерпан на бирже)
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now, needed=1.0):
+        """Секунд до появления needed токенов (0 — можно брать)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+class RateLimitScheduler:
+    """Выдача разрешений на REST-запросы по корзинам эндпоинтов и общей корзине со строгим приоритетом классов."""
+
+    def __init__(self, group_rates=None, global_rate=GLOBAL_RATE, order_reserve=ORDER_RESERVE,
+                 on_queued=None, on_throttled=None):
+        """
+        Args:
+            group_rates: стартовые лимиты эндпоинтов по группам (до заголовков биржи)
+            on_queued: callback(класс запроса, секунды ожидания в очереди) для метрик
+            on_throttled: callback(путь эндпоинта) — биржа сообщила об исчерпании лимита
+        """
+        self.group_rates = dict(GROUP_RATES, **(group_rates or {}))
+        self.buckets = {}  # путь эндпоинта -> TokenBucket
+        self.global_bucket = TokenBucket(global_rate)
+        self.reserve = global_rate * order_reserve
+        self.on_queued = on_queued
+        self.on_throttled = on_throttled
+        self._waiters = {}  # seq -> (priority, путь)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _bucket(self, path):
+        bucket = self.buckets.get(path)
+        if bucket is None:
+            group = endpoint_group(path)
+            bucket = self.buckets[path] = TokenBucket(self.group_rates.get(group, self.group_rates[DEFAULT_GROUP]))
+        return bucket
+
+    def _wait_time(self, priority, path, now):
+        reserve = 0.0 if priority == 0 else self.reserve
+        return max(self._bucket(path).wait_time(now), self.global_bucket.wait_time(now, 1.0 + reserve))
+
+    def acquire(self, path):
+        """Блокирует поток до выдачи разрешения на запрос к эндпоинту path."""
+        name = "order" if endpoint_group(path) == "order" else _request_class.get()
+        priority = CLASS_PRIORITY.get(name, CLASS_PRIORITY[DEFAULT_CLASS])
+        start = time.monotonic()
+        with self._cond:
+            seq = next(self._seq)
+            self._waiters[seq] = (priority, path)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.global_bucket.refill(now)
+                    for bucket in self.buckets.values():
+                        bucket.refill(now)
+                    wait = self._wait_time(priority, path, now)
+                    # Строгий приоритет: уступаем более важным запросам, которые сейчас могут уйти
+                    if wait == 0 and not any(
+                        (other_priority, other_seq) < (priority, seq)
+                        and self._wait_time(other_priority, other_path, now) == 0
+                        for other_seq, (other_priority, other_path) in self._waiters.items()
+                    ):
+                        break
+                    self._cond.wait(timeout=min(wait, 1.0) if wait > 0 else 0.05)
+                self._bucket(path).tokens -= 1
+                self.global_bucket.tokens -= 1
+            finally:
+                del self._waiters[seq]
+                self._cond.notify_all()
+        if self.on_queued is not None:
+            self.on_queued(name, time.monotonic() - start)
+
+    def on_response(self, path, headers, status_code):
+        """Подстройка корзины эндпоинта по заголовкам лимита Bybit (ошибки разбора только логируются)."""
+        limit = headers.get("X-Bapi-Limit")
+        remaining = headers.get("X-Bapi-Limit-Status")
+        reset_ms = headers.get("X-Bapi-Limit-Reset-Timestamp")
+        throttled = status_code in (403, 429)
+        # Ждём до сброса лимита (часы биржи и локальные могут расходиться — не дольше секунды)
+        delay = 1.0
+        with self._cond:
+            bucket = self._bucket(path)
+            try:
+                if limit:
+                    bucket.rate = bucket.capacity = float(limit)
+                if remaining is not None:
+                    bucket.tokens = min(bucket.tokens, float(remaining))
+                    throttled = throttled or float(remaining) <= 0
+                if throttled and reset_ms:
+                    delay = min(max(int(reset_ms) / 1000 - time.time(), 0.05), 1.0)
+            except ValueError:
+                logging.error(f"Некорректные заголовки лимита Bybit: {limit}, {remaining}, {reset_ms}")
+            if throttled:
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + delay)
+                bucket.tokens = min(bucket.tokens, 0.0)
+        if throttled:
+            logging.warning(f"Лимит REST-запросов {path} исчерпан")
+            if self.on_throttled is not None:
+                self.on_throttled(path)
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter requests: каждый запрос ждёт разрешения планировщика."""
+
+    def __init__(self, scheduler, **kwargs):
+        self.scheduler = scheduler
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        path = urlsplit(request.url).path
+        self.scheduler.acquire(path)
+        response = super().send(request, **kwargs)
+        self.scheduler.on_response(path, response.headers, response.status_code)
+        return response
+
+# Проверка приоритета на локальных корзинах: python rate_limiter.py
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    delays = {}
+
+    def on_queued(name, seconds):
+        delays.setdefault(name, []).append(seconds)
+
+    scheduler = RateLimitScheduler(group_rates={"market": 1000, "order": 10}, global_rate=50, on_queued=on_queued)
+    finished = []
+
+    def scan():
+        with request_class("scan"):
+            for _ in range(40):
+                scheduler.acquire("/v5/market/kline")
+        finished.append("scan")
+
+    def order():
+        time.sleep(0.2)  # Ордер приходит, когда сканирование уже израсходовало корзину
+        scheduler.acquire("/v5/order/create")
+        finished.append("order")
+
+    threads = [threading.Thread(target=scan) for _ in range(4)] + [threading.Thread(target=order)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    for name, values in sorted(delays.items()):
+        values.sort()
+        print(f"{name}: {len(values)} запросов, ожидание p50 {values[len(values) // 2] * 1000:.1f} мс, "
+              f"макс {values[-1] * 1000:.1f} мс")
+    # Ордер не ждёт очереди сканирования, хотя сканирование упирается в общий лимит
+    ok = max(delays["order"]) < 0.01 and sorted(delays["scan"])[len(delays["scan"]) // 2] > 0.01
+    print(f"160 запросов сканирования за {elapsed:.2f} с при лимите 50/с, завершение: {', '.join(finished)}")
+    print("OK" if ok else "ОШИБКА")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
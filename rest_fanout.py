@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import functools
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from rate_limiter import RateLimitedAdapter
+
+# Параллельное выполнение блокирующих REST-вызовов pybit.
+# pybit работает синхронно через requests, поэтому запросы выполняются в общем
+# пуле потоков, а asyncio собирает результаты: задержка цикла определяется
+# самым медленным запросом, а не суммой всех.
+
+REST_WORKERS = 8  # Потоков и keep-alive соединений на хост
+
+_executor = ThreadPoolExecutor(max_workers=REST_WORKERS, thread_name_prefix="rest")
+_loop = None
+_loop_lock = threading.Lock()
+
+def configure_session_pool(session, pool_size=REST_WORKERS, scheduler=None):
+    """
+    Размер пула keep-alive соединений requests.Session под число параллельных запросов.
+    Args:
+        scheduler: rate_limiter.RateLimitScheduler — все запросы сессии проходят через его лимиты
+    """
+    if scheduler is not None:
+        adapter = RateLimitedAdapter(scheduler, pool_connections=pool_size, pool_maxsize=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.client.mount("https://", adapter)
+    session.client.mount("http://", adapter)
+
+def _get_loop():
+    """Фоновый event loop для вызова корутин из синхронного кода."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="rest-loop", daemon=True)
+            thread.start()
+        return _loop
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполнение блокирующей функции в общем пуле REST-потоков (с контекстом вызывающего кода, как asyncio.to_thread)."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+async def gather_dict(coroutines):
+    """
+    Параллельное выполнение словаря корутин.
+    Returns:
+        dict с теми же ключами; для упавших запросов значение — исключение
+    """
+    names = list(coroutines)
+    results = await asyncio.gather(*coroutines.values(), return_exceptions=True)
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка параллельного запроса {name}: {result}")
+    return dict(zip(names, results))
+
+def run_sync(coroutine):
+    """Синхронная обёртка: выполняет корутину в фоновом event loop и ждёт результат."""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result()
@@ -0,0 +1,294 @@
+import logging
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from array_indicators import rsi as rsi_indicator, ema, average_true_range
+from candle_patterns import scan_candle_patterns, first_pattern_index, first_pattern, PATTERN_NAMES
+
+# Логика стратегии без обращения к бирже: используется и в торговом цикле, и в бэктесте
+
+# Параметры торговли
+LEVERAGE = 5
+POSITION_SIZE = 0.001  # Размер позиции в BTC
+STOP_LOSS_PCT = 0.005  # 0.5%
+TAKE_PROFIT_PCT = 0.01  # 1%
+MAX_LOSS_PCT = 0.05  # Максимальный убыток 5%
+
+# Бычьи паттерны
+BULLISH_PATTERNS = [
+    "Bullish Engulfing", "Doji", "Hammer", "Morning Star",
+    "Bullish Harami", "Piercing Line", "Three White Soldiers",
+    "Bullish Kicker", "Inverted Hammer"
+]
+
+# Медвежьи паттерны
+BEARISH_PATTERNS = [
+    "Bearish Engulfing", "Doji", "Shooting Star",
+    "Bearish Harami", "Dark Pool Cover", "Three Black Crows",
+    "Bearish Kicker", "Hanging Man"
+]
+
+# Функция для расчета индикаторов RSI, EMA, ATR и MACD
+def calculate_indicators(df):
+    """Расчет индикаторов с улучшенной валидацией данных (df — DataFrame или kline_buffer.Candles)."""
+    try:
+        if len(df) < 26:
+            logging.error(f"Недостаточно данных для расчета индикаторов: {len(df)} свечей")
+            return None, None, None, None, None, None, None
+        
+        open_, high, low, close = (np.asarray(df[name], dtype=np.float64) for name in ('open', 'high', 'low', 'close'))
+        
+        # Проверка на пропущенные значения
+        if np.isnan(close).any() or np.isnan(high).any() or np.isnan(low).any():
+            logging.error("Обнаружены пропущенные значения в данных")
+            return None, None, None, None, None, None, None
+        
+        # Фильтрация данных
+        valid = (close > 0) & (high > 0) & (low > 0)
+        if not valid.all():
+            open_, high, low, close = open_[valid], high[valid], low[valid], close[valid]
+        if len(close) < 26:
+            logging.error("После фильтрации данных осталось недостаточно свечей")
+            return None, None, None, None, None, None, None
+        
+        # Расчет индикаторов (MACD 12/26/9 из уже посчитанных EMA12 и EMA26)
+        ema_fast_series = ema(close, 12)
+        ema_slow_series = ema(close, 26)
+        macd_series = ema_fast_series - ema_slow_series
+        signal_series = ema(macd_series, 9)
+        indicators = {
+            'RSI': rsi_indicator(close, window=14),
+            'EMA12': ema_fast_series,
+            'EMA26': ema_slow_series,
+            'ATR': average_true_range(high, low, close, window=14),
+            'MACD': macd_series,
+            'Signal': signal_series
+        }
+        
+        # Проверка каждого индикатора
+        for name, series in indicators.items():
+            if np.isnan(series).all():
+                logging.error(f"Ошибка: индикатор {name} пуст или содержит только NaN")
+                return None, None, None, None, None, None, None
+            if np.isnan(series[-1]):
+                logging.error(f"Ошибка: последнее значение индикатора {name} отсутствует")
+                return None, None, None, None, None, None, None
+        
+        # Получение последних значений
+        rsi_value = float(indicators['RSI'][-1])
+        ema_fast_value = float(indicators['EMA12'][-1])
+        ema_slow_value = float(indicators['EMA26'][-1])
+        atr_value = float(indicators['ATR'][-1])
+        macd_line = float(macd_series[-1])
+        signal_line = float(signal_series[-1])
+        candle_pattern = first_pattern(scan_candle_patterns(open_[-3:], high[-3:], low[-3:], close[-3:])[-1])
+        
+        # Формирование сводки индикаторов
+        indicator_summary = (
+            f"📊 Текущие индикаторы:\n"
+            f"  RSI: {rsi_value:.2f}\n"
+            f"  EMA12: {ema_fast_value:.2f}\n"
+            f"  EMA26: {ema_slow_value:.2f}\n"
+            f"  ATR: {atr_value:.2f}\n"
+            f"  MACD: {macd_line:.2f}\n"
+            f"  Signal: {signal_line:.2f}\n"
+            f"  Свечной паттерн: {candle_pattern if candle_pattern else 'Не обнаружен'}"
+        )
+        logging.info(indicator_summary)
+        
+        return rsi_value, ema_fast_value, ema_slow_value, atr_value, macd_line, signal_line, candle_pattern
+    except Exception as e:
+        logging.error(f"Ошибка при расчете индикаторов: {e}")
+        return None, None, None, None, None, None, None
+
+# Функция для генерации торговых сигналов
+def generate_signal(rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern):
+    """Генерация торговых сигналов с расширенным набором паттернов."""
+    try:
+        if any(v is None for v in [rsi, ema_fast, ema_slow, atr, candle_pattern]):
+            logging.warning("Не удалось сгенерировать сигнал: одно из значений индикаторов равно None")
+            return None
+        
+        # Логирование входных данных для отладки
+        logging.info(
+            f"Генерация сигнала:\n"
+            f"  RSI: {rsi:.2f}\n"
+            f"  EMA12: {ema_fast:.2f}\n"
+            f"  EMA26: {ema_slow:.2f}\n"
+            f"  Candle Pattern: {candle_pattern if candle_pattern else 'Не обнаружен'}"
+        )
+        
+        # Условия для покупки: RSI < 55, EMA12 > EMA26, бычьи свечные паттерны
+        if (rsi < 55 and ema_fast > ema_slow and candle_pattern in BULLISH_PATTERNS):
+            logging.info("Сгенерирован сигнал Buy: все условия выполнены")
+            return "Buy"
+        
+        # Условия для продажи: RSI > 55, EMA12 < EMA26, медвежьи свечные паттерны
+        elif (rsi > 55 and ema_fast < ema_slow and candle_pattern in BEARISH_PATTERNS):
+            logging.info("Сгенерирован сигнал Sell: все условия выполнены")
+            return "Sell"
+        
+        # Логируем причину отсутствия сигнала
+        if rsi >= 55:
+            logging.info("Нет сигнала Buy: RSI >= 55")
+        elif rsi <= 55:
+            logging.info("Нет сигнала Sell: RSI <= 55")
+        if ema_fast <= ema_slow:
+            logging.info("Нет сигнала Buy: EMA12 <= EMA26")
+        elif ema_fast >= ema_slow:
+            logging.info("Нет сигнала Sell: EMA12 >= EMA26")
+        if candle_pattern not in BULLISH_PATTERNS:
+            logging.info("Нет сигнала Buy: отсутствует нужный свечной паттерн")
+        if candle_pattern not in BEARISH_PATTERNS:
+            logging.info("Нет сигнала Sell: отсутствует нужный свечной паттерн")
+        
+        return None
+    except Exception as e:
+        logging.error(f"Ошибка при генерации сигнала: {e}")
+        return None
+
+def generate_signal_test(rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern):
+    """Тестовая версия генерации сигналов с упрощенными условиями."""
+    try:
+        if any(v is None for v in [rsi, ema_fast, ema_slow, atr, macd_line, signal_line, candle_pattern]):
+            logging.warning("Не удалось сгенерировать тестовый сигнал: одно из значений индикаторов равно None")
+            return None
+        
+        logging.info(
+            f"Генерация тестового сигнала:\n"
+            f"  RSI: {rsi:.2f}\n"
+            f"  EMA12: {ema_fast:.2f}\n"
+            f"  EMA26: {ema_slow:.2f}\n"
+            f"  MACD: {macd_line:.2f}\n"
+            f"  Signal: {signal_line:.2f}\n"
+            f"  Candle Pattern: {candle_pattern if candle_pattern else 'Не обнаружен'}"
+        )
+        
+        # Упрощенные условия для тестирования
+        if rsi < 60 and ema_fast > ema_slow:
+            logging.info("Тестовый сигнал Buy: RSI < 60 и EMA12 > EMA26")
+            return "Buy"
+        elif rsi > 60 and ema_fast < ema_slow:
+            logging.info("Тестовый сигнал Sell: RSI > 60 и EMA12 < EMA26")
+            return "Sell"
+        else:
+            if rsi >= 60:
+                logging.info("Нет тестового сигнала Buy: RSI >= 60")
+            elif rsi <= 60:
+                logging.info("Нет тестового сигнала Sell: RSI <= 60")
+            if ema_fast <= ema_slow:
+                logging.info("Нет тестового сигнала Buy: EMA12 <= EMA26")
+            elif ema_fast >= ema_slow:
+                logging.info("Нет тестового сигнала Sell: EMA12 >= EMA26")
+            return None
+    except Exception as e:
+        logging.error(f"Ошибка при генерации тестового сигнала: {e}")
+        return None
+
+def ai_assist(df, base_rsi_threshold=55, atr_window=None):
+    """
+    Динамически корректирует пороговые значения RSI на основе волатильности (ATR).
+    Args:
+        df: свечи (DataFrame или kline_buffer.Candles)
+        base_rsi_threshold: Базовый порог RSI (по умолчанию 55)
+        atr_window: Последние 14 значений ATR из IndicatorEngine (если есть, ATR не пересчитывается)
+    Returns:
+        Корректированный порог RSI
+    """
+    try:
+        if atr_window is not None and len(atr_window) >= 14:
+            latest_atr = float(atr_window[-1])
+            avg_atr = sum(atr_window[-14:]) / 14
+        else:
+            if len(df) < 14:
+                logging.warning("Недостаточно данных для расчета ATR в ai_assist")
+                return base_rsi_threshold
+            
+            atr_series = average_true_range(np.asarray(df['high'], dtype=np.float64), np.asarray(df['low'], dtype=np.float64),
+                                            np.asarray(df['close'], dtype=np.float64), window=14)
+            if np.isnan(atr_series).all():
+                logging.warning("ATR содержит NaN, используется базовый порог RSI")
+                return base_rsi_threshold
+            
+            latest_atr = float(atr_series[-1])
+            avg_atr = atr_series[-14:].mean()
+        
+        # Корректировка порога RSI
+        if latest_atr > avg_atr * 1.2:  # Если ATR выше среднего на 20%
+            adjusted_rsi = base_rsi_threshold - 5
+            logging.info(f"Высокая волатильность (ATR: {latest_atr:.2f}, среднее: {avg_atr:.2f}), RSI порог снижен до {adjusted_rsi}")
+            return max(30, adjusted_rsi)  # Не опускаем ниже 30
+        elif latest_atr < avg_atr * 0.8:  # Если ATR ниже среднего на 20%
+            adjusted_rsi = base_rsi_threshold + 5
+            logging.info(f"Низкая волатильность (ATR: {latest_atr:.2f}, среднее: {avg_atr:.2f}), RSI порог увеличен до {adjusted_rsi}")
+            return min(70, adjusted_rsi)  # Не поднимаем выше 70
+        else:
+            logging.info(f"Волатильность в норме (ATR: {latest_atr:.2f}, среднее: {avg_atr:.2f}), используется базовый RSI порог {base_rsi_threshold}")
+            return base_rsi_threshold
+    except Exception as e:
+        logging.error(f"Ошибка в ai_assist: {e}")
+        return base_rsi_threshold
+
+# Векторные версии для бэктеста: те же правила, но по всей истории сразу
+
+def calculate_indicator_series(df):
+    """
+    Индикаторы calculate_indicators для каждой свечи истории.
+    Returns:
+        dict с массивами rsi, ema_fast, ema_slow, atr, macd, signal_line, pattern_mask, pattern_index
+    """
+    open_, high, low, close = (np.asarray(df[name], dtype=np.float64) for name in ('open', 'high', 'low', 'close'))
+    ema_fast = ema(close, 12)
+    ema_slow = ema(close, 26)
+    macd_line = ema_fast - ema_slow
+    pattern_mask = scan_candle_patterns(open_, high, low, close)
+    return {
+        'rsi': rsi_indicator(close, window=14),
+        'ema_fast': ema_fast,
+        'ema_slow': ema_slow,
+        'atr': average_true_range(high, low, close, window=14),
+        'macd': macd_line,
+        'signal_line': ema(macd_line, 9),
+        'pattern_mask': pattern_mask,
+        'pattern_index': first_pattern_index(pattern_mask),
+    }
+
+def ai_assist_series(atr, base_rsi_threshold=55):
+    """Порог RSI из ai_assist для каждой свечи."""
+    atr = np.asarray(atr, dtype=np.float64)
+    avg_atr = np.full(len(atr), np.nan)
+    if len(atr) >= 14:
+        avg_atr[13:] = sliding_window_view(atr, 14).mean(axis=1)
+    thresholds = np.full(len(atr), float(base_rsi_threshold))
+    thresholds[atr > avg_atr * 1.2] = max(30, base_rsi_threshold - 5)
+    thresholds[atr < avg_atr * 0.8] = min(70, base_rsi_threshold + 5)
+    return thresholds
+
+def generate_signal_series(indicators, test=False, rsi_threshold=None):
+    """
+    Сигналы generate_signal (или generate_signal_test при test=True) для каждой свечи.
+    Returns:
+        np.ndarray[int8]: 1 — Buy, -1 — Sell, 0 — нет сигнала
+    """
+    rsi = indicators['rsi']
+    ema_fast = indicators['ema_fast']
+    ema_slow = indicators['ema_slow']
+    pattern_index = indicators['pattern_index']
+    if rsi_threshold is None:
+        rsi_threshold = 60 if test else 55
+    # calculate_indicators возвращает значения только когда все индикаторы определены
+    valid = ~(np.isnan(rsi) | np.isnan(ema_fast) | np.isnan(ema_slow) | np.isnan(indicators['atr']) |
+              np.isnan(indicators['macd']) | np.isnan(indicators['signal_line']))
+    # Сигнал требует обнаруженного свечного паттерна
+    valid &= pattern_index >= 0
+    if test:
+        buy = valid & (rsi < rsi_threshold) & (ema_fast > ema_slow)
+        sell = valid & (rsi > rsi_threshold) & (ema_fast < ema_slow)
+    else:
+        bullish = np.array([name in BULLISH_PATTERNS for name in PATTERN_NAMES] + [False])
+        bearish = np.array([name in BEARISH_PATTERNS for name in PATTERN_NAMES] + [False])
+        buy = valid & (rsi < rsi_threshold) & (ema_fast > ema_slow) & bullish[pattern_index]
+        sell = valid & (rsi > rsi_threshold) & (ema_fast < ema_slow) & bearish[pattern_index]
+    signals = np.zeros(len(rsi), dtype=np.int8)
+    signals[buy] = 1
+    signals[sell & ~buy] = -1
+    return signals
@@ -0,0 +1,216 @@
+import math
+import threading
+from collections import deque
+
+# Потоковые (инкрементальные) версии индикаторов из библиотеки ta.
+# Каждый update() обрабатывает одну свечу за O(1) и возвращает то же значение,
+# что и соответствующий индикатор ta на всей истории. Повторный update() с
+# new_bar=False пересчитывает текущую (незакрытую) свечу от состояния
+# предыдущей закрытой свечи; значение этой закрытой свечи — closed_value.
+# Совпадение с ta проверяет indicator_parity.py.
+
+NAN = float('nan')
+
+def _ema_step(state, value, window):
+    """Шаг EMA как в ta (ewm(span=window, adjust=False, min_periods=window))."""
+    count, ema = state
+    alpha = 2.0 / (window + 1)
+    ema = value if count == 0 else alpha * value + (1 - alpha) * ema
+    count += 1
+    return (count, ema), (ema if count >= window else NAN)
+
+class _StreamingIndicator:
+    """Базовый класс: хранит состояние до текущей свечи и после неё."""
+
+    def __init__(self):
+        self._base = self._initial_state()
+        self._current = self._base
+        self.value = NAN
+        self.closed_value = NAN  # Значение предыдущей (закрытой) свечи
+
+    def _initial_state(self):
+        raise NotImplementedError
+
+    def _step(self, state, *inputs):
+        raise NotImplementedError
+
+    def update(self, *inputs, new_bar=True):
+        if new_bar:
+            self._base = self._current
+            self.closed_value = self.value
+        self._current, self.value = self._step(self._base, *inputs)
+        return self.value
+
+class StreamingEMA(_StreamingIndicator):
+    """EMA, совпадает с ta.trend.EMAIndicator."""
+
+    def __init__(self, window):
+        self.window = window
+        super().__init__()
+
+    def _initial_state(self):
+        return (0, 0.0)
+
+    def _step(self, state, close):
+        return _ema_step(state, close, self.window)
+
+class StreamingRSI(_StreamingIndicator):
+    """RSI со сглаживанием Уайлдера, совпадает с ta.momentum.RSIIndicator."""
+
+    def __init__(self, window=14):
+        self.window = window
+        super().__init__()
+
+    def _initial_state(self):
+        return (0, NAN, 0.0, 0.0)
+
+    def _step(self, state, close):
+        count, prev_close, ema_up, ema_down = state
+        alpha = 1.0 / self.window
+        if count == 0:
+            # ta заменяет первую (NaN) разницу на 0
+            ema_up, ema_down = 0.0, 0.0
+        else:
+            diff = close - prev_close
+            up = diff if diff > 0 else 0.0
+            down = -diff if diff < 0 else 0.0
+            ema_up = (1 - alpha) * ema_up + alpha * up
+            ema_down = (1 - alpha) * ema_down + alpha * down
+        count += 1
+        if count < self.window:
+            value = NAN
+        elif ema_down == 0:
+            value = 100.0
+        else:
+            value = 100.0 - 100.0 / (1.0 + ema_up / ema_down)
+        return (count, close, ema_up, ema_down), value
+
+class StreamingATR(_StreamingIndicator):
+    """ATR, совпадает с ta.volatility.AverageTrueRange (0 до заполнения окна)."""
+
+    def __init__(self, window=14):
+        self.window = window
+        super().__init__()
+
+    def _initial_state(self):
+        return (0, NAN, 0.0, 0.0)
+
+    def _step(self, state, high, low, close):
+        count, prev_close, tr_sum, atr = state
+        if count == 0:
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        count += 1
+        if count < self.window:
+            tr_sum += true_range
+            value = 0.0
+        elif count == self.window:
+            tr_sum += true_range
+            atr = tr_sum / self.window
+            value = atr
+        else:
+            atr = (atr * (self.window - 1) + true_range) / float(self.window)
+            value = atr
+        return (count, close, tr_sum, atr), value
+
+class StreamingMACD(_StreamingIndicator):
+    """MACD и сигнальная линия, совпадает с ta.trend.MACD. value = (macd, signal)."""
+
+    def __init__(self, window_slow=26, window_fast=12, window_sign=9):
+        self.window_slow = window_slow
+        self.window_fast = window_fast
+        self.window_sign = window_sign
+        super().__init__()
+        self.value = self.closed_value = (NAN, NAN)
+
+    def _initial_state(self):
+        return ((0, 0.0), (0, 0.0), (0, 0.0))
+
+    def _step(self, state, close):
+        fast_state, slow_state, sign_state = state
+        fast_state, fast = _ema_step(fast_state, close, self.window_fast)
+        slow_state, slow = _ema_step(slow_state, close, self.window_slow)
+        macd = fast - slow
+        signal = NAN
+        # Сигнальная EMA начинается с первого определённого значения MACD
+        if not math.isnan(macd):
+            sign_state, signal = _ema_step(sign_state, macd, self.window_sign)
+        return (fast_state, slow_state, sign_state), (macd, signal)
+
+class IndicatorEngine:
+    """Набор потоковых индикаторов стратегии (RSI14, EMA12/26, ATR14, MACD 12/26/9) для одного символа."""
+
+    def __init__(self, atr_window=14):
+        self.rsi = StreamingRSI(14)
+        self.ema_fast = StreamingEMA(12)
+        self.ema_slow = StreamingEMA(26)
+        self.atr = StreamingATR(14)
+        self.macd = StreamingMACD(window_slow=26, window_fast=12, window_sign=9)
+        self.last_timestamp = None
+        self.closed_timestamp = None  # Предыдущая свеча: её значения уже не меняются
+        self.count = 0
+        # Значения ATR закрытых свечей для ai_assist
+        self._atr_window = atr_window
+        self._atr_history = deque(maxlen=atr_window)
+        self._lock = threading.Lock()
+
+    def update(self, timestamp, high, low, close):
+        """Обновление по свече; та же метка времени пересчитывает текущую свечу."""
+        with self._lock:
+            if self.last_timestamp is not None and timestamp < self.last_timestamp:
+                return False
+            new_bar = self.last_timestamp is None or timestamp > self.last_timestamp
+            if new_bar:
+                if self.count:
+                    self._atr_history.append(self.atr.value)
+                    self.closed_timestamp = self.last_timestamp
+                self.count += 1
+                self.last_timestamp = timestamp
+            self.rsi.update(close, new_bar=new_bar)
+            self.ema_fast.update(close, new_bar=new_bar)
+            self.ema_slow.update(close, new_bar=new_bar)
+            self.atr.update(high, low, close, new_bar=new_bar)
+            self.macd.update(close, new_bar=new_bar)
+            return True
+
+    def seed(self, timestamps, highs, lows, closes):
+        """Прогон истории свечей (например, после загрузки буфера)."""
+        for ts, high, low, close in zip(timestamps, highs, lows, closes):
+            self.update(int(ts), float(high), float(low), float(close))
+
+    def _closed(self, timestamp):
+        """False — свеча timestamp текущая, True — предыдущая закрытая, None — движок её не хранит."""
+        if timestamp is None or timestamp == self.last_timestamp:
+            return False
+        if timestamp == self.closed_timestamp:
+            return True
+        return None
+
+    def values(self, timestamp=None):
+        """
+        (rsi, ema_fast, ema_slow, atr, macd, signal) на свече timestamp (по умолчанию текущей).
+        None, если истории недостаточно или свеча не текущая и не предыдущая закрытая.
+        """
+        with self._lock:
+            closed = self._closed(timestamp)
+            if closed is None:
+                return None
+            value = (lambda indicator: indicator.closed_value) if closed else (lambda indicator: indicator.value)
+            macd_line, signal_line = value(self.macd)
+            result = (value(self.rsi), value(self.ema_fast), value(self.ema_slow),
+                      value(self.atr), macd_line, signal_line)
+            count = self.count - closed
+        if count < 26 or any(math.isnan(v) for v in result):
+            return None
+        return result
+
+    def atr_window(self, timestamp=None):
+        """Последние atr_window значений ATR до свечи timestamp включительно (по умолчанию текущей); None — свечи нет."""
+        with self._lock:
+            closed = self._closed(timestamp)
+            if closed is None:
+                return None
+            if closed:
+                return list(self._atr_history)
+            return list(self._atr_history)[1 - self._atr_window:] + [self.atr.value]
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import logging
+import threading
+
+# Кэш со стратегией stale-while-revalidate: get() всегда сразу возвращает
+# последнее удачное значение (из памяти, при старте — из файла) вместе с его
+# возрастом, а обновление выполняется в фоновом потоке заранее, до истечения TTL.
+# Файл записывается через временный файл и os.replace, поэтому читатель
+# никогда не видит частично записанный JSON.
+
+class StaleWhileRevalidateCache:
+    """Кэш одного значения с фоновым обновлением и атомарным сохранением на диск."""
+
+    def __init__(self, path, loader, ttl=3600, refresh_ahead=0.2, name=None):
+        """
+        Args:
+            loader: функция без аргументов, возвращающая новое значение (JSON-сериализуемое);
+                исключение или пустой результат оставляют прежнее значение
+            ttl: срок актуальности значения в секундах
+            refresh_ahead: доля ttl до истечения, когда начинается фоновое обновление
+        """
+        self.path = path
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_after = ttl * (1 - refresh_ahead)
+        self.name = name or os.path.basename(path)
+        self._value = None
+        self._timestamp = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._timer = None
+        self._load_file()
+
+    def _load_file(self):
+        try:
+            with open(self.path, "r") as f:
+                cache = json.load(f)
+            self._value, self._timestamp = cache["data"], cache["timestamp"]
+            logging.info(f"Кэш {self.name}: загружен из файла, возраст {self.age():.0f} с")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Ошибка при чтении кэша {self.name}: {e}")
+
+    def _save_file(self, value, timestamp):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"timestamp": timestamp, "data": value}, f)
+        os.replace(tmp_path, self.path)
+
+    def age(self):
+        """Возраст значения в секундах (None, если значения ещё нет)."""
+        if self._timestamp is None:
+            return None
+        return time.time() - self._timestamp
+
+    def refresh(self):
+        """Синхронное обновление; при ошибке остаётся последнее удачное значение."""
+        try:
+            return self._refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh(self):
+        start_time = time.time()
+        try:
+            value = self.loader()
+        except Exception as e:
+            logging.error(f"Ошибка обновления кэша {self.name}: {e}")
+            return False
+        if not value:
+            logging.warning(f"Кэш {self.name}: пустой результат, сохраняется прежнее значение")
+            return False
+        timestamp = time.time()
+        with self._lock:
+            self._value, self._timestamp = value, timestamp
+        try:
+            self._save_file(value, timestamp)
+        except Exception as e:
+            logging.error(f"Ошибка при записи кэша {self.name}: {e}")
+        logging.info(f"Кэш {self.name} обновлён за {time.time() - start_time:.2f} секунд")
+        return True
+
+    def refresh_async(self):
+        """Фоновое обновление; одновременно выполняется не больше одного."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name=f"cache-{self.name}", daemon=True).start()
+
+    def get(self, force_refresh=False):
+        """
+        Последнее удачное значение и его возраст; не ждёт обновления, если значение уже есть.
+        Returns:
+            (value, age) — (None, None), если значения нет и первая загрузка не удалась
+        """
+        if self._value is None:
+            self.refresh()
+        elif force_refresh or self.age() >= self.refresh_after:
+            self.refresh_async()
+        return self._value, self.age()
+
+    def start(self):
+        """Периодическое обновление до истечения TTL, даже если get() не вызывается."""
+        def tick():
+            age = self.age()
+            if age is None or age >= self.refresh_after:
+                self.refresh_async()
+                delay = self.refresh_after
+            else:
+                delay = self.refresh_after - age
+            self._timer = threading.Timer(max(1.0, delay), tick)
+            self._timer.daemon = True
+            self._timer.start()
+        tick()
@@ -0,0 +1,134 @@
+import time
+import heapq
+import itertools
+import logging
+import threading
+import requests
+
+# Неблокирующая очередь исходящих сообщений Telegram.
+# send() только кладёт сообщение в очередь; отправкой занимается фоновый поток
+# через одну keep-alive сессию. Сообщения уходят по приоритету, устаревшие
+# сообщения с одинаковым coalesce_key заменяются свежими, а частота отправки
+# ограничена лимитом Telegram для одного чата (с учётом retry_after при 429).
+
+PRIORITY_CRITICAL = 0  # Исполнения ордеров, ошибки ордеров, риск-алерты
+PRIORITY_NORMAL = 1  # Ответы на команды
+PRIORITY_STATUS = 2  # Периодические сводки индикаторов и статуса
+
+TELEGRAM_MIN_INTERVAL = 1.0  # Не чаще одного сообщения в секунду в один чат
+TELEGRAM_MAX_RETRIES = 5
+
+class TelegramOutbox:
+    """Очередь исходящих сообщений с приоритетами, объединением и ограничением частоты."""
+
+    def __init__(self, token, chat_id, min_interval=TELEGRAM_MIN_INTERVAL, on_delivered=None):
+        """
+        Args:
+            on_delivered: callback(секунды от постановки в очередь до отправки) для метрик
+        """
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.session = requests.Session()
+        self.on_delivered = on_delivered
+        self._heap = []  # (priority, seq, payload, coalesce_key, время постановки)
+        self._pending_keys = {}  # coalesce_key -> seq актуального сообщения
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._next_send = 0.0
+        self._in_flight = 0
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="telegram-outbox", daemon=True)
+                self._thread.start()
+
+    def send(self, message, reply_markup=None, priority=PRIORITY_NORMAL, coalesce_key=None):
+        """
+        Постановка сообщения в очередь (не блокирует).
+        Args:
+            coalesce_key: если в очереди уже есть сообщение с этим ключом, оно заменяется новым
+        """
+        payload = {
+            "chat_id": self.chat_id,
+            "text": message,
+            "parse_mode": "Markdown"
+        }
+        if reply_markup:
+            logging.info(f"Отправка сообщения с reply_markup: {reply_markup}")
+            payload["reply_markup"] = reply_markup
+        with self._cond:
+            seq = next(self._seq)
+            if coalesce_key is not None:
+                if coalesce_key in self._pending_keys:
+                    logging.info(f"Устаревшее сообщение Telegram ({coalesce_key}) заменено новым")
+                self._pending_keys[coalesce_key] = seq
+            heapq.heappush(self._heap, (priority, seq, payload, coalesce_key, time.perf_counter()))
+            self._cond.notify()
+        self.start()
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def flush(self, timeout=10.0):
+        """Ожидание отправки очереди (например, перед остановкой бота)."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while (self._heap or self._in_flight) and time.time() < deadline:
+                self._cond.wait(timeout=max(0.0, deadline - time.time()))
+            return not self._heap and not self._in_flight
+
+    def _pop(self):
+        """Следующее сообщение по приоритету; заменённые сообщения пропускаются."""
+        with self._cond:
+            while True:
+                while not self._heap:
+                    self._cond.wait()
+                priority, seq, payload, coalesce_key, queued_at = heapq.heappop(self._heap)
+                if coalesce_key is not None:
+                    if self._pending_keys.get(coalesce_key) != seq:
+                        self._cond.notify_all()
+                        continue
+                    del self._pending_keys[coalesce_key]
+                self._in_flight += 1
+                return payload, queued_at
+
+    def _run(self):
+        while True:
+            payload, queued_at = self._pop()
+            try:
+                if self._deliver(payload) and self.on_delivered is not None:
+                    self.on_delivered(time.perf_counter() - queued_at)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _deliver(self, payload):
+        for attempt in range(TELEGRAM_MAX_RETRIES):
+            delay = self._next_send - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_send = time.time() + self.min_interval
+            try:
+                response = self.session.post(self.url, json=payload, timeout=10)
+                if response.status_code == 200:
+                    logging.info(f"Уведомление успешно отправлено в Telegram: {payload['text']}")
+                    return True
+                if response.status_code == 429:
+                    retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+                    logging.warning(f"Лимит Telegram, повтор через {retry_after} с")
+                    self._next_send = time.time() + retry_after
+                    continue
+                logging.error(f"Ошибка отправки уведомления в Telegram: {response.text}")
+                if response.status_code < 500:
+                    return False
+            except Exception as e:
+                logging.error(f"Ошибка при отправке уведомления в Telegram: {e}")
+            # Сетевая ошибка или 5xx: экспоненциальная задержка
+            self._next_send = time.time() + self.min_interval * 2 ** attempt
+        logging.error(f"Сообщение Telegram не отправлено после {TELEGRAM_MAX_RETRIES} попыток: {payload['text']}")
+        return False
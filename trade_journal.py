@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+# Журнал сделок: записи копятся в памяти и сбрасываются на диск пачкой
+# (group commit) фоновым потоком — раз в JOURNAL_FLUSH_INTERVAL секунд или
+# при накоплении JOURNAL_FLUSH_BATCH записей. На диске журнал разбит на
+# сегменты (новый сегмент каждые сутки UTC или после JOURNAL_SEGMENT_MAX_ROWS
+# записей); сегмент — каталог с файлом на колонку и meta.json, в котором
+# хранятся словарь символов, диапазон времени и статистика по символам.
+# Статистика для /status читается из памяти, запросы по времени отбрасывают
+# сегменты по диапазону и ищут границы бинарным поиском по колонке времени.
+
+TRADES_JOURNAL_DIR = "trades_journal"
+JOURNAL_FLUSH_INTERVAL = 1.0  # Максимальная задержка записи на диск (секунды)
+JOURNAL_FLUSH_BATCH = 256  # Сброс без ожидания таймера при таком числе записей в буфере
+JOURNAL_SEGMENT_MAX_ROWS = 1_000_000  # Ротация сегмента по размеру
+
+JOURNAL_COLUMNS = (
+    ("timestamp", np.int64),  # Время исполнения, мс UTC
+    ("symbol", np.int32),  # Код символа в словаре сегмента
+    ("action", np.int8),  # Индекс в JOURNAL_ACTIONS
+    ("side", np.int8),  # Индекс в JOURNAL_SIDES
+    ("status", np.int8),  # Индекс в JOURNAL_STATUSES
+    ("price", np.float64),
+    ("qty", np.float64),
+    ("pnl", np.float64),
+    ("fee", np.float64),
+    ("latency_ms", np.float64),  # Задержка исполнения ордера (NaN, если неизвестна)
+)
+JOURNAL_ACTIONS = ("open", "close")
+JOURNAL_SIDES = ("Buy", "Sell")
+JOURNAL_STATUSES = ("filled", "rejected", "cancelled", "unknown")  # Новые статусы — только в конец (индексы в сегментах)
+
+def empty_symbol_stats():
+    return {"opens": 0, "closes": 0, "wins": 0, "losses": 0, "rejected": 0,
+            "pnl": 0.0, "volume": 0.0, "fees": 0.0, "last_timestamp": None}
+
+def add_to_stats(stats, action, status, price, qty, pnl, fee, timestamp):
+    """Учёт одной записи в статистике символа."""
+    stats["last_timestamp"] = timestamp
+    if status != "filled":
+        stats["rejected"] += 1
+        return
+    stats["volume"] += price * qty
+    stats["fees"] += fee
+    if action == "open":
+        stats["opens"] += 1
+    else:
+        stats["closes"] += 1
+        stats["pnl"] += pnl
+        if pnl > 0:
+            stats["wins"] += 1
+        elif pnl < 0:
+            stats["losses"] += 1
+
+def merge_stats(total, stats):
+    for key, value in stats.items():
+        if key == "last_timestamp":
+            if value is not None and (total[key] is None or value > total[key]):
+                total[key] = value
+        else:
+            total[key] += value
+
+def utc_day(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime("%Y%m%d")
+
+class JournalSegment:
+    """Один сегмент журнала: колонки в отдельных файлах и meta.json."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta = self._load_meta()
+        self.symbol_codes = {symbol: code for code, symbol in enumerate(self.meta["symbols"])}
+        self._truncate_to_meta()
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _load_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json"), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"count": 0, "first_timestamp": None, "last_timestamp": None, "symbols": [], "stats": {}}
+
+    def _save_meta(self):
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def _truncate_to_meta(self):
+        """Отбрасываем хвост колонок, дописанный до сбоя, но не зафиксированный в meta.json."""
+        for name, dtype in JOURNAL_COLUMNS:
+            size = self.meta["count"] * np.dtype(dtype).itemsize
+            column_path = self._column_path(name)
+            if os.path.exists(column_path) and os.path.getsize(column_path) > size:
+                with open(column_path, "r+b") as f:
+                    f.truncate(size)
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def append(self, records):
+        """Дозапись пачки записей (словари из TradeJournal.record) одной записью на колонку."""
+        for record in records:
+            if record["symbol"] not in self.symbol_codes:
+                self.symbol_codes[record["symbol"]] = len(self.meta["symbols"])
+                self.meta["symbols"].append(record["symbol"])
+        columns = {
+            "timestamp": [r["timestamp"] for r in records],
+            "symbol": [self.symbol_codes[r["symbol"]] for r in records],
+            "action": [JOURNAL_ACTIONS.index(r["action"]) for r in records],
+            "side": [JOURNAL_SIDES.index(r["side"]) for r in records],
+            "status": [JOURNAL_STATUSES.index(r["status"]) for r in records],
+        }
+        for name, dtype in JOURNAL_COLUMNS:
+            values = columns[name] if name in columns else [r[name] for r in records]
+            with open(self._column_path(name), "ab") as f:
+                f.write(np.asarray(values, dtype=dtype).tobytes())
+        for r in records:
+            stats = self.meta["stats"].setdefault(r["symbol"], empty_symbol_stats())
+            add_to_stats(stats, r["action"], r["status"], r["price"], r["qty"], r["pnl"], r["fee"], r["timestamp"])
+        if self.meta["first_timestamp"] is None:
+            self.meta["first_timestamp"] = records[0]["timestamp"]
+        self.meta["last_timestamp"] = records[-1]["timestamp"]
+        self.meta["count"] += len(records)
+        self._save_meta()
+
+    def read(self, start=None, end=None):
+        """Колонки записей с timestamp в [start, end) как memmap (без копирования)."""
+        count = self.meta["count"]
+        if count == 0:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in JOURNAL_COLUMNS}
+        timestamps = np.memmap(self._column_path("timestamp"), dtype=np.int64, mode='r', shape=(count,))
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+        last = count if end is None else int(np.searchsorted(timestamps, end, side='left'))
+        if first >= last:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in JOURNAL_COLUMNS}
+        return {
+            name: np.memmap(self._column_path(name), dtype=dtype, mode='r',
+                            offset=first * np.dtype(dtype).itemsize, shape=(last - first,))
+            for name, dtype in JOURNAL_COLUMNS
+        }
+
+class TradeJournal:
+    """Буферизованный журнал сделок с ротацией сегментов и статистикой по символам."""
+
+    def __init__(self, root=TRADES_JOURNAL_DIR, flush_interval=JOURNAL_FLUSH_INTERVAL,
+                 flush_batch=JOURNAL_FLUSH_BATCH, segment_max_rows=JOURNAL_SEGMENT_MAX_ROWS):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.segment_max_rows = segment_max_rows
+        os.makedirs(root, exist_ok=True)
+        self.segments = [JournalSegment(os.path.join(root, name)) for name in sorted(os.listdir(root))
+                         if os.path.isdir(os.path.join(root, name))]
+        self._stats = {}  # symbol -> статистика по всем сегментам и буферу
+        for segment in self.segments:
+            for symbol, stats in segment.meta["stats"].items():
+                merge_stats(self._stats.setdefault(symbol, empty_symbol_stats()), stats)
+        self._last_timestamp = max((s.meta["last_timestamp"] or 0 for s in self.segments), default=0)
+        self._buffer = []
+        self._lock = threading.Lock()  # Буфер и статистика в памяти
+        self._write_lock = threading.Lock()  # Запись на диск и список сегментов
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(segment) for segment in self.segments) + len(self._buffer)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trade-journal", daemon=True)
+            self._thread.start()
+
+    def record(self, symbol, action, side, price, qty, status="filled", pnl=0.0, fee=0.0,
+               latency_ms=None, timestamp=None):
+        """Добавление записи в буфер (без обращения к диску)."""
+        with self._lock:
+            if timestamp is None:
+                timestamp = int(time.time() * 1000)
+            # Колонка времени в сегменте должна быть неубывающей (бинарный поиск)
+            timestamp = max(int(timestamp), self._last_timestamp)
+            self._last_timestamp = timestamp
+            record = {
+                "timestamp": timestamp, "symbol": symbol, "action": action, "side": side, "status": status,
+                "price": float(price), "qty": float(qty), "pnl": float(pnl), "fee": float(fee),
+                "latency_ms": float("nan") if latency_ms is None else float(latency_ms),
+            }
+            self._buffer.append(record)
+            add_to_stats(self._stats.setdefault(symbol, empty_symbol_stats()),
+                         action, status, record["price"], record["qty"], record["pnl"], record["fee"], timestamp)
+            pending = len(self._buffer)
+        if pending >= self.flush_batch:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка записи журнала сделок: {e}")
+
+    def _segment_for(self, timestamp):
+        """Текущий сегмент или новый, если сменились сутки или сегмент заполнен."""
+        day = utc_day(timestamp)
+        if self.segments:
+            segment = self.segments[-1]
+            if segment.name.startswith(day) and len(segment) < self.segment_max_rows:
+                return segment
+            number = int(segment.name.split("_")[1]) + 1 if segment.name.startswith(day) else 0
+        else:
+            number = 0
+        segment = JournalSegment(os.path.join(self.root, f"{day}_{number:03d}"))
+        self.segments.append(segment)
+        logging.info(f"Журнал сделок: новый сегмент {segment.name}")
+        return segment
+
+    def flush(self):
+        """Запись буфера на диск; возвращает число записанных записей."""
+        with self._write_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            written = 0
+            while written < len(records):
+                segment = self._segment_for(records[written]["timestamp"])
+                day = segment.name.split("_")[0]
+                batch = []
+                for record in records[written:written + self.segment_max_rows - len(segment)]:
+                    if utc_day(record["timestamp"]) != day:
+                        break
+                    batch.append(record)
+                with self._lock:
+                    segment.append(batch)
+                written += len(batch)
+            return written
+
+    def close(self):
+        """Остановка фонового потока и запись оставшихся записей."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def symbol_stats(self, symbol=None):
+        """Статистика символа (None — по всем символам) с учётом ещё не записанного буфера."""
+        with self._lock:
+            if symbol is not None:
+                return dict(self._stats.get(symbol) or empty_symbol_stats())
+            total = empty_symbol_stats()
+            for stats in self._stats.values():
+                merge_stats(total, stats)
+            return total
+
+    def symbols(self):
+        with self._lock:
+            return sorted(self._stats)
+
+    def query(self, symbol=None, start=None, end=None):
+        """
+        Записанные на диск записи за [start, end) (мс UTC), при symbol — только по этому символу.
+        Returns:
+            dict колонок numpy; symbol — массив строк
+        """
+        self.flush()
+        parts = []
+        with self._lock:
+            segments = list(self.segments)
+        for segment in segments:
+            meta = segment.meta
+            if meta["count"] == 0:
+                continue
+            if start is not None and meta["last_timestamp"] < start:
+                continue
+            if end is not None and meta["first_timestamp"] >= end:
+                continue
+            if symbol is not None and symbol not in meta["stats"]:
+                continue
+            columns = segment.read(start, end)
+            symbols = np.asarray(meta["symbols"], dtype=object)
+            if symbol is not None:
+                mask = columns["symbol"] == segment.symbol_codes[symbol]
+                columns = {name: values[mask] for name, values in columns.items()}
+            columns = {name: np.array(values) for name, values in columns.items()}
+            columns["symbol"] = symbols[columns["symbol"]] if len(symbols) else columns["symbol"].astype(object)
+            parts.append(columns)
+        if not parts:
+            result = {name: np.empty(0, dtype=dtype) for name, dtype in JOURNAL_COLUMNS}
+            result["symbol"] = np.empty(0, dtype=object)
+            return result
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def pnl_history(self, symbol=None, start=None, end=None):
+        """(timestamps, накопленный PnL) по закрытиям позиций за период."""
+        trades = self.query(symbol, start, end)
+        mask = (trades["action"] == JOURNAL_ACTIONS.index("close")) & (trades["status"] == JOURNAL_STATUSES.index("filled"))
+        return trades["timestamp"][mask], np.cumsum(trades["pnl"][mask])
+
+    def import_jsonl(self, path):
+        """Однократный перенос старого trades_log.json (JSON на строку) в журнал."""
+        imported = 0
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    trade = json.loads(line)
+                    timestamp = datetime.fromisoformat(trade["timestamp"]).timestamp() * 1000
+                    status = "filled" if trade.get("status", "executed") == "executed" else "rejected"
+                    self.record(trade["symbol"], trade["action"], trade["side"], trade["price"], trade["qty"],
+                                status=status, pnl=trade.get("pnl", 0.0), timestamp=timestamp)
+                    imported += 1
+                except Exception as e:
+                    logging.error(f"Пропущена строка старого журнала сделок: {e}")
+        self.flush()
+        logging.info(f"Журнал сделок: импортировано {imported} записей из {path}")
+        return imported
+
+def main():
+    """Проверка записи, ротации и запросов на временном каталоге."""
+    import tempfile
+    root = tempfile.mkdtemp()
+    journal = TradeJournal(root, segment_max_rows=50_000)
+    start_time = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    rng = np.random.default_rng(1)
+    symbols = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT"]
+    count = 200_000
+    started = time.perf_counter()
+    for i in range(count):
+        symbol = symbols[i % len(symbols)]
+        action = "open" if i % 2 == 0 else "close"
+        journal.record(symbol, action, "Buy", 100.0, 1.0, pnl=float(rng.normal()) if action == "close" else 0.0,
+                       timestamp=start_time + i * 1000)
+        if i % 10_000 == 0:
+            journal.flush()
+    journal.flush()
+    print(f"Запись {count} сделок: {time.perf_counter() - started:.2f} с, сегментов {len(journal.segments)}")
+
+    started = time.perf_counter()
+    stats = journal.symbol_stats("ETHUSDT")
+    print(f"Статистика ETHUSDT: {time.perf_counter() - started:.6f} с, {stats}")
+
+    reopened = TradeJournal(root)
+    assert len(reopened) == count
+    reopened_stats = reopened.symbol_stats("ETHUSDT")
+    assert reopened_stats["closes"] == stats["closes"] and abs(reopened_stats["pnl"] - stats["pnl"]) < 1e-6
+    started = time.perf_counter()
+    day2 = start_time + 86_400_000
+    timestamps, cumulative = reopened.pnl_history("SOLUSDT", day2, day2 + 3600_000)
+    print(f"PnL SOLUSDT за час: {time.perf_counter() - started:.4f} с, записей {len(timestamps)}")
+    assert len(timestamps) == 0  # SOLUSDT — только открытия (чётные индексы)
+    timestamps, cumulative = reopened.pnl_history("ETHUSDT", day2, day2 + 3600_000)
+    assert len(timestamps) == 900 and np.all(np.diff(timestamps) > 0)
+    all_closes = reopened.pnl_history()[1]
+    assert abs(all_closes[-1] - reopened.symbol_stats()["pnl"]) < 1e-6
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import time
+import bisect
+import logging
+import threading
+
+# Рейтинг волатильности по всем линейным контрактам.
+# Волатильность символа — диапазон за скользящие 24 часа ((High24h - Low24h) / Low24h * 100)
+# из тикеров Bybit: один REST-запрос get_tickers для начальной загрузки, далее
+# обновления из ticker WebSocket. Рейтинг хранится отсортированным, поэтому
+# обновление символа стоит O(log n) на поиск, а топ-K читается без пересчёта.
+
+TICKER_SUBSCRIBE_CHUNK = 100  # Символов в одном запросе подписки WebSocket
+RANKER_RESEED_INTERVAL = 3600  # Повторная загрузка тикеров (новые листинги) раз в час
+
+def ticker_volatility(ticker):
+    """Волатильность за 24 часа по полям тикера Bybit; None, если данных нет."""
+    try:
+        high = float(ticker['highPrice24h'])
+        low = float(ticker['lowPrice24h'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if low <= 0 or high < low:
+        return None
+    return (high - low) / low * 100
+
+class VolatilityRanker:
+    """Отсортированный рейтинг волатильности с инкрементальным обновлением."""
+
+    def __init__(self, min_turnover=0.0):
+        self.min_turnover = min_turnover  # Минимальный оборот за 24 часа (USDT) для попадания в рейтинг
+        self._values = {}  # symbol -> волатильность
+        self._ranking = []  # [(-волатильность, symbol)] по возрастанию, т.е. по убыванию волатильности
+        self._lock = threading.Lock()
+        self.last_seed = 0.0
+        self.last_update = 0.0
+        self.symbols = set()  # Все известные символы USDT-контрактов
+        self._subscribed = set()
+        self.ws = None
+
+    def __len__(self):
+        return len(self._ranking)
+
+    def update(self, symbol, volatility):
+        """Новое значение волатильности символа; None или 0 убирают символ из рейтинга."""
+        with self._lock:
+            old = self._values.pop(symbol, None)
+            if old is not None:
+                index = bisect.bisect_left(self._ranking, (-old, symbol))
+                del self._ranking[index]
+            if volatility:
+                self._values[symbol] = volatility
+                bisect.insort(self._ranking, (-volatility, symbol))
+            self.last_update = time.time()
+
+    def update_ticker(self, ticker):
+        symbol = ticker['symbol']
+        turnover = ticker.get('turnover24h')
+        if turnover is not None and self.min_turnover and float(turnover) < self.min_turnover:
+            self.update(symbol, None)
+            return
+        self.update(symbol, ticker_volatility(ticker))
+
+    def load_tickers(self, tickers):
+        """Начальная загрузка из ответа get_tickers(category="linear")['result']['list']."""
+        for ticker in tickers:
+            if ticker.get('symbol', '').endswith('USDT'):
+                self.update_ticker(ticker)
+                self.symbols.add(ticker['symbol'])
+        self.last_seed = time.time()
+        logging.info(f"Рейтинг волатильности: загружено {len(self)} символов")
+
+    def handle_ticker(self, message):
+        """Callback ticker WebSocket (pybit передаёт полный снимок тикера после слияния дельт)."""
+        try:
+            self.update_ticker(message['data'])
+        except Exception as e:
+            logging.error(f"Ошибка обновления рейтинга волатильности: {e}")
+
+    def subscribe(self, ws_instance, symbols):
+        """Подписка WebSocket на тикеры символов, ещё не отслеживаемых рейтингом."""
+        self.ws = ws_instance
+        new_symbols = [symbol for symbol in sorted(symbols) if symbol not in self._subscribed]
+        for i in range(0, len(new_symbols), TICKER_SUBSCRIBE_CHUNK):
+            chunk = new_symbols[i:i + TICKER_SUBSCRIBE_CHUNK]
+            try:
+                ws_instance.ticker_stream(symbol=chunk, callback=self.handle_ticker)
+                self._subscribed.update(chunk)
+            except Exception as e:
+                logging.error(f"Ошибка подписки рейтинга волатильности на тикеры: {e}")
+        if new_symbols:
+            logging.info(f"Рейтинг волатильности: подписка на {len(new_symbols)} тикеров")
+
+    def needs_reseed(self):
+        return time.time() - self.last_seed >= RANKER_RESEED_INTERVAL
+
+    def top(self, k=5):
+        """Топ-K символов по волатильности: [(symbol, volatility), ...]."""
+        with self._lock:
+            return [(symbol, -negative) for negative, symbol in self._ranking[:k]]